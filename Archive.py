@@ -0,0 +1,322 @@
+import argparse
+import os
+import posixpath
+import struct
+import sys
+from dataclasses import dataclass
+from FileIO import FileIO
+from LZ77 import LZ77, find_inputs
+
+
+def main():
+    """
+    Main; handles argument parsing if called from the command line.
+    -c or --create [archive] [inputs] Packs the input files (or glob patterns) into the archive
+    -x or --extract [archive] [directory (optional)] Extracts every member, into the current directory by default
+    -l or --list [archive] Lists the members with their sizes
+    -r or --recursive Takes in every file below directories given to --create
+    -cb or --control-bytes [int] Sets the number of control bytes to use for compression
+    """
+    parser = argparse.ArgumentParser(description="LZ77 Archive Tool")
+    parser.add_argument("-c", "--create", metavar="archive", nargs="+",
+                        help="Create the archive from the input files that follow it.")
+    parser.add_argument("-x", "--extract", metavar="archive", nargs="+",
+                        help="Extract the archive. Optionally specify the output directory.")
+    parser.add_argument("-l", "--list", metavar="archive", help="List the members of the archive.")
+    parser.add_argument("-r", "--recursive", action="store_true",
+                        help="Take in every file below directories given to --create.")
+    parser.add_argument("-cb", "--control-bytes", type=int, default=3,
+                        help="Specify the control byte length for compression. Default is 3.")
+    args = parser.parse_args()
+
+    try:
+        if args.create:
+            files, missing = find_inputs(args.create[1:], args.recursive)
+            if missing:
+                for name, message in missing:
+                    print(f"{name}: {message}")
+                return 1
+            with ArchiveWriter(args.create[0], control_bytes=args.control_bytes) as archive:
+                for path in files:
+                    archive.add_file(path)
+            print(f"Archive created. {len(files)} files saved to {args.create[0]}.")
+        elif args.extract:
+            directory = args.extract[1] if len(args.extract) > 1 else "."
+            with ArchiveReader(args.extract[0]) as archive:
+                archive.extract_all(directory)
+                print(f"Extraction successful. {len(archive.entries)} files saved to {directory}.")
+        elif args.list:
+            with ArchiveReader(args.list) as archive:
+                for entry in archive.entries.values():
+                    print(f"{entry.size:>12} {entry.length:>12}  {entry.name}")
+        else:
+            parser.print_help()
+        return 0
+    except Exception as e:
+        print(f"Error: {e}")
+        return 1
+
+
+@dataclass
+class ArchiveEntry:
+    """
+       Central directory record of one archive member.
+
+       Attributes:
+           name (str): Member name, a relative path with / separators.
+           extension (str): Full extension of the member's name, not limited to LZ77.EXTENSION_MAP.
+           size (int): Original size of the member in bytes.
+           offset (int): Where the member's token stream starts in the archive.
+           length (int): Length of the member's token stream in bytes.
+           control_byte_length (int): Control byte length the member was compressed with.
+       """
+    name: str
+    extension: str
+    size: int
+    offset: int
+    length: int
+    control_byte_length: int
+
+
+class Archive(object):
+    """
+    Layout shared by ArchiveWriter and ArchiveReader.
+
+    An archive starts with a header (magic and version), followed by the members' token streams back to back. Each is a
+    2-byte header stream's tokens without the header; the control byte length lives in the central directory instead.
+    The central directory follows the last member, one entry per member: offset, length, original size, control byte
+    length, then the name and extension (length prefixed, UTF-8). A footer at the very end gives the directory's offset,
+    so a reader finds any member after reading the footer and directory, without decoding the other members.
+    """
+    MAGIC = b"Z77A" #not 0xC7, so archives aren't mistaken for .Z77 streams
+    VERSION = 1
+    HEADER = struct.Struct(">4sB") #magic, version
+    ENTRY = struct.Struct(">QQQBH") #offset, length, original size, control byte length, name length
+    EXTENSION_LENGTH = struct.Struct(">B")
+    FOOTER = struct.Struct(">QI4s") #central directory offset, entry count, magic
+    DIRECTORY_MAGIC = b"Z77D"
+
+    @staticmethod
+    def member_name(path):
+        """
+        Turns a file path into a member name: relative, with / separators and no . or .. parts.
+        :param path: file path
+        :return: member name
+        """
+        parts = os.path.normpath(os.path.splitdrive(path)[1]).replace(os.sep, "/").split("/")
+        name = "/".join(part for part in parts if part not in ("", ".", ".."))
+        if not name:
+            raise ValueError(f"Can't name an archive member after {path}.")
+        return name
+
+
+class ArchiveWriter(Archive):
+    """
+    Writes an archive, compressing each member as it is added so only one member is held in memory at a time.
+    """
+    def __init__(self, filename, control_bytes=3, chain_depth=64, match_finder="hash", level=0):
+        """
+        Creates the archive file and writes its header.
+        :param filename: filepath/name of the archive to write
+        :param control_bytes: (optional) default number of control bytes for the members, default is 3
+        :param chain_depth: (optional) hash chain links followed per position
+        :param match_finder: (optional) "hash" or "max"
+        :param level: (optional) parsing level, 0 greedy, 1 lazy, 2 optimal
+        """
+        LZ77(b"", control_bytes, chain_depth=chain_depth, match_finder=match_finder, level=level) #validates the options
+        self.options = dict(control_bytes=control_bytes, chain_depth=chain_depth, match_finder=match_finder, level=level)
+        try:
+            self.file = open(filename, "wb")
+        except Exception as e:
+            print(f"Failed to write to {filename}: {e}")
+            raise RuntimeError(f"Failed to write to {filename}: {e}")
+        self.file.write(self.HEADER.pack(self.MAGIC, self.VERSION))
+        self.offset = self.HEADER.size
+        self.entries = {} #name -> ArchiveEntry, in the order added
+        self.closed = False
+
+    def add(self, name, data, control_bytes=None):
+        """
+        Compresses data and appends it to the archive as a member.
+        :param name: member name, a relative path with / separators
+        :param data: member data (bytes-like)
+        :param control_bytes: (optional) control bytes for this member, defaults to the archive's
+        :return: the member's ArchiveEntry
+        """
+        if self.closed:
+            raise ValueError("Archive is closed.")
+        if name in self.entries:
+            raise ValueError(f"Archive already has a member named {name}.")
+        if name != self.member_name(name):
+            raise ValueError(f"Invalid member name {name}.")
+        options = dict(self.options)
+        if control_bytes is not None:
+            options["control_bytes"] = control_bytes
+        payload = LZ77._compress_block(data, b"", options)
+
+        entry = ArchiveEntry(name, posixpath.splitext(name)[1], len(data), self.offset, len(payload),
+                             options["control_bytes"])
+        self.file.write(payload)
+        self.offset += len(payload)
+        self.entries[name] = entry
+        return entry
+
+    def add_file(self, path, name=None, control_bytes=None):
+        """
+        Adds a file to the archive, memory mapped rather than read in.
+        :param path: file to add
+        :param name: (optional) member name, derived from path by default
+        :param control_bytes: (optional) control bytes for this member, defaults to the archive's
+        :return: the member's ArchiveEntry
+        """
+        with FileIO.open_mapped(path) as data:
+            return self.add(self.member_name(path) if name is None else name, data, control_bytes)
+
+    def close(self):
+        """
+        Writes the central directory and footer, and closes the archive file.
+        :return: None
+        """
+        if self.closed:
+            return
+        directory = bytearray()
+        for entry in self.entries.values():
+            name = entry.name.encode("utf-8")
+            extension = entry.extension.encode("utf-8")
+            directory.extend(self.ENTRY.pack(entry.offset, entry.length, entry.size, entry.control_byte_length,
+                                             len(name)))
+            directory.extend(name)
+            directory.extend(self.EXTENSION_LENGTH.pack(len(extension)))
+            directory.extend(extension)
+        directory.extend(self.FOOTER.pack(self.offset, len(self.entries), self.DIRECTORY_MAGIC))
+        self.file.write(directory)
+        self.file.close()
+        self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class ArchiveReader(Archive):
+    """
+    Reads an archive. The central directory is read when it is opened, and members are decoded one at a time on request.
+    """
+    def __init__(self, source):
+        """
+        Opens an archive and reads its central directory.
+        :param source: filepath/name of the archive (memory mapped), or the archive itself as bytes-like
+        """
+        self.mapping = None
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            self.data = source
+        else:
+            self.mapping = FileIO.open_mapped(source)
+            self.data = self.mapping.__enter__()
+        try:
+            self.entries = self.__read_directory() #name -> ArchiveEntry, in archive order
+        except Exception:
+            self.close()
+            raise
+
+    def __read_directory(self):
+        """
+        Checks the header and footer, and reads the central directory.
+        :return: dict of member name to ArchiveEntry
+        """
+        data = self.data
+        if len(data) < self.HEADER.size + self.FOOTER.size or self.HEADER.unpack_from(data, 0) != (self.MAGIC,
+                                                                                                   self.VERSION):
+            raise ValueError("Not an LZ77 archive.")
+        footer_offset = len(data) - self.FOOTER.size
+        offset, count, magic = self.FOOTER.unpack_from(data, footer_offset)
+        if magic != self.DIRECTORY_MAGIC or not self.HEADER.size <= offset <= footer_offset:
+            raise ValueError("Invalid central directory in archive.")
+
+        entries = {}
+        for _ in range(count):
+            if offset + self.ENTRY.size > footer_offset:
+                raise ValueError("Invalid central directory in archive.")
+            member_offset, length, size, control_byte_length, name_length = self.ENTRY.unpack_from(data, offset)
+            offset += self.ENTRY.size
+            name = bytes(data[offset:offset + name_length]).decode("utf-8")
+            offset += name_length
+            extension_length = data[offset] if offset < footer_offset else 0
+            extension = bytes(data[offset + 1:offset + 1 + extension_length]).decode("utf-8")
+            offset += 1 + extension_length
+            if offset > footer_offset or member_offset + length > footer_offset:
+                raise ValueError("Invalid central directory in archive.")
+            entries[name] = ArchiveEntry(name, extension, size, member_offset, length, control_byte_length)
+        if offset != footer_offset:
+            raise ValueError("Invalid central directory in archive.")
+        return entries
+
+    def names(self):
+        """
+        :return: list of member names, in archive order
+        """
+        return list(self.entries)
+
+    def info(self, name):
+        """
+        :param name: member name
+        :return: the member's ArchiveEntry
+        """
+        if name not in self.entries:
+            raise KeyError(f"Archive has no member named {name}.")
+        return self.entries[name]
+
+    def read(self, name):
+        """
+        Decodes one member, without touching the others.
+        :param name: member name
+        :return: the member's data as bytes
+        """
+        entry = self.info(name)
+        with memoryview(self.data) as view, view[entry.offset:entry.offset + entry.length] as payload:
+            return LZ77._decode_block(entry.control_byte_length, entry.size, payload)
+
+    def extract(self, name, directory="."):
+        """
+        Decodes one member into a file under directory, creating the folders in its name.
+        :param name: member name
+        :param directory: (optional) directory to extract into, default is the current directory
+        :return: path of the extracted file
+        """
+        parts = name.split("/")
+        if name != self.member_name(name) or ".." in parts:
+            raise ValueError(f"Unsafe member name {name}.")
+        path = os.path.join(directory, *parts)
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        FileIO.write(self.read(name), path)
+        return path
+
+    def extract_all(self, directory="."):
+        """
+        Decodes every member into files under directory.
+        :param directory: (optional) directory to extract into, default is the current directory
+        :return: list of paths of the extracted files
+        """
+        return [self.extract(name, directory) for name in self.entries]
+
+    def close(self):
+        """
+        Releases the archive's memory mapping.
+        :return: None
+        """
+        if self.mapping is not None:
+            self.data = b""
+            self.mapping.__exit__(None, None, None)
+            self.mapping = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
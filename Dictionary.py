@@ -0,0 +1,163 @@
+import argparse
+import heapq
+import sys
+import zlib
+import numpy as np
+from FileIO import FileIO
+
+
+def main():
+    """
+    Main; handles argument parsing if called from the command line.
+    [samples] Sample files (or glob patterns) to train on, -r takes in directories
+    -o or --output [file] Where the dictionary is saved
+    -s or --size [int] Maximum dictionary size in bytes
+    """
+    from LZ77 import find_inputs
+    parser = argparse.ArgumentParser(description="LZ77 Dictionary Trainer")
+    parser.add_argument("samples", nargs="+", help="Sample files or glob patterns to train the dictionary on.")
+    parser.add_argument("-o", "--output", required=True, help="File the dictionary is saved to.")
+    parser.add_argument("-s", "--size", type=int, default=Dictionary.DEFAULT_SIZE,
+                        help=f"Maximum dictionary size in bytes. Default is {Dictionary.DEFAULT_SIZE}.")
+    parser.add_argument("-r", "--recursive", action="store_true", help="Take in every file below directories.")
+    args = parser.parse_args()
+
+    try:
+        files, missing = find_inputs(args.samples, args.recursive)
+        for name, message in missing:
+            print(f"{name}: {message}")
+        dictionary = Dictionary.train([FileIO.read(f) for f in files], size=args.size)
+        dictionary.save(args.output)
+        print(f"Dictionary {dictionary.id:08x} ({len(dictionary)} bytes, from {len(files)} samples) saved to {args.output}.")
+        return 1 if missing else 0
+    except Exception as e:
+        print(f"Error during training: {e}")
+        return 1
+
+
+def kmer_keys(data, k):
+    """
+    Keys every position (that has k bytes left) on its next k bytes.
+    :param data: np.uint8 array
+    :param k: bytes per key, 1 to 8
+    :return: np.array of np.uint64 keys, one per position
+    """
+    count = data.size - k + 1
+    if count <= 0:
+        return np.zeros(0, dtype=np.uint64)
+    key = np.zeros(count, dtype=np.uint64)
+    for j in range(k):
+        key = (key << np.uint64(8)) | data[j:j + count].astype(np.uint64)
+    return key
+
+
+class Dictionary(object):
+    """
+    A preset dictionary: data the sliding window is primed with, so even the first bytes of an input can be matched.
+
+    Any bytes can serve as a dictionary. It is identified by the CRC-32 of its data, which compressed streams record so
+    decompression can check it was given the same dictionary. Only the last window_size bytes are within reach of
+    matches, so the most useful content belongs at the end.
+    """
+    DEFAULT_SIZE = 1 << 14 #well within the 64 KiB window of 3 control bytes
+    KMER_LENGTH = 8 #bytes per k-mer the trainer counts
+    SEGMENT_LENGTH = 64 #bytes per segment the trainer picks
+
+    def __init__(self, data):
+        """
+        :param data: dictionary content (bytes-like)
+        """
+        self.data = bytes(data)
+        self.id = zlib.crc32(self.data)
+
+    def __len__(self):
+        return len(self.data)
+
+    @staticmethod
+    def of(dictionary):
+        """
+        :param dictionary: a Dictionary, its content as bytes-like, or None
+        :return: the Dictionary, or None
+        """
+        if dictionary is None or isinstance(dictionary, Dictionary):
+            return dictionary
+        return Dictionary(dictionary)
+
+    @staticmethod
+    def load(filename):
+        """
+        Reads a dictionary saved by save (or any file, used as is).
+        :param filename: filename to read from
+        :return: Dictionary
+        """
+        return Dictionary(FileIO.read(filename))
+
+    def save(self, filename):
+        """
+        Writes the dictionary's content to a file.
+        :param filename: filepath/name to write to
+        :return: None
+        """
+        FileIO.write(self.data, filename)
+
+    @staticmethod
+    def train(samples, size=DEFAULT_SIZE, segment_length=SEGMENT_LENGTH):
+        """
+        Builds a dictionary from samples of the data it will be used on.
+        Every KMER_LENGTH-byte substring is scored by how many samples contain it, and segments of the samples are picked
+        greedily by the total score of the substrings they hold that no picked segment holds yet. So the dictionary
+        collects the content most samples share, without repeating it. The best segments are placed last, closest to
+        the data, where they are in reach even of the small windows of few control bytes.
+        :param samples: iterable of sample data (bytes-like)
+        :param size: (optional) maximum dictionary size in bytes, default is DEFAULT_SIZE
+        :param segment_length: (optional) bytes per segment, default is SEGMENT_LENGTH
+        :return: Dictionary
+        """
+        if size < 1 or segment_length < Dictionary.KMER_LENGTH:
+            raise ValueError(f"size must be at least 1 and segment_length at least {Dictionary.KMER_LENGTH}.")
+        k = Dictionary.KMER_LENGTH
+        samples = [np.frombuffer(bytes(sample), dtype=np.uint8) for sample in samples]
+        keys = [kmer_keys(sample, k) for sample in samples]
+        if not any(key.size for key in keys):
+            raise ValueError(f"No samples of at least {k} bytes to train on.")
+
+        # Number of samples containing each k-mer, k-mers found in a single sample aren't shared content
+        unique_keys, counts = np.unique(np.concatenate([np.unique(key) for key in keys]), return_counts=True)
+        weights = np.where(counts > 1, counts, 0).astype(np.int64)
+        available = np.ones(unique_keys.size, dtype=bool) #k-mers no picked segment holds yet
+        indices = [np.searchsorted(unique_keys, key) for key in keys]
+
+        # Candidate segments start every half segment, their first scores may count a k-mer twice so they are upper
+        # bounds, which is all the lazy greedy search below needs
+        kmers_per_segment = segment_length - k + 1
+        heap = []
+        for s, index in enumerate(indices):
+            if index.size == 0:
+                continue
+            totals = np.concatenate(([0], np.cumsum(weights[index])))
+            starts = np.arange(0, index.size, segment_length // 2)
+            scores = totals[np.minimum(starts + kmers_per_segment, index.size)] - totals[starts]
+            heap.extend((-int(score), s, int(start)) for score, start in zip(scores, starts) if score > 0)
+        heapq.heapify(heap)
+
+        segments = []
+        length = 0
+        while heap and length < size:
+            _, s, start = heapq.heappop(heap)
+            segment = np.unique(indices[s][start:start + kmers_per_segment])
+            score = int(weights[segment][available[segment]].sum())
+            if score <= 0:
+                continue
+            if heap and score < -heap[0][0]:
+                heapq.heappush(heap, (-score, s, start)) #others may beat it now, score it again later
+                continue
+            available[segment] = False
+            segments.append(samples[s][start:start + segment_length].tobytes())
+            length += len(segments[-1])
+        if not segments:
+            raise ValueError("Samples share no content to build a dictionary from.")
+        return Dictionary(b"".join(reversed(segments))[-size:])
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,4 +1,8 @@
+import contextlib
 import logging
+import mmap
+import os
+import sys
 
 class FileIO:
     def __init__(self, filename=None, debug=False):
@@ -44,3 +48,96 @@ class FileIO:
         except Exception as e:
             print(f"Failed to write to {filename}: {e}")
             raise RuntimeError(f"Failed to write to {filename}: {e}")
+
+    @staticmethod
+    def read_chunks(filename, chunk_size=1 << 20):
+        """
+        Reads a file in chunks, so large files don't have to fit in memory. "-" reads from stdin.
+        :param filename: filename to read from
+        :param chunk_size: (optional) bytes per chunk, default is 1 MiB
+        :return: generator of byte arrays
+        """
+        try:
+            f = sys.stdin.buffer if filename == "-" else open(filename, 'rb')
+        except Exception as e:
+            print(f"Failed to read from {filename}: {e}")
+            raise RuntimeError(f"Failed to read from {filename}: {e}")
+        try:
+            for chunk in iter(lambda: f.read(chunk_size), b""):
+                yield chunk
+        finally:
+            if f is not sys.stdin.buffer:
+                f.close()
+
+    @staticmethod
+    @contextlib.contextmanager
+    def open_mapped(filename):
+        """
+        Maps a file into memory read only, instead of reading it. The kernel pages the data in as it is accessed, so
+        large files aren't copied into memory up front. Buffers taken from the mapping must be released before the
+        context exits.
+        :param filename: filename to map
+        :return: context manager giving the mapping (bytes-like), empty bytes for an empty file
+        """
+        try:
+            with open(filename, 'rb') as f:
+                # Empty files can't be mapped
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(f.fileno()).st_size else None
+        except Exception as e:
+            print(f"Failed to read from {filename}: {e}")
+            raise RuntimeError(f"Failed to read from {filename}: {e}")
+        try:
+            yield b"" if mapped is None else mapped
+        finally:
+            FileIO.__close_mapping(mapped)
+
+    @staticmethod
+    @contextlib.contextmanager
+    def create_mapped(filename, size):
+        """
+        Creates (or truncates) a file of size bytes and maps it writable, so output can be written straight into the
+        file's pages instead of building it in memory first.
+        :param filename: filepath/name to write to
+        :param size: size of the file in bytes
+        :return: context manager giving the writable mapping, an empty bytearray when size is 0
+        """
+        try:
+            f = open(filename, 'w+b')
+            f.truncate(size)
+            mapped = mmap.mmap(f.fileno(), size, access=mmap.ACCESS_WRITE) if size else None
+        except Exception as e:
+            print(f"Failed to write to {filename}: {e}")
+            raise RuntimeError(f"Failed to write to {filename}: {e}")
+        try:
+            yield bytearray() if mapped is None else mapped
+            if mapped is not None:
+                mapped.flush()
+        finally:
+            FileIO.__close_mapping(mapped)
+            f.close()
+
+    @staticmethod
+    def write_mapped(data, filename):
+        """
+        Writes the contents of a byte array to a file through a memory mapping of the preallocated file.
+        :param data: data to write to filename
+        :param filename: filepath/name to write to
+        :return: None
+        """
+        with FileIO.create_mapped(filename, len(data)) as out:
+            out[:] = data
+
+    @staticmethod
+    def __close_mapping(mapped):
+        """
+        Closes a mapping. One still exported (e.g. held by the traceback of an error raised while it was in use) is left
+        for the garbage collector to unmap, so the original error isn't hidden.
+        :param mapped: mmap or None
+        :return: None
+        """
+        if mapped is None:
+            return
+        try:
+            mapped.close()
+        except BufferError:
+            pass
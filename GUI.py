@@ -18,7 +18,7 @@ class GUI:
             ],
             [
                 sg.Button("Compress", key="-COMPRESS-", visible=False),
-                sg.Text("Control Bytes:",visible=False,k="-CbyteText-"),sg.Spin([i for i in range(1, 16)], initial_value=2, key="-CONTROL_BYTES-", visible=False)
+                sg.Text("Control Bytes:",visible=False,k="-CbyteText-"),sg.Spin(["auto"] + [i for i in range(1, 16)], initial_value="auto", key="-CONTROL_BYTES-", visible=False)
             ],
             [
                 sg.Button("Decompress", key="-DECOMPRESS-", visible=False),
@@ -46,6 +46,8 @@ class GUI:
                 # Compression logic
                 file_path = values["-FILE-"]
                 control_bytes = values["-CONTROL_BYTES-"]
+                if control_bytes != "auto":
+                    control_bytes = int(control_bytes)
                 root, extension = os.path.splitext(file_path)
                 compressed = LZ77.compress(fio.read(file_path),control_bytes,extension)
 
@@ -0,0 +1,207 @@
+import heapq
+import struct
+import numpy as np
+
+
+class Huffman(object):
+    """
+    Canonical Huffman coding of byte symbols, the entropy coding stage of Huffman coded token streams (see
+    LZ77.BLOCK_HUFFMAN).
+
+    Codes are at most MAX_CODE_LENGTH bits long, so decoding a symbol is one lookup in a table of 2 ** MAX_CODE_LENGTH
+    entries, indexed by the next MAX_CODE_LENGTH bits, instead of a walk down the code tree bit by bit. The symbols are
+    dealt out round robin to lanes, each coded as a bit stream of its own, and the lanes are decoded in lockstep: every
+    NumPy step decodes the next symbol of every lane, so decoding is vectorized although each bit stream is sequential.
+
+    Coded layout: the symbol count, lane count and lane length width (HEADER), the code length of every byte value (a
+    nibble each, 0 for values that don't occur), the byte length of every lane (2 or 4 bytes each, as the width says),
+    then the lanes back to back. Codes are written most significant bit first, every lane is padded to a whole byte.
+    """
+    MAX_CODE_LENGTH = 12 #a code plus the bits before it in its byte fit the 3 bytes each table lookup reads
+    LANE_SYMBOLS = 1 << 8 #fewest symbols per lane (unless there is just one), each lane costs its length and padding
+    MAX_LANES = 1 << 10
+    HEADER = struct.Struct(">IHB") #symbol count, lane count, bytes per lane length
+    CODE_LENGTHS = 128 #bytes of code lengths, two 4-bit lengths per byte
+
+    @staticmethod
+    def code_lengths(counts, max_length=MAX_CODE_LENGTH):
+        """
+        Huffman code lengths for symbols occurring counts times, limited to max_length bits.
+        Codes the limit cut short break the Kraft inequality, so the longest codes still below the limit are lengthened
+        (rarest first) until it holds again, then the most frequent symbols are shortened where the code space left
+        over allows.
+        :param counts: np.array of how often each symbol occurs
+        :param max_length: (optional) longest code length allowed, default is MAX_CODE_LENGTH
+        :return: np.array of code lengths in bits, 0 for symbols that don't occur
+        """
+        counts = np.asarray(counts, dtype=np.int64)
+        lengths = np.zeros(counts.size, dtype=np.int64)
+        used = np.flatnonzero(counts)
+        if used.size <= 1:
+            lengths[used] = 1 #a lone symbol still needs a code
+            return lengths
+
+        # Huffman's algorithm, every merge makes the codes of both groups one bit longer
+        heap = [(int(counts[symbol]), int(symbol), [int(symbol)]) for symbol in used]
+        heapq.heapify(heap)
+        while len(heap) > 1:
+            count_a, key, group_a = heapq.heappop(heap)
+            count_b, _, group_b = heapq.heappop(heap)
+            group = group_a + group_b
+            lengths[group] += 1
+            heapq.heappush(heap, (count_a + count_b, key, group))
+
+        if lengths.max() > max_length:
+            lengths[used] = np.minimum(lengths[used], max_length)
+            capacity = 1 << max_length
+            kraft = int((1 << (max_length - lengths[used])).sum())
+            rarest_first = used[np.argsort(counts[used], kind="stable")].tolist()
+            while kraft > capacity:
+                # Lengthening the longest code below the limit gives up the least code space
+                symbol = max((s for s in rarest_first if lengths[s] < max_length), key=lambda s: lengths[s])
+                lengths[symbol] += 1
+                kraft -= 1 << (max_length - lengths[symbol])
+            for symbol in reversed(rarest_first):
+                while lengths[symbol] > 1 and kraft + (1 << (max_length - lengths[symbol])) <= capacity:
+                    kraft += 1 << (max_length - lengths[symbol])
+                    lengths[symbol] -= 1
+        return lengths
+
+    @staticmethod
+    def canonical_codes(lengths):
+        """
+        Canonical codes for the code lengths: shorter codes first, symbols of the same length in increasing order, so
+        the lengths alone describe the code.
+        :param lengths: np.array of code lengths, 0 for symbols without a code
+        :return: np.array of codes, the low lengths[symbol] bits of each
+        """
+        lengths = np.asarray(lengths, dtype=np.int64)
+        codes = np.zeros(lengths.size, dtype=np.int64)
+        code = previous = 0
+        for symbol in np.lexsort((np.arange(lengths.size), lengths)).tolist():
+            length = int(lengths[symbol])
+            if length == 0:
+                continue
+            code <<= length - previous
+            codes[symbol] = code
+            code += 1
+            previous = length
+        return codes
+
+    @staticmethod
+    def decode_table(lengths):
+        """
+        Lookup tables for decoding: indexed by the next MAX_CODE_LENGTH bits, they give the symbol whose code those bits
+        start with, and its length. Bits no code starts with have length 0.
+        :param lengths: np.array of code lengths, as read from a coded stream
+        :return: Tuple (np.uint8 array of symbols, np.int64 array of code lengths)
+        """
+        max_length = Huffman.MAX_CODE_LENGTH
+        lengths = np.asarray(lengths, dtype=np.int64)
+        used = lengths > 0
+        if lengths.max(initial=0) > max_length or int((1 << (max_length - lengths[used])).sum()) > 1 << max_length:
+            raise ValueError("Invalid Huffman code lengths in compressed stream.")
+        symbols = np.zeros(1 << max_length, dtype=np.uint8)
+        code_lengths = np.zeros(1 << max_length, dtype=np.int64)
+        for symbol, length, code in zip(np.flatnonzero(used).tolist(), lengths[used].tolist(),
+                                        Huffman.canonical_codes(lengths)[used].tolist()):
+            start = code << (max_length - length)
+            end = start + (1 << (max_length - length))
+            symbols[start:end] = symbol
+            code_lengths[start:end] = length
+        return symbols, code_lengths
+
+    @staticmethod
+    def encode(symbols):
+        """
+        Huffman codes byte symbols (see the class docstring for the layout).
+        The bits of every code are placed with NumPy, one pass per bit of the longest code.
+        :param symbols: np.uint8 array (or bytes-like) of symbols
+        :return: coded symbols as bytes
+        """
+        symbols = np.frombuffer(symbols, dtype=np.uint8) if not isinstance(symbols, np.ndarray) else symbols
+        count = symbols.size
+        lengths = Huffman.code_lengths(np.bincount(symbols, minlength=256))
+        codes = Huffman.canonical_codes(lengths)
+        code_lengths = (lengths[0::2] << 4 | lengths[1::2]).astype(np.uint8).tobytes()
+        if count == 0:
+            return Huffman.HEADER.pack(0, 0, 2) + code_lengths
+
+        lanes = min(Huffman.MAX_LANES, max(1, count // Huffman.LANE_SYMBOLS))
+        steps = -(-count // lanes)
+        # Lane k codes symbols k, k + lanes, k + 2 * lanes, ..., the lanes are laid out one after another
+        order = (np.arange(lanes)[:, None] + lanes * np.arange(steps)).ravel()
+        order = order[order < count]
+        lane_counts = np.full(lanes, steps, dtype=np.int64)
+        lane_counts[count - (steps - 1) * lanes:] -= 1 #the last round doesn't reach every lane
+        bit_lengths = lengths[symbols[order]]
+        bit_codes = codes[symbols[order]]
+
+        lane_bits = np.add.reduceat(bit_lengths, np.cumsum(lane_counts) - lane_counts)
+        lane_bytes = (lane_bits + 7) >> 3
+        # Where every code starts: its place among the codes of all lanes, plus the padding of the lanes before it
+        padding = 8 * (np.cumsum(lane_bytes) - lane_bytes) - (np.cumsum(lane_bits) - lane_bits)
+        position = np.cumsum(bit_lengths) - bit_lengths + np.repeat(padding, lane_counts)
+        bits = np.zeros(8 * int(lane_bytes.sum()), dtype=np.uint8)
+        for j in range(int(bit_lengths.max())):
+            has_bit = bit_lengths > j
+            bits[position[has_bit] + j] = (bit_codes[has_bit] >> (bit_lengths[has_bit] - 1 - j)) & 1
+
+        width = 2 if lane_bytes.max() < 1 << 16 else 4
+        return b"".join((Huffman.HEADER.pack(count, lanes, width), code_lengths,
+                         lane_bytes.astype(">u2" if width == 2 else ">u4").tobytes(), np.packbits(bits).tobytes()))
+
+    @staticmethod
+    def decode(data, offset=0, max_count=None):
+        """
+        Decodes symbols coded by encode, all lanes in lockstep with one table lookup per symbol.
+        :param data: bytes-like holding the coded symbols
+        :param offset: (optional) where the coded symbols start in data
+        :param max_count: (optional) most symbols expected, coded streams claiming more are rejected
+        :return: Tuple (np.uint8 array of symbols, position in data after the coded symbols)
+        """
+        buffer = np.frombuffer(data, dtype=np.uint8)
+        if offset + Huffman.HEADER.size + Huffman.CODE_LENGTHS > buffer.size:
+            raise ValueError("Truncated Huffman coded stream.")
+        count, lanes, width = Huffman.HEADER.unpack_from(data, offset)
+        i = offset + Huffman.HEADER.size
+        nibbles = buffer[i:i + Huffman.CODE_LENGTHS].astype(np.int64)
+        lengths = np.stack((nibbles >> 4, nibbles & 0xF), axis=1).ravel()
+        i += Huffman.CODE_LENGTHS
+        if count == 0:
+            return np.zeros(0, dtype=np.uint8), i
+        if width not in (2, 4) or not 1 <= lanes <= count or (max_count is not None and count > max_count):
+            raise ValueError("Invalid Huffman coded stream.")
+        if i + width * lanes > buffer.size:
+            raise ValueError("Truncated Huffman coded stream.")
+        lane_bytes = np.frombuffer(data, dtype=">u2" if width == 2 else ">u4", count=lanes, offset=i).astype(np.int64)
+        i += width * lanes
+        end = i + int(lane_bytes.sum())
+        if end > buffer.size:
+            raise ValueError("Truncated Huffman coded stream.")
+        symbol_table, length_table = Huffman.decode_table(lengths)
+
+        # 3 bytes from every byte on, so a lookup is one gather and shift. The padding keeps lanes running over their
+        # end (on corrupt data) in bounds
+        max_length = Huffman.MAX_CODE_LENGTH
+        steps = -(-count // lanes)
+        lane_data = np.zeros(end - i + (steps * max_length >> 3) + 3, dtype=np.int64)
+        lane_data[:end - i] = buffer[i:end]
+        windows = lane_data[:-2] << 16 | lane_data[1:-1] << 8 | lane_data[2:]
+        lane_start = 8 * (np.cumsum(lane_bytes) - lane_bytes)
+        position = lane_start.copy() #bit position of every lane
+        shift = 24 - max_length
+        mask = (1 << max_length) - 1
+
+        out = np.empty(steps * lanes, dtype=np.uint8)
+        last = count - (steps - 1) * lanes #lanes the last round reaches
+        for step in range(steps):
+            active = position if step < steps - 1 else position[:last] #a view, the last round only updates those lanes
+            index = (windows[active >> 3] >> (shift - (active & 7))) & mask
+            out[step * lanes:step * lanes + active.size] = symbol_table[index]
+            active += length_table[index]
+
+        # Every lane has to end in its last byte, invalid codes (length 0) stall their lane short of it
+        if ((position - lane_start + 7) >> 3 != lane_bytes).any():
+            raise ValueError("Invalid Huffman coded stream.")
+        return out[:count], end
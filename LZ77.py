@@ -2,7 +2,21 @@ from dataclasses import dataclass, field
 import logging
 import numpy as np
 import argparse
+import contextlib
+import glob
+import heapq
 import os
+import sys
+import time
+import struct
+import zlib
+from array import array
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from itertools import chain, repeat
+from MatchFinder import HashChainMatchFinder, SuffixArrayMatchFinder, LongRangeMatchFinder, find_runs
+from FileIO import FileIO
+from Dictionary import Dictionary
+from Huffman import Huffman
 #todo
 # no, i didnt just delete this before submitting :)
 
@@ -12,7 +26,22 @@ def main():
     Main; handles argument parsing if called from the command line.
     -c or --compress [source] [destination (optional)] Compresses the source file, if no destination is provided, the file is saved as [source].lz77
     -d or --decompress [source] [destination (optional)] Decompresses the source file, if no destination is provided, the file is saved as [source].lz77
-    -cb or --control-bytes [int] Sets the number of control bytes to use for compression
+    -t or --test [sources] Checks that compressed files (or glob patterns) decode and match their checksums, writing nothing
+    -cb or --control-bytes [int|auto] Sets the number of control bytes to use for compression, auto picks it per input
+    -mf or --match-finder [hash|max] Selects the match finder, max trades speed for the longest possible matches
+    -l or --level [0|1|2] Parsing level, greedy, lazy or optimal
+    -j or --jobs [int] Compresses (or decompresses) blocks across this many processes, -bs or --block-size [int] sets the block size
+    --prime Primes each block with the window before it
+    -s or --stream Streams the file through in blocks with bounded memory, implied when a file name is - (stdin/stdout)
+    -b or --batch Treats every name after -c or -d as an input (file or glob pattern), implied by -r or more than two names
+    -r or --recursive Batch mode that also takes directories, processing every file under them
+    -w or --workers [int] Files processed at once in batch mode, default is the number of CPUs
+    -D or --dictionary [file] Preset dictionary to compress with (see Dictionary.py), needed again to decompress
+    -R or --reference [file] Compresses a single file as a delta against this reference version, needed again to decompress
+    --long Also finds repeats further back than the window, however far apart (writes the framed format)
+    --varint Writes varint tokens, sized by their values instead of -cb (writes the framed format)
+    --huffman Huffman codes the control fields and literals of the tokens (writes the framed format)
+    --checksum Records the CRC-32 of every block, checked when decompressing or testing (writes the framed format)
     """
     # Set up the argument parser
     parser = argparse.ArgumentParser(
@@ -32,25 +61,149 @@ def main():
         nargs="+",
         help="Decompress the input file. Optionally specify the output file."
     )
+    parser.add_argument(
+        "-t", "--test",
+        metavar="input_file",
+        nargs="+",
+        help="Test that compressed files (or glob patterns) decode and match their checksums, without writing output."
+    )
     parser.add_argument(
         "-cb", "--control-bytes",
-        type=int,
+        type=control_bytes_arg,
         default=3,
-        help="Specify the control byte length for compression. Default is 3."
+        help="Specify the control byte length for compression, or auto to pick it by sampling the input. Default is 3."
+    )
+    parser.add_argument(
+        "-mf", "--match-finder",
+        choices=LZ77.MATCH_FINDERS,
+        default="hash",
+        help="Match finder to use: hash (fast) or max (slower, always finds the longest match). Default is hash."
+    )
+    parser.add_argument(
+        "-l", "--level",
+        type=int,
+        choices=LZ77.LEVELS,
+        default=0,
+        help="Parsing level: 0 greedy, 1 lazy, 2 optimal (smallest output, slowest). Default is 0."
+    )
+    parser.add_argument(
+        "-j", "--jobs",
+        type=int,
+        default=1,
+        help="Compress (or decompress) blocks in parallel across this many processes (writes the framed format). Default is 1."
+    )
+    parser.add_argument(
+        "-bs", "--block-size",
+        type=int,
+        default=None,
+        help="Split the input into blocks of this many bytes (writes the framed format). Default is 1 MiB with -j."
+    )
+    parser.add_argument(
+        "--prime",
+        action="store_true",
+        help="Prime each block with the window before it, better ratio but blocks can't be decoded on their own. "
+             "Streamed blocks are always primed."
+    )
+    parser.add_argument(
+        "-s", "--stream",
+        action="store_true",
+        help="Stream the file through in blocks, memory use stays bounded. Implied when a file name is - (stdin/stdout)."
+    )
+    parser.add_argument(
+        "-b", "--batch",
+        action="store_true",
+        help="Treat every name as an input file or glob pattern, each written next to its input. Implied by -r or more than two names."
+    )
+    parser.add_argument(
+        "-r", "--recursive",
+        action="store_true",
+        help="Batch mode, directories (and ** in patterns) take in every file below them."
+    )
+    parser.add_argument(
+        "-w", "--workers",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Number of files processed at once in batch mode. Default is the number of CPUs."
+    )
+    parser.add_argument(
+        "-D", "--dictionary",
+        metavar="dictionary_file",
+        help="Preset dictionary to prime the window with, the same dictionary is needed to decompress."
+    )
+    parser.add_argument(
+        "-R", "--reference",
+        metavar="reference_file",
+        help="Compress a single file as a delta against this reference version, which is needed again to decompress."
+    )
+    parser.add_argument(
+        "--long",
+        action="store_true",
+        help="Also match repeats further back than the window, anywhere in the file (writes the framed format)."
+    )
+    parser.add_argument(
+        "--varint",
+        action="store_true",
+        help="Write tokens with varint fields sized by their values, -cb is then ignored (writes the framed format)."
+    )
+    parser.add_argument(
+        "--huffman",
+        action="store_true",
+        help="Huffman code the control fields and literals of the tokens, up to 8 -cb (writes the framed format)."
+    )
+    parser.add_argument(
+        "--checksum",
+        action="store_true",
+        help="Record the CRC-32 of every block, checked when decompressing or testing (writes the framed format)."
     )
     # Parse the arguments
     args = parser.parse_args()
+    if args.dictionary and args.reference:
+        print("Error: --dictionary and --reference can't be combined.")
+        return 1
+    try:
+        dictionary = Dictionary.load(args.dictionary or args.reference) if args.dictionary or args.reference else None
+    except Exception as e:
+        print(f"Error loading {'dictionary' if args.dictionary else 'reference'}: {e}")
+        return 1
+    if args.test:
+        return verify_files(args.test, args.recursive, args.jobs, dictionary)
+
+    names = args.compress or args.decompress
+    batch = names and (args.batch or args.recursive or len(names) > 2 or second_is_input(names, bool(args.compress)))
+    if args.reference and args.compress and (batch or args.stream or "-" in names):
+        print("Error: --reference compresses a single file, without streaming.")
+        return 1
+    if batch:
+        options = dict(control_bytes=args.control_bytes, match_finder=args.match_finder, level=args.level,
+                       workers=args.jobs, block_size=args.block_size, prime=args.prime, dictionary=dictionary,
+                       long_range=args.long, varint=args.varint, huffman=args.huffman, checksum=args.checksum) \
+            if args.compress else dict(workers=args.jobs, dictionary=dictionary)
+        return batch_files(names, bool(args.compress), args.recursive, args.workers, options)
 
     if args.compress:
         input_file = args.compress[0]
-        output_file = args.compress[1] if len(args.compress) > 1 else f"{os.path.splitext(input_file)[0]}.Z77"
+        default_output = "-" if input_file == "-" else f"{os.path.splitext(input_file)[0]}.Z77"
+        output_file = args.compress[1] if len(args.compress) > 1 else default_output
         file_extension = os.path.splitext(input_file)[1]  # Extract file extension
+        if args.stream or "-" in (input_file, output_file):
+            unsupported = [flag for flag, used in (("--long", args.long), ("--varint", args.varint),
+                                                   ("--huffman", args.huffman), ("-j", args.jobs > 1)) if used]
+            if unsupported:
+                print(f"Error: {', '.join(unsupported)} can't be used when streaming.")
+                return 1
+            return stream_file(input_file, output_file, compress=True, control_bytes=args.control_bytes,
+                               extension=file_extension, block_size=args.block_size or LZ77.BLOCK_SIZE,
+                               match_finder=args.match_finder, level=args.level, dictionary=dictionary,
+                               checksum=args.checksum)
         try:
-            with open(input_file, "rb") as f:
-                raw_data = f.read()
-            compressed_data = LZ77.compress(raw_data, control_bytes=args.control_bytes, extension=file_extension)
-            with open(output_file, "wb") as f:
-                f.write(compressed_data)
+            if args.reference:
+                compress_file(input_file, output_file, reference=dictionary, control_bytes=args.control_bytes,
+                              match_finder=args.match_finder, level=args.level, checksum=args.checksum)
+            else:
+                compress_file(input_file, output_file, control_bytes=args.control_bytes, match_finder=args.match_finder,
+                              level=args.level, workers=args.jobs, block_size=args.block_size, prime=args.prime,
+                              dictionary=dictionary, long_range=args.long, varint=args.varint, huffman=args.huffman,
+                              checksum=args.checksum)
             print(f"Compression successful. File saved to {output_file}.")
             return 0
         except Exception as e:
@@ -60,13 +213,14 @@ def main():
     elif args.decompress:
         input_file = args.decompress[0]
         output_file = args.decompress[1] if len(args.decompress) > 1 else os.path.splitext(input_file)[0]
+        if args.stream or "-" in (input_file, output_file):
+            if args.jobs > 1:
+                print("Error: -j can't be used when streaming.")
+                return 1
+            return stream_file(input_file, output_file, compress=False, dictionary=dictionary)
         try:
-            with open(input_file, "rb") as f:
-                compressed_data = f.read()
-            decompressed_data, file_extension = LZ77.decompress(compressed_data)
-            output_file_with_extension = output_file + file_extension
-            with open(output_file_with_extension, "wb") as f:
-                f.write(decompressed_data)
+            output_file_with_extension, _, _ = decompress_file(input_file, output_file, workers=args.jobs,
+                                                               dictionary=dictionary)
             print(f"Decompression successful. File saved to {output_file_with_extension}.")
             return 0
         except Exception as e:
@@ -77,6 +231,269 @@ def main():
         parser.print_help()
 
 
+def compress_file(input_file, output_file, reference=None, **options):
+    """
+    Compresses input_file into output_file, the input's extension is recorded in the header.
+    :param input_file: file to compress
+    :param output_file: file to write
+    :param reference: (optional) reference version (bytes-like or Dictionary) to compress input_file as a delta against
+    :param options: keyword arguments for LZ77.compress (LZ77.compress_delta with a reference)
+    :return: Tuple (input size, compressed size) in bytes
+    """
+    # The input is mapped rather than read, the kernel pages it in as the tokenizer reaches it
+    with FileIO.open_mapped(input_file) as raw_data:
+        raw_length = len(raw_data)
+        extension = os.path.splitext(input_file)[1]
+        if reference is not None:
+            compressed_data = LZ77.compress_delta(raw_data, reference, extension=extension, **options)
+        else:
+            compressed_data = LZ77.compress(raw_data, extension=extension, **options)
+    FileIO.write_mapped(compressed_data, output_file)
+    return raw_length, len(compressed_data)
+
+
+def decompress_file(input_file, output_file, workers=1, dictionary=None):
+    """
+    Decompresses input_file into output_file, with the extension from the header appended.
+    :param input_file: file to decompress
+    :param output_file: file to write, without its extension
+    :param workers: (optional) processes decoding independent blocks in parallel
+    :param dictionary: (optional) preset dictionary the file was compressed with
+    :return: Tuple (output file with its extension, compressed size, decompressed size in bytes)
+    """
+    # Decoded straight into the mapped output file, sized up front from the headers
+    with FileIO.open_mapped(input_file) as compressed_data:
+        output_file_with_extension = output_file + LZ77.verify_header(input_file)[1]
+        raw_length = LZ77.uncompressed_size(compressed_data)
+        with FileIO.create_mapped(output_file_with_extension, raw_length) as out:
+            LZ77.decompress(compressed_data, workers=workers, out=out, dictionary=dictionary)
+        return output_file_with_extension, len(compressed_data), raw_length
+
+
+def verify_files(names, recursive, workers=1, dictionary=None):
+    """
+    Tests compressed files with LZ77.verify, printing a line per file and a summary. Nothing is written.
+    :param names: file names, glob patterns or (when recursive) directories
+    :param recursive: whether directories take in every file below them
+    :param workers: (optional) processes checking the independent blocks of a file in parallel
+    :param dictionary: (optional) preset dictionary the files were compressed with
+    :return: 0 if every file passed, 1 otherwise
+    """
+    files, missing = find_inputs(names, recursive)
+    for name, message in missing:
+        print(f"{name}: failed, {message}")
+    failed = len(missing)
+    for input_file in files:
+        # The coders report their progress on stdout, which would bury the results
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            try:
+                with FileIO.open_mapped(input_file) as compressed_data:
+                    size, checksummed = LZ77.verify(compressed_data, dictionary, workers)
+                message = ""
+            except Exception as e:
+                message = str(e) or type(e).__name__
+        if message:
+            failed += 1
+            print(f"{input_file}: failed, {message}")
+        else:
+            print(f"{input_file}: OK, {size} bytes, {'checksums match' if checksummed else 'decodes (no checksums)'}")
+    print(f"Tested {len(files) + len(missing)} files, {failed} failed.")
+    return 1 if failed else 0
+
+
+def control_bytes_arg(value):
+    """
+    Parses the -cb argument.
+    :param value: "auto" or a number of control bytes
+    :return: "auto" or the number as an int
+    """
+    if value == "auto":
+        return value
+    try:
+        return int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid control byte length {value}, expected a number or auto")
+
+
+def find_inputs(names, recursive):
+    """
+    Expands the names given on the command line into the files to process, in order and without duplicates.
+    :param names: file names, glob patterns or (when recursive) directories
+    :param recursive: whether directories and ** in patterns take in every file below them
+    :return: Tuple (list of files, list of Tuples (name, error message) for names that matched no file)
+    """
+    files = []
+    missing = []
+    for name in names:
+        matches = sorted(glob.glob(name, recursive=recursive)) if glob.has_magic(name) else [name]
+        found = []
+        for match in matches:
+            if os.path.isfile(match):
+                found.append(match)
+            elif os.path.isdir(match) and recursive:
+                for root, dirs, walked in os.walk(match):
+                    dirs.sort() #walk in a stable order
+                    found.extend(os.path.join(root, f) for f in sorted(walked))
+        if found:
+            files.extend(found)
+        elif os.path.isdir(name):
+            missing.append((name, "is a directory, use -r to process the files in it"))
+        else:
+            missing.append((name, "no such file"))
+    return list(dict.fromkeys(files)), missing
+
+
+def batch_file(input_file, compress, options):
+    """
+    Compresses or decompresses one file of a batch, writing it next to its input. Runs in the worker processes.
+    Inputs that already have a valid header are skipped when compressing, inputs without one when decompressing.
+    :param input_file: file to process
+    :param compress: True to compress, False to decompress
+    :param options: keyword arguments for compress_file or decompress_file
+    :return: Tuple (status "ok", "skipped" or "failed", output file, input size, output size, seconds, message)
+    """
+    started = time.perf_counter()
+    base = os.path.splitext(input_file)[0]
+    # The coders report their progress on stdout, which would bury the summary
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        try:
+            compressed = LZ77.verify_header(input_file)[0]
+            if compressed == compress:
+                reason = "already compressed" if compress else "not an LZ77 file"
+                return "skipped", None, 0, 0, 0.0, reason
+            if compress:
+                output_file = f"{base}.Z77"
+                if os.path.abspath(output_file) == os.path.abspath(input_file):
+                    raise ValueError("output would overwrite the input")
+                in_size, out_size = compress_file(input_file, output_file, **options)
+            else:
+                output_file, in_size, out_size = decompress_file(input_file, base, **options)
+            return "ok", output_file, in_size, out_size, time.perf_counter() - started, ""
+        except Exception as e:
+            return "failed", None, 0, 0, time.perf_counter() - started, str(e)
+
+
+def second_is_input(names, compress):
+    """
+    Whether the second of two names is another input rather than the output, such as two files matched by a glob, so
+    the two are processed as a batch instead of the second being overwritten. That's an existing, non-empty file that
+    isn't compressed yet when compressing, or a compressed file when decompressing.
+    :param names: names given to -c or -d
+    :param compress: True to compress, False to decompress
+    :return: True if the names should be processed as a batch
+    """
+    if len(names) != 2 or "-" in names or not os.path.isfile(names[1]) or os.path.getsize(names[1]) == 0:
+        return False
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        return LZ77.verify_header(names[1])[0] != compress
+
+
+def batch_files(names, compress, recursive, workers, options):
+    """
+    Compresses or decompresses many files across a pool of processes, printing a line per file and a summary.
+    Every output is written next to its input, named as in single file mode.
+    :param names: file names, glob patterns or (when recursive) directories
+    :param compress: True to compress, False to decompress
+    :param recursive: whether directories take in every file below them
+    :param workers: number of files processed at once
+    :param options: keyword arguments for compress_file or decompress_file
+    :return: 0 if every file succeeded (or was skipped), 1 otherwise
+    """
+    if workers < 1:
+        print("Error: workers must be at least 1.")
+        return 1
+    started = time.perf_counter()
+    files, missing = find_inputs(names, recursive)
+    for name, message in missing:
+        print(f"{name}: failed, {message}")
+
+    # Inputs that only differ in extension would be written to the same output
+    claimed = {}
+    for input_file in files:
+        claimed.setdefault(os.path.splitext(input_file)[0], []).append(input_file)
+    clashing = {f for group in claimed.values() if len(group) > 1 for f in group}
+    failed = len(missing) + len(clashing)
+    for input_file in sorted(clashing):
+        print(f"{input_file}: failed, its output name clashes with another input's")
+    files = [f for f in files if f not in clashing]
+
+    skipped = processed = total_in = total_out = 0
+    pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 and len(files) > 1 else None
+    try:
+        if pool is None:
+            results = (batch_file(f, compress, options) for f in files)
+            jobs = zip(files, results)
+        else:
+            futures = {pool.submit(batch_file, f, compress, options): f for f in files}
+            jobs = ((futures[future], future.result()) for future in as_completed(futures))
+        for input_file, (status, output_file, in_size, out_size, seconds, message) in jobs:
+            if status == "skipped":
+                skipped += 1
+                print(f"{input_file}: skipped, {message}")
+            elif status == "failed":
+                failed += 1
+                print(f"{input_file}: failed, {message}")
+            else:
+                processed += 1
+                total_in += in_size
+                total_out += out_size
+                raw_size = in_size if compress else out_size
+                print(f"{input_file} -> {output_file}: {in_size} -> {out_size} bytes in {seconds:.2f}s "
+                      f"({raw_size / max(seconds, 1e-9) / 1e6:.1f} MB/s)")
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    seconds = time.perf_counter() - started
+    raw_total = total_in if compress else total_out
+    print(f"{'Compressed' if compress else 'Decompressed'} {processed} files, {total_in} -> {total_out} bytes in "
+          f"{seconds:.2f}s ({raw_total / max(seconds, 1e-9) / 1e6:.1f} MB/s), {skipped} skipped, {failed} failed.")
+    return 1 if failed else 0
+
+
+def stream_file(input_file, output_file, compress, **options):
+    """
+    Compresses or decompresses input_file into output_file chunk by chunk, either can be - for stdin/stdout.
+    Decompressed files get the extension from the header appended, like the regular decompression.
+    :param input_file: file to read, or -
+    :param output_file: file to write, or -
+    :param compress: True to compress, False to decompress
+    :param options: keyword arguments for the StreamCompressor (only dictionary for the StreamDecompressor)
+    :return: 0 on success, 1 on failure
+    """
+    from Stream import StreamCompressor, StreamDecompressor
+    stdout = sys.stdout.buffer if output_file == "-" else None
+    outputs = []
+
+    def output(extension):
+        # Opened on first use, decompressed data only comes out once the header (and its extension) has been read
+        if not outputs:
+            outputs.append(stdout if stdout is not None else open(output_file + extension, "wb"))
+        return outputs[0]
+
+    # Keep the progress messages out of the data when writing to stdout
+    with contextlib.redirect_stdout(sys.stdout if stdout is None else sys.stderr):
+        try:
+            coder = StreamCompressor(**options) if compress else StreamDecompressor(**options)
+            for chunk in FileIO.read_chunks(input_file):
+                data = coder.write(chunk)
+                if data:
+                    output("" if compress else coder.extension).write(data)
+            out = output("" if compress else coder.extension)
+            out.write(coder.close())
+            print(f"{'Compression' if compress else 'Decompression'} successful. File saved to {getattr(out, 'name', '-')}.")
+            return 0
+        except Exception as e:
+            print(f"Error during {'compression' if compress else 'decompression'}: {e}")
+            return 1
+        finally:
+            for out in outputs:
+                if out is stdout:
+                    out.flush()
+                else:
+                    out.close()
+
+
 @dataclass
 class MatchToken:
     """
@@ -119,10 +536,166 @@ class LiteralToken:
     type: bool = field(default=False) #flag to identify token type, will alawys be false for literals
 
 
+def span_indices(starts, lengths):
+    """
+    Indices of every element of the spans [starts[k], starts[k] + lengths[k]), in order.
+    :param starts: np.array of span starts
+    :param lengths: np.array of span lengths
+    :return: np.array of indices
+    """
+    # Each span's start repeated over its length, plus the index within the span
+    within_span = np.arange(int(lengths.sum())) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return np.repeat(starts, lengths) + within_span
+
+
+def write_varint(value):
+    """
+    Encodes a non-negative integer as a LEB128 varint: 7 bits per byte, least significant first, high bit set on all
+    but the last byte.
+    :param value: integer to encode
+    :return: the varint as bytes
+    """
+    out = bytearray()
+    while value > 0x7F:
+        out.append(value & 0x7F | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def read_varint(data, i):
+    """
+    Decodes a LEB128 varint written by write_varint.
+    :param data: bytes-like holding the varint
+    :param i: where the varint starts in data
+    :return: Tuple (value, position after the varint)
+    """
+    value = 0
+    shift = 0
+    while True:
+        if i >= len(data):
+            raise ValueError("Truncated varint in compressed stream.")
+        byte = data[i]
+        i += 1
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value, i
+        shift += 7
+
+
+def varint_size(value):
+    """
+    :param value: non-negative integer
+    :return: bytes write_varint takes for it
+    """
+    return max(1, (value.bit_length() + 6) // 7)
+
+
+def varint_sizes(values):
+    """
+    Bytes write_varint takes for each of the values.
+    :param values: np.array of np.uint64
+    :return: np.array of sizes (np.int64)
+    """
+    sizes = np.ones(values.size, dtype=np.int64)
+    rest = values >> np.uint64(7)
+    while rest.any():
+        sizes += rest > 0
+        rest >>= np.uint64(7)
+    return sizes
+
+
+def scatter_varints(out, positions, values, sizes):
+    """
+    Writes each value as a varint at its position, the NumPy counterpart of write_varint.
+    :param out: np.uint8 array written to
+    :param positions: np.array of where each varint starts in out
+    :param values: np.array of np.uint64 values
+    :param sizes: their sizes from varint_sizes
+    :return: None
+    """
+    for k in range(int(sizes.max()) if sizes.size else 0):
+        selected = sizes > k
+        byte = (values[selected] >> np.uint64(7 * k)) & np.uint64(0x7F)
+        byte |= np.where(sizes[selected] > k + 1, np.uint64(0x80), np.uint64(0))
+        out[positions[selected] + k] = byte
+
+
+class TokenStore(object):
+    """
+    Compact token buffer filled by LZ77.tokenize, one entry per token kept in parallel columns (struct of arrays)
+    instead of one dataclass object per token.
+
+    Columns:
+        kind: 1 for matches, 0 for literal runs.
+        length: match length, or literal run length, in bytes.
+        value: match distance, or for literal runs the start of the run in the raw data (literals aren't copied).
+
+    Indexing or iterating gives MatchToken/LiteralToken views built on the fly, for debugging and tests.
+    """
+    def __init__(self, raw_data):
+        """
+        Creates an empty store.
+        :param raw_data: np.uint8 array the literal runs point into
+        """
+        self.raw_data = raw_data
+        self.kind = array("B")
+        self.length = array("Q")
+        self.value = array("Q")
+
+    def append_match(self, dist, length):
+        """
+        Appends a match token.
+        :param dist: distance back to the start of the match
+        :param length: length of the match
+        :return: None
+        """
+        self.kind.append(1)
+        self.length.append(length)
+        self.value.append(dist)
+
+    def append_literal(self, start, length):
+        """
+        Appends a literal run token.
+        :param start: start of the run in the raw data
+        :param length: length of the run
+        :return: None
+        """
+        self.kind.append(0)
+        self.length.append(length)
+        self.value.append(start)
+
+    def columns(self):
+        """
+        The columns as NumPy arrays, in the layout the serializer takes.
+        :return: Tuple (match as bool, length, dist (0 for literal runs), literal run start in raw_data (0 for matches))
+        """
+        match = np.frombuffer(self.kind, dtype=np.uint8).astype(bool)
+        length = np.frombuffer(self.length, dtype=np.uint64)
+        value = np.frombuffer(self.value, dtype=np.uint64)
+        return match, length, np.where(match, value, 0), np.where(match, 0, value)
+
+    def __len__(self):
+        return len(self.kind)
+
+    def __getitem__(self, index):
+        """
+        :param index: token index or slice
+        :return: MatchToken or LiteralToken view of the token (list of views for slices)
+        """
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if self.kind[index]:
+            return MatchToken(self.value[index], self.length[index])
+        start = self.value[index]
+        return LiteralToken(self.length[index], self.raw_data[start:start + self.length[index]].tolist())
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
 
 class LZ77(object):
-    literal_buffer = []
-    compressed_data = []
     EXTENSION_MAP = {
         0x0: "",  # No extension
         0x1: ".txt",
@@ -138,6 +711,59 @@ class LZ77(object):
         0xB: ".xml"
         # Add up to 16 extensions as needed
     }
+    # Framed format: header byte 2 has a zero control byte nibble, then a version byte and a flags byte follow.
+    # The data is split into blocks, each with its own header, and an end block closes the frame.
+    # Version 2 frames add a block index trailer after the end block, for parallel and random access decoding.
+    FRAME_VERSION = 2
+    FRAME_VERSIONS = (1, 2) #frame versions this reader can decode
+    BLOCK_SIZE = 1 << 20 #default block size for framed streams, 1 MiB
+    BLOCK_HEADER = struct.Struct(">BBII") #block type, control byte length, raw length, payload length
+    BLOCK_END = 0x00 #closes the frame, has no other fields
+    BLOCK_TOKENS = 0x01 #payload is a token stream, as in the 2-byte header format
+    BLOCK_LONG = 0x02 #payload is a token stream that may also hold long range matches, always primed
+    BLOCK_VARINT = 0x03 #payload is a varint token stream, the block header's control byte length is unused
+    BLOCK_STORED = 0x04 #payload is the block's data as is, written when tokens wouldn't be smaller
+    BLOCK_HUFFMAN = 0x40 #flag on BLOCK_TOKENS, the token stream's control fields and literals are Huffman coded
+    BLOCK_PRIMED = 0x80 #flag, the block's matches may reach back into earlier blocks
+    INDEX_ENTRY = struct.Struct(">QQI") #block header offset (from the end of the frame header), raw offset, raw length
+    INDEX_FOOTER = struct.Struct(">QI4s") #index offset (from the end of the frame header), entry count, magic
+    INDEX_MAGIC = b"Z77X"
+    FLAG_DICTIONARY = 0x01 #frame flag, a preset dictionary's id (">I") follows the header, the data is primed with it
+    FLAG_TOKENS = 0x02 #frame flag, the body is a control byte length byte and one token stream instead of blocks
+    FLAG_CHECKSUM = 0x04 #frame flag, every block (or the single token stream) carries the CRC-32 of its decoded data
+    FRAME_FLAGS = FLAG_DICTIONARY | FLAG_TOKENS | FLAG_CHECKSUM #flags this reader understands
+    DICTIONARY_ID = struct.Struct(">I")
+    CHECKSUM = struct.Struct(">I") #zlib.crc32 of the decoded data, after each block's payload or the control byte length
+    LONG_RUN = 64 #literal runs at least this long are copied as memoryview slices when serializing, not gathered
+    SCAN_CHUNK = 1 << 16 #bytes of token stream whose control fields __scan_tokens reads per NumPy step
+    MATCH_FINDERS = ("hash", "max") #fast hash chains, or the slower suffix array finder that always finds the longest match
+    LEVELS = (0, 1, 2) #parsing levels: greedy, lazy, optimal
+    # Varint tokens: a varint tag (length << 1 | 1 for matches, length << 1 for literal runs), then the match distance
+    # as a varint or the literal bytes. Their limits don't depend on the control byte length.
+    VARINT_WINDOW = (1 << 21) - 1 #distances up to 3 varint bytes
+    VARINT_MAX_MATCH = 1 << 16
+    VARINT_MAX_LITERAL = (1 << 32) - 1
+    VARINT_MIN_MATCH = 3 #a near match of 3 bytes takes 2
+    # Control byte length selection for control_bytes="auto", see choose_control_bytes
+    AUTO_SAMPLES = 4
+    AUTO_SAMPLE = 1 << 15 #most bytes per sampled window, smaller inputs get smaller samples (at least a quarter)
+    AUTO_CHAIN_DEPTH = 64
+    AUTO_MAX_MATCH = 1 << 13 #longer matches are split by every candidate alike
+    # Incompressibility probe run by tokenize, see incompressible
+    PROBE_MIN = 1 << 15 #smaller data is cheap to tokenize anyway
+    PROBE_SAMPLES = 8
+    PROBE_SAMPLE = 1 << 12 #bytes per sample
+    PROBE_ENTROPY = 7.9 #bits per byte, samples below this are compressible
+    PROBE_REPEATS = 0.01 #fraction of repeated 8-byte strings (beyond chance) above which the data is compressible
+    PROBE_STRINGS = 1 << 20 #most strings the repeat check sorts, larger data is sampled
+    # Runs of a repeated byte or short pattern, emitted by tokenize as overlapping matches without searching (find_runs)
+    RUN_MIN = 32 #shortest run
+    RUN_PERIOD = 8 #longest pattern
+    # Inside a match this long (or as long as the control bytes allow) the optimal parse only looks for matches of up to
+    # OPTIMAL_CAPPED_LENGTH bytes, long matches are rarely worth splitting and extending the matches inside them
+    # dominates its time
+    OPTIMAL_NICE_LENGTH = 64
+    OPTIMAL_CAPPED_LENGTH = 16
     def _var_init(self):
         """
         Inits All the object variables, kept in a function so they can be dynamically set.
@@ -172,14 +798,28 @@ class LZ77(object):
         #Set the window size and lookahead buffer size based off of the control byte length
         self.window_size = 2**self.pointer_distance_bits-1 #maximum distance from current position to search buffer, (2/3rd of control byte)
         self.lookahead_buffer = 2**self.literal_length_bits -1 #7 bits used to store the length of a match
+        self.min_match = self.control_byte_length + 1 #shorter matches take no less space than their bytes
+
+        if self.varint:
+            # Varint fields grow with their values, the control byte length doesn't limit them
+            self.window_size = self.max_distance = self.VARINT_WINDOW
+            self.max_pointer_length = self.VARINT_MAX_MATCH
+            self.max_literal_length = self.lookahead_buffer = self.VARINT_MAX_LITERAL
+            self.min_match = self.VARINT_MIN_MATCH
 
 
-    def __init__(self, data, control_bytes = 3,extension=""):
+    def __init__(self, data, control_bytes = 3,extension="", chain_depth=64, match_finder="hash", level=0, prefix=b"",
+                 varint=False):
         """
         Initializes the LZ77 compressor with the raw data and control byte length.
         :param data: data to compress as bytes
         :param control_bytes: (optional) number of control bytes to use default is 3
         :param extension: (optional) file extension
+        :param chain_depth: (optional) how many hash chain links the match finder follows per position, default is 64
+        :param match_finder: (optional) "hash" for the fast hash chain finder, "max" for the suffix array finder
+        :param level: (optional) parsing level, 0 greedy (default), 1 lazy, 2 optimal
+        :param prefix: (optional) data preceding this data, matches may point into it but it isn't tokenized
+        :param varint: (optional) whether tokens are serialized with varint fields instead of control bytes
         """
         self.logger = logging.getLogger(self.__class__.__name__)
 
@@ -187,194 +827,1589 @@ class LZ77(object):
             raise ValueError("control_byte_length must be between 1 and 15.")
         else: self.control_byte_length = control_bytes #Assigns this so _var_init can work it.
         self.extension = extension
+        self.chain_depth = chain_depth
+        if match_finder not in self.MATCH_FINDERS:
+            raise ValueError(f"match_finder must be one of {', '.join(self.MATCH_FINDERS)}.")
+        self.match_finder = match_finder
+        if level not in self.LEVELS:
+            raise ValueError("level must be 0 (greedy), 1 (lazy) or 2 (optimal).")
+        self.level = level
+        self.frame_version = 0 #set by __parse_header when decoding a framed stream
+        self.frame_flags = 0
+        self.dictionary_id = None #set by __parse_header when the stream was compressed with a preset dictionary
+        self.checksum = None #set by __parse_header for a single checksummed token stream
+        self.varint = varint
         print(f"Initialized LZ77 with extension: {self.extension}")
+        self._var_init()
         # Assume 'data' is a list or array of integers representing bytes
         #self.raw_data = np.array([bytes(i) for i in data], dtype=np.uint8)
-        self.raw_data = np.frombuffer(data, dtype=np.uint8)
-        self._var_init()
+        prefix = prefix[-self.window_size:] #matches can't reach further back, no point indexing more
+        self.start = len(prefix) #tokenizing starts after the prefix
+        self.literal_start = self.start #start of the open literal run
+        self.literal_length = 0 #length of the open literal run
+        self.compressed_data = [] #tokens, filled by tokenize
+        # A view, not a copy, so a memory mapped file (FileIO.open_mapped) is only paged in as it is read
+        self.raw_data = np.frombuffer(b"".join((prefix, data)) if prefix else data, dtype=np.uint8)
 
     @staticmethod
-    def compress(data, control_bytes=3, extension=""):
+    def compress(data, control_bytes=3, extension="", chain_depth=64, match_finder="hash", level=0, workers=1,
+                 block_size=None, prime=False, dictionary=None, long_range=False, varint=False, huffman=False,
+                 checksum=False):
         """
         Compresses the input data using LZ77.
         :param data: The raw data to compress (bytes-like).
-        :param control_bytes: The number of bytes for control structures.
+        :param control_bytes: The number of bytes for control structures, or "auto" to pick it by sampling the data
+        (see choose_control_bytes), per block when the blocks are independent.
         :param extension: File extension to encode in the header.
+        :param chain_depth: Hash chain links followed per position, higher searches harder for longer matches.
+        :param match_finder: "hash" (fast) or "max" (suffix array, always finds the longest match but slower).
+        :param level: Parsing level, 0 greedy (fastest), 1 lazy matching, 2 optimal parse (smallest output).
+        :param workers: Number of processes compressing blocks in parallel, more than 1 writes the framed format.
+        :param block_size: Bytes per block in the framed format, setting it writes the framed format.
+        :param prime: Whether blocks are primed with the window before them (better ratio, blocks no longer independent).
+        :param dictionary: Preset dictionary (Dictionary or bytes-like) the window is primed with, writes the framed format.
+        The same dictionary has to be passed to decompress.
+        :param long_range: Whether to also find repeats beyond the window, anywhere in the data (see
+        LongRangeMatchFinder), writes the framed format with primed blocks.
+        :param varint: Whether to write varint tokens, whose fields take as many bytes as their values need, so near
+        matches are cheap and far ones possible regardless of control_bytes. Writes the framed format.
+        :param huffman: Whether to Huffman code the control fields and literals of blocks where that makes them smaller
+        (see __huffman_encode), for up to 8 control bytes and not with varint tokens. Writes the framed format.
+        :param checksum: Whether to record the CRC-32 of every block's data, checked when decoding (see verify). Writes
+        the framed format, a single token stream unless blocks are asked for.
         :return: Compressed data as bytes.
         """
+        dictionary = Dictionary.of(dictionary)
+        framed = workers > 1 or block_size is not None or long_range or varint or huffman
+        if control_bytes == "auto" and not (framed and not (prime or long_range or dictionary or varint)):
+            # Only independent blocks can each have their own, varint tokens don't use it at all
+            control_bytes = 3 if varint else LZ77.choose_control_bytes(data)
+        options = dict(control_bytes=control_bytes, chain_depth=chain_depth, match_finder=match_finder, level=level,
+                       varint=varint)
+        if framed:
+            return LZ77.__compress_blocks(data, extension, workers, block_size or LZ77.BLOCK_SIZE, prime, options,
+                                          dictionary, long_range, huffman, checksum)
+
         # Initialize an instance for variable setup and helper methods
-        instance = LZ77(data, control_bytes,extension)
+        instance = LZ77(data, extension=extension, prefix=dictionary.data if dictionary else b"", **options)
         instance.tokenize()  # Generate tokens
         print(f"Raw Length: {len(data)}, Compressed Length: {len(instance.compressed_data)}")
-        print(f"Compression Ratio: {len(instance.compressed_data)/len(data)}")
+        if len(data) > 0:
+            print(f"Compression Ratio: {len(instance.compressed_data)/len(data)}")
+        if dictionary or checksum:
+            # One token stream like the 2-byte header format, but in a frame so the dictionary's id (and the checksum)
+            # can be recorded
+            header = instance.__generate_frame_header(dictionary, LZ77.FLAG_TOKENS |
+                                                      (LZ77.FLAG_CHECKSUM if checksum else 0))
+            header.append(instance.control_byte_length)
+            if checksum:
+                header.extend(LZ77.CHECKSUM.pack(zlib.crc32(data)))
+            serialized_data = instance.__serialize_tokens(header)
+            instance.__cleanup()
+            return bytes(serialized_data)
         return instance.encode()  # Serialize the compressed tokens
 
     @staticmethod
-    def decompress(to_decompress):
+    def compress_delta(new, reference, control_bytes=3, extension="", chain_depth=64, match_finder="hash", level=0,
+                       checksum=False):
+        """
+        Compresses new against a reference version of it, so only the differences take up space.
+        The reference is a virtual prefix of the window (a preset dictionary): matches point into it, nothing of it is
+        stored. Matches into the reference reach back over its whole length, so the control byte length is raised until
+        the window covers the reference and new together.
+        :param new: The raw data to compress (bytes-like).
+        :param reference: The reference data (bytes-like, or a Dictionary), needed again by decompress_delta.
+        :param control_bytes: Fewest control bytes to use, more are used when the window needs them.
+        :param extension: File extension to encode in the header.
+        :param chain_depth: Hash chain links followed per position, higher searches harder for longer matches.
+        :param match_finder: "hash" (fast) or "max" (suffix array, always finds the longest match but slower).
+        :param level: Parsing level, 0 greedy (fastest), 1 lazy matching, 2 optimal parse (smallest output).
+        :param checksum: Whether to record the CRC-32 of the data, checked when decoding.
+        :return: Compressed delta as bytes.
+        """
+        reference = Dictionary.of(reference)
+        probe = LZ77(b"", 1 if control_bytes == "auto" else control_bytes) #the window decides it anyway
+        while probe.window_size < len(reference) + len(new) and probe.control_byte_length < 15:
+            probe.control_byte_length += 1
+            probe._var_init()
+        return LZ77.compress(new, probe.control_byte_length, extension, chain_depth, match_finder, level,
+                             dictionary=reference, checksum=checksum)
+
+    @staticmethod
+    def compress_many(items, workers=None, **options):
+        """
+        Compresses several inputs concurrently on a thread pool.
+        All working state lives on the per-call LZ77 instances, so compress is safe to call from many threads at once.
+        :param items: iterable of data to compress (bytes-like)
+        :param workers: (optional) number of threads, defaults to ThreadPoolExecutor's default
+        :param options: keyword arguments for LZ77.compress, used for every item
+        :return: list of compressed data as bytes, in the order of items
+        """
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            return list(pool.map(lambda data: LZ77.compress(data, **options), items))
+
+    @staticmethod
+    def choose_control_bytes(data):
+        """
+        Picks the control byte length that should give the smallest output, for control_bytes="auto".
+        A few windows sampled from the data are tokenized once, quickly and with the loosest limits of any candidate
+        (2-byte matches, as far back as the sample is long, into the data before it). The encoded size of those tokens is then estimated for every
+        candidate from 1 to 15 with its _var_init bit layout: matches too short or too far for it turn into literals,
+        longer ones are split, and every literal run pays for its control bytes. Repeats further apart than a sample
+        can't be seen, so the wide windows of many control bytes are only picked when the samples show they pay off.
+        :param data: data to compress (bytes-like)
+        :return: control byte length, 1 to 15
+        """
+        view = np.frombuffer(memoryview(data).cast("B"), dtype=np.uint8)
+        # Samples make up an eighth of the data, within limits, so sampling stays a fraction of compressing
+        sample_size = max(LZ77.AUTO_SAMPLE // 4, min(LZ77.AUTO_SAMPLE, view.size // (8 * LZ77.AUTO_SAMPLES)))
+        if view.size <= LZ77.AUTO_SAMPLES * sample_size:
+            samples = [(0, view.size)]
+        else:
+            starts = np.linspace(0, view.size - sample_size, LZ77.AUTO_SAMPLES).astype(np.int64).tolist()
+            samples = [(start, start + sample_size) for start in starts]
+        if LZ77.incompressible(view):
+            # No matches to find, the data will be one literal run
+            match, length, dist = np.zeros(1, dtype=bool), np.array([view.size]), np.zeros(1, dtype=np.int64)
+        else:
+            match, length, dist = (np.concatenate(column) for column in
+                                   zip(*(LZ77.__sample_tokens(view, start, end) for start, end in samples)))
+
+        layout = LZ77(b"", 1)
+        best, best_size = 3, None
+        for control_byte_length in range(1, 16):
+            layout.control_byte_length = control_byte_length
+            layout._var_init()
+            usable = match & (length > control_byte_length) & (dist <= layout.max_distance)
+            pieces = int(np.ceil(length[usable] / layout.max_pointer_length).sum())
+            literal_bytes = int(length[~usable].sum())
+            # Tokens that can't be matches join the literal run before them, so runs start after usable matches
+            runs = int(np.count_nonzero(~usable & np.concatenate(([True], usable[:-1]))))
+            runs += literal_bytes // layout.max_literal_length
+            size = control_byte_length * (pieces + runs) + literal_bytes
+            if best_size is None or size < best_size:
+                best, best_size = control_byte_length, size
+        return best
+
+    @staticmethod
+    def __sample_tokens(view, start, end):
+        """
+        Greedy tokenization of a sample for choose_control_bytes.
+        :param view: np.uint8 array of the data
+        :param start: start of the sample, matches may reach back as far before it as the sample is long
+        :param end: end of the sample (exclusive)
+        :return: Tuple of np.arrays (True for matches, lengths, distances), literal runs are single tokens
+        """
+        sample = view[max(0, 2 * start - end):end]
+        finder = HashChainMatchFinder(sample, sample.size, 2, LZ77.AUTO_MAX_MATCH, LZ77.AUTO_CHAIN_DEPTH)
+        next_candidate = finder.next_candidate
+        match, length, dist = [], [], []
+        literal = 0
+        i = sample.size - (end - start)
+        # Runs are single tokens, as tokenize splits them by each candidate's longest match
+        runs = find_runs(sample, LZ77.RUN_MIN, LZ77.RUN_PERIOD, i) + [(sample.size, sample.size, 0)]
+        for run_start, run_end, period in runs:
+            while i < run_start:
+                if next_candidate[i] > i:
+                    literal += min(next_candidate[i], run_start) - i
+                    i = min(next_candidate[i], run_start)
+                    continue
+                match_length, match_dist = finder.find(i, min(sample.size - i - 1, run_start - i))
+                if match_length:
+                    if literal:
+                        match.append(False), length.append(literal), dist.append(0)
+                        literal = 0
+                    match.append(True), length.append(match_length), dist.append(match_dist)
+                    i += match_length
+                else:
+                    literal += 1
+                    i += 1
+            if run_end > run_start:
+                if literal:
+                    match.append(False), length.append(literal), dist.append(0)
+                    literal = 0
+                match.append(True), length.append(run_end - run_start), dist.append(period)
+                i = run_end
+        if literal:
+            match.append(False), length.append(literal), dist.append(0)
+        return np.array(match, dtype=bool), np.array(length, dtype=np.int64), np.array(dist, dtype=np.int64)
+
+    @staticmethod
+    def __compress_blocks(data, extension, workers, block_size, prime, options, dictionary=None, long_range=False,
+                          huffman=False, checksum=False):
+        """
+        Compresses the data as independent (or primed) blocks in the framed format, optionally across processes.
+        With long_range, repeats found by LongRangeMatchFinder are written as long range matches, and only the data
+        between them is tokenized.
+        :param data: The raw data to compress (bytes-like).
+        :param extension: File extension to encode in the header.
+        :param workers: Number of worker processes.
+        :param block_size: Bytes per block.
+        :param prime: Whether each block is primed with the window_size bytes before it.
+        :param options: keyword arguments for the per-block LZ77 instances
+        :param dictionary: (optional) Dictionary preceding the data, the first block (and any primed block) may reach into it
+        :param long_range: (optional) Whether to write long range matches, which implies prime
+        :param huffman: (optional) Whether to Huffman code the token streams of blocks without long range matches
+        :param checksum: (optional) Whether to follow every block's payload with the CRC-32 of its data
+        :return: Compressed data as bytes.
+        """
+        if block_size < 1:
+            raise ValueError("block_size must be at least 1.")
+        auto = options["control_bytes"] == "auto" #blocks are independent then, each gets its own
+        framer = LZ77(b"", 3 if auto else options["control_bytes"], extension, varint=options["varint"])
+        coder = LZ77(b"", 3) if huffman and not framer.varint else None #its layout follows each block's control bytes
+        view = memoryview(data).cast("B")
+        history = dictionary.data[-framer.window_size:] if dictionary else b""
+        starts = range(0, len(view), block_size)
+        repeats = LongRangeMatchFinder(np.frombuffer(view, dtype=np.uint8)).find() if long_range else []
+        segments = LZ77.__block_segments(starts, block_size, len(view), repeats)
+
+        # Spans between the long range matches are tokenized as usual, without long_range each block is one span
+        spans = [(start, end) for block in segments for start, end, distance in block if not distance]
+        # Spans and their prefixes are slices of the input, only prefixes reaching into the dictionary are copied
+        pieces = [view[start:end] for start, end in spans]
+        if prime or long_range:
+            prefixes = [view[start - framer.window_size:start] if start >= framer.window_size else
+                        history[len(history) - (framer.window_size - start):] + bytes(view[:start])
+                        for start, _ in spans]
+        else:
+            prefixes = [history if start == 0 else b"" for start, _ in spans]
+
+        if auto:
+            span_options = [dict(options, control_bytes=LZ77.choose_control_bytes(piece)) for piece in pieces]
+        else:
+            span_options = [options] * len(pieces)
+
+        if workers > 1 and len(pieces) > 1:
+            # Memoryviews can't be pickled, the worker processes get copies
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                payloads = list(pool.map(LZ77._compress_block, map(bytes, pieces), map(bytes, prefixes), span_options))
+        else:
+            payloads = list(map(LZ77._compress_block, pieces, prefixes, span_options))
+
+        header = framer.__generate_frame_header(dictionary, LZ77.FLAG_CHECKSUM if checksum else 0)
+        serialized_data = bytearray(header)
+        index = bytearray()
+        raw_offset = 0
+        spans = iter(zip(prefixes, payloads, span_options))
+        for block in segments:
+            payload = bytearray()
+            primed = long_matches = False
+            control_byte_length = framer.control_byte_length
+            for start, end, distance in block:
+                if distance:
+                    payload.extend(framer.__serialize_long_match(distance, end - start))
+                    long_matches = True
+                else:
+                    prefix, span_payload, span_option = next(spans)
+                    payload.extend(span_payload)
+                    primed = primed or bool(prefix)
+                    control_byte_length = span_option["control_bytes"]
+            raw_length = block[-1][1] - block[0][0]
+            huffman_coded = False
+            if coder and not long_matches and control_byte_length <= 8:
+                coder.control_byte_length = control_byte_length
+                coder._var_init()
+                coded = coder.__huffman_encode(payload)
+                if len(coded) < len(payload):
+                    payload, huffman_coded = coded, True
+            if not long_matches and len(payload) >= raw_length:
+                # Tokens don't pay off, store the block as is
+                payload = view[block[0][0]:block[-1][1]]
+                block_type = LZ77.BLOCK_STORED
+            elif framer.varint:
+                block_type = LZ77.BLOCK_VARINT | (LZ77.BLOCK_PRIMED if primed or long_matches else 0)
+            elif long_matches:
+                block_type = LZ77.BLOCK_LONG | LZ77.BLOCK_PRIMED
+            else:
+                block_type = LZ77.BLOCK_TOKENS | (LZ77.BLOCK_PRIMED if primed else 0) | \
+                             (LZ77.BLOCK_HUFFMAN if huffman_coded else 0)
+            index.extend(LZ77.INDEX_ENTRY.pack(len(serialized_data) - len(header), raw_offset, raw_length))
+            raw_offset += raw_length
+            serialized_data.extend(LZ77.BLOCK_HEADER.pack(block_type, control_byte_length, raw_length, len(payload)))
+            serialized_data.extend(payload)
+            if checksum:
+                serialized_data.extend(LZ77.CHECKSUM.pack(zlib.crc32(view[block[0][0]:block[-1][1]])))
+        serialized_data.append(LZ77.BLOCK_END)
+
+        # Block index trailer, the footer at the very end tells readers where the index starts
+        index_offset = len(serialized_data) - len(header)
+        serialized_data.extend(index)
+        serialized_data.extend(LZ77.INDEX_FOOTER.pack(index_offset, len(segments), LZ77.INDEX_MAGIC))
+        return bytes(serialized_data)
+
+    @staticmethod
+    def __block_segments(starts, block_size, size, repeats):
+        """
+        Splits each block at the long range matches that fall in it, a match crossing a block boundary is split in two.
+        :param starts: block starts
+        :param block_size: bytes per block
+        :param size: length of the data
+        :param repeats: long range matches from LongRangeMatchFinder.find, Tuples (start, length, distance)
+        :return: list with one list per block of Tuples (start, end, distance), distance 0 for spans tokenized as usual
+        """
+        segments = []
+        k = 0
+        for start in starts:
+            end = min(start + block_size, size)
+            block = []
+            position = start
+            while k < len(repeats) and repeats[k][0] < end:
+                repeat_start, length, distance = repeats[k]
+                repeat_end = min(repeat_start + length, end)
+                if position < repeat_start:
+                    block.append((position, repeat_start, 0))
+                block.append((max(repeat_start, position), repeat_end, distance))
+                position = repeat_end
+                if repeat_start + length > end:
+                    break #continues in the next block
+                k += 1
+            if position < end:
+                block.append((position, end, 0))
+            segments.append(block)
+        return segments
+
+    @staticmethod
+    def _compress_block(block, prefix, options):
+        """
+        Tokenizes and serializes one block, runs in the worker processes (so it can't be name mangled).
+        :param block: block data (bytes-like)
+        :param prefix: data (bytes-like) before the block that matches may point into, empty for independent blocks
+        :param options: keyword arguments for the LZ77 instance
+        :return: the block's token stream as bytes (no header)
+        """
+        instance = LZ77(block, prefix=prefix, **options)
+        instance.tokenize()
+        payload = instance.__serialize_tokens()
+        instance.__cleanup()
+        return payload
+
+    @staticmethod
+    def decompress(to_decompress, workers=1, out=None, dictionary=None):
         """
         Decompresses the compressed data using LZ77.
         :param to_decompress: The compressed data to decompress (bytes-like).
-        :return: Tuple (decompressed data as bytes, file extension as string).
+        :param workers: Number of processes decoding independent blocks of an indexed framed stream in parallel.
+        :param out: Writable buffer of exactly the decompressed size (see uncompressed_size) to decode into, such as a
+        FileIO.create_mapped file. Returned in place of bytes.
+        :param dictionary: The preset dictionary the data was compressed with, if any.
+        :return: Tuple (decompressed data as bytes, or out, file extension as string).
         """
         #Create an instance to decompress the data
         instance = LZ77(b"")  # Initialize with dummy data
-        decompressed_data = instance.decode(to_decompress)
+        decompressed_data = instance.decode(to_decompress, workers, out, dictionary)
         return decompressed_data, instance.extension
 
-    def encode(self):
+    @staticmethod
+    def decompress_delta(delta, reference, out=None):
         """
-        Encodes the compressed data into a byte stream.
-        :return: Serialized byte stream of the compressed data.
+        Decompresses a delta made by compress_delta.
+        :param delta: The compressed delta (bytes-like).
+        :param reference: The reference data it was compressed against, checked against the id recorded in the delta.
+        :param out: Writable buffer of exactly the decompressed size to decode into, returned in place of bytes.
+        :return: Tuple (decompressed data as bytes, or out, file extension as string).
         """
-        #init serialized data array
-        serialized_data = bytearray()
-        # Generate header, and prepend to data
-        header = self.__generate_header()
-        serialized_data.extend(header)
-
-        # Generate bitmasks for literals and pointers
-        signal_mask = 0b1 << (self.total_bits - 1)  # MSB is the signal bit
-        length_mask = (1 << self.literal_length_bits) - 1
-        distance_mask = (1 << self.pointer_distance_bits) - 1
+        return LZ77.decompress(delta, out=out, dictionary=reference)
 
-        # Iterate over the compressed data and serialize each token
-        for token in self.compressed_data:
-            if isinstance(token, MatchToken):
-                # Signal flag is 1
-                signal_and_length = signal_mask | ((token.length & length_mask) << self.pointer_distance_bits)
-                signal_and_length |= (token.dist & distance_mask)
+    @staticmethod
+    def decompress_range(to_decompress, start, end, dictionary=None):
+        """
+        Decompresses only the bytes start to end (exclusive) of the original data.
+        For indexed framed streams only the blocks overlapping the range are decoded (from the first block if they are
+        primed, as they depend on the blocks before them), any other stream is decoded in full and sliced.
+        :param to_decompress: The compressed data (bytes-like), only the blocks needed are read from it.
+        :param start: First byte of the range, in the uncompressed data.
+        :param end: End of the range (exclusive), in the uncompressed data.
+        :param dictionary: The preset dictionary the data was compressed with, if any.
+        :return: The decompressed range as bytes.
+        """
+        if start < 0 or end < start:
+            raise ValueError("Invalid range, expected 0 <= start <= end.")
+        instance = LZ77(b"")
+        control_byte_length, extension, frame = instance.__parse_header(memoryview(to_decompress).cast("B"))
+        instance.extension = extension
+        if control_byte_length != 0 or instance.frame_version < 2:
+            return instance.decode(to_decompress, dictionary=dictionary)[start:end]
+        history = instance.__dictionary_history(dictionary)
+
+        entries = instance.__read_index(frame)
+        needed = [k for k, (_, raw_offset, raw_length) in enumerate(entries)
+                  if raw_offset < end and raw_offset + raw_length > start]
+        if not needed:
+            return b""
+        blocks = [instance.__read_block(frame, entries[k][0]) for k in needed]
+        if any(block_type & instance.BLOCK_PRIMED for block_type, *_ in blocks):
+            # Primed blocks reach back into the blocks before them, so everything up to the range has to be decoded
+            needed = list(range(needed[-1] + 1))
+            blocks = [instance.__read_block(frame, entries[k][0]) for k in needed]
+        if any(raw_length != entries[k][2] for k, (_, _, raw_length, *_) in zip(needed, blocks)):
+            raise ValueError("Block index doesn't match the blocks in framed stream.")
+
+        # The dictionary goes before the blocks, for a primed first block to reach into
+        decompressed_data = bytearray(history) + bytearray(sum(raw_length for _, _, raw_length, *_ in blocks))
+        base = entries[needed[0]][1] - len(history)
+        position = len(history)
+        for block_type, control_byte_length, raw_length, payload, checksum, _ in blocks:
+            floor = 0 if block_type & instance.BLOCK_PRIMED else position
+            position = instance.__decode_block(control_byte_length, raw_length, payload, decompressed_data, position, floor,
+                                               block_type, checksum)
+        instance.__cleanup()
+        return bytes(decompressed_data[max(len(history), start - base):max(len(history), end - base)])
 
-                # Write exactly `control_byte_length` bytes for the control field
-                control_bytes = signal_and_length.to_bytes(self.control_byte_length, 'big')
-                serialized_data.extend(control_bytes)
+    @staticmethod
+    def uncompressed_size(compressed):
+        """
+        Finds the size of the decompressed data without decompressing it.
+        Framed streams carry it in their block index (or block headers), streams with the 2-byte header only need the
+        first decoding pass over their control fields.
+        :param compressed: The compressed data (bytes-like).
+        :return: Size of the decompressed data in bytes.
+        """
+        instance = LZ77(b"")
+        control_byte_length, _, stream = instance.__parse_header(memoryview(compressed).cast("B"))
+        if control_byte_length == 0:
+            if instance.frame_version >= 2:
+                return sum(raw_length for _, _, raw_length in instance.__read_index(stream))
+            return sum(raw_length for _, _, raw_length, _, _ in instance.__read_blocks(stream))
+        instance.control_byte_length = control_byte_length
+        instance._var_init()
+        size, _ = instance.__scan_tokens(stream)
+        return size
 
-            elif isinstance(token, LiteralToken):
-                # Signal flag is 0
-                signal_and_length = (token.length & ((1 << (self.total_bits - 1)) - 1))
+    @staticmethod
+    def verify(to_verify, dictionary=None, workers=1):
+        """
+        Checks that compressed data decodes, and matches its checksums, without keeping the decompressed data.
+        Framed streams are decoded a block at a time, keeping only the window primed blocks may reach back into (all the
+        output before them once long range matches occur), and checked against their block index. Frames of independent
+        blocks are checked across processes with workers > 1. Streams without blocks are decoded in full.
+        :param to_verify: The compressed data (bytes-like), such as a FileIO.open_mapped file.
+        :param dictionary: The preset dictionary the data was compressed with, if any.
+        :param workers: Number of processes checking independent blocks in parallel.
+        :return: Tuple (size of the decompressed data, whether it carried checksums), raises ValueError if it is corrupt.
+        """
+        instance = LZ77(b"")
+        control_byte_length, _, frame = instance.__parse_header(memoryview(to_verify).cast("B"))
+        if control_byte_length != 0:
+            size = len(instance.decode(to_verify, dictionary=dictionary))
+            return size, instance.checksum is not None
+        history = instance.__dictionary_history(dictionary)
+        checksummed = bool(instance.frame_flags & instance.FLAG_CHECKSUM)
+
+        blocks = []
+        expected = [] #index entries the blocks call for
+        offset = raw_offset = 0
+        while offset < len(frame) and frame[offset] != instance.BLOCK_END:
+            block_type, control_byte_length, raw_length, payload, checksum, next_offset = instance.__read_block(frame, offset)
+            blocks.append((block_type, control_byte_length, raw_length, payload, checksum))
+            expected.append((offset, raw_offset, raw_length))
+            offset = next_offset
+            raw_offset += raw_length
+        if offset >= len(frame):
+            raise ValueError("Framed stream ended without an end block.")
+        if instance.frame_version >= 2 and instance.__read_index(frame) != expected:
+            raise ValueError("Block index doesn't match the blocks in framed stream.")
+
+        if workers > 1 and len(blocks) > 1 and not any(block_type & instance.BLOCK_PRIMED for block_type, *_ in blocks):
+            block_types, control_byte_lengths, raw_lengths, payloads, checksums = zip(
+                *[(block_type, cb, raw_length, bytes(payload), checksum)
+                  for block_type, cb, raw_length, payload, checksum in blocks])
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                list(pool.map(LZ77._verify_block, control_byte_lengths, raw_lengths, payloads, block_types, checksums))
+            return raw_offset, checksummed
+
+        # The most any later block may reach back, None for long range matches, which may reach anywhere
+        keep = 0
+        for block_type, control_byte_length, *_ in blocks:
+            if block_type & ~instance.BLOCK_PRIMED == instance.BLOCK_LONG:
+                keep = None
+                break
+            if block_type & instance.BLOCK_PRIMED:
+                instance.control_byte_length = control_byte_length
+                instance.varint = block_type & ~instance.BLOCK_PRIMED == instance.BLOCK_VARINT
+                instance._var_init()
+                keep = max(keep, instance.window_size)
+        window = bytearray(history)
+        for block_type, control_byte_length, raw_length, payload, checksum in blocks:
+            position = len(window)
+            floor = 0 if block_type & instance.BLOCK_PRIMED else position
+            window.extend(bytes(raw_length))
+            instance.__decode_block(control_byte_length, raw_length, payload, window, position, floor, block_type,
+                                    checksum)
+            if keep is not None:
+                del window[:max(0, len(window) - keep)]
+        instance.__cleanup()
+        return raw_offset, checksummed
 
-                # Write exactly `control_byte_length` bytes for the control field
-                control_bytes = signal_and_length.to_bytes(self.control_byte_length, 'big')
-                serialized_data.extend(control_bytes)
+    @staticmethod
+    def _verify_block(control_byte_length, raw_length, payload, block_type, checksum):
+        """
+        Decodes and checks one independent block for verify, runs in the worker processes (so it can't be name mangled).
+        :param control_byte_length: control byte length from the block header
+        :param raw_length: uncompressed length from the block header
+        :param payload: the block's payload as bytes
+        :param block_type: type from the block header
+        :param checksum: CRC-32 from the block, or None
+        :return: None, raises ValueError if the block is corrupt
+        """
+        LZ77._decode_block(control_byte_length, raw_length, payload, b"", block_type, checksum)
 
-                # Add the literal data
-                serialized_data.extend(token.data)
+    @staticmethod
+    def _decode_block(control_byte_length, raw_length, payload, history=b"", block_type=0, checksum=None):
+        """
+        Decodes one block, runs in the worker processes (so it can't be name mangled).
+        :param control_byte_length: control byte length from the block header
+        :param raw_length: uncompressed length from the block header
+        :param payload: the block's token stream as bytes
+        :param history: (optional) output before the block, which primed blocks may copy from
+        :param block_type: (optional) type from the block header
+        :param checksum: (optional) CRC-32 from the block, checked after decoding
+        :return: the decoded block as bytes (without the history)
+        """
+        instance = LZ77(b"")
+        decompressed_data = bytearray(len(history) + raw_length)
+        decompressed_data[:len(history)] = history
+        instance.__decode_block(control_byte_length, raw_length, payload, decompressed_data, len(history), 0, block_type,
+                                checksum)
+        return bytes(memoryview(decompressed_data)[len(history):])
 
-            else:
-                raise ValueError("Unknown token type encountered during encoding")
+    def encode(self):
+        """
+        Encodes the compressed data into a byte stream.
+        :return: Serialized byte stream of the compressed data.
+        """
+        # Serialize the tokens straight after the header
+        serialized_data = self.__serialize_tokens(self.__generate_header())
 
         # Return the serialized byte stream
         self.__cleanup()
         return bytes(serialized_data)
 
-    def decode(self, compressed_bytes):
+    def __serialize_tokens(self, header=b""):
+        """
+        Serializes the tokens in self.compressed_data.
+        :param header: (optional) bytes written before the tokens
+        :return: header and token stream as a bytearray
+        """
+        tokens = self.compressed_data
+        serialize = self.__serialize_varint_columns if self.varint else self.__serialize_columns
+        if isinstance(tokens, TokenStore):
+            return serialize(*tokens.columns(), self.raw_data, header)
+
+        # Token objects (built by hand), gather them into columns
+        if not {type(token) for token in tokens} <= {MatchToken, LiteralToken}:
+            raise ValueError("Unknown token type encountered during encoding")
+        match = np.array([token.type for token in tokens], dtype=bool)
+        length = np.array([token.length for token in tokens], dtype=np.uint64)
+        dist = np.zeros(match.size, dtype=np.uint64)
+        dist[match] = [token.dist for token in tokens if token.type]
+        # Literal runs become spans of their bytes concatenated
+        literals = np.frombuffer(bytes(chain.from_iterable(token.data for token in tokens if not token.type)),
+                                 dtype=np.uint8)
+        run_lengths = np.where(match, 0, length).astype(np.int64)
+        start = np.where(match, 0, np.cumsum(run_lengths) - run_lengths)
+        return serialize(match, length, dist, start, literals, header)
+
+    def __serialize_columns(self, match, length, dist, start, source, header=b""):
+        """
+        Serializes tokens given as columns, packing every control field with NumPy, into one preallocated buffer.
+        Control fields are placed with a single scatter; literal runs are copied from source without intermediate
+        copies, long runs as memoryview slices and the many short ones with one gather.
+        :param match: np.array of bool, True for match tokens
+        :param length: np.array of token lengths (match length, or literal run length)
+        :param dist: np.array of match distances (ignored for literals)
+        :param start: np.array of literal run starts in source (ignored for matches)
+        :param source: np.uint8 array holding the literal bytes
+        :param header: (optional) bytes written before the tokens
+        :return: header and token stream as a bytearray
+        """
+        cb = self.control_byte_length
+        def mask(limit):
+            # Wide control fields have limits beyond 64 bits, those don't mask anything
+            return np.uint64(min(limit, (1 << 64) - 1))
+        length = length.astype(np.uint64)
+        match_length = np.where(match, length & mask(self.max_pointer_length), 0).astype(np.uint64)
+        literal_length = np.where(match, 0, length & mask(self.max_literal_length)).astype(np.uint64)
+        dist = np.where(match, dist.astype(np.uint64) & mask(self.max_distance), 0).astype(np.uint64)
+        signal = match.astype(np.uint64)
+
+        # Each part of the control field sits at a fixed bit offset, so every byte of the field (most significant
+        # first) is the OR of the parts shifted into that byte. Working a byte at a time keeps every shift within
+        # 64 bits, so this works for all control byte lengths.
+        parts = ((signal, self.total_bits - 1), (match_length, self.pointer_distance_bits), (dist, 0),
+                 (literal_length, 0))
+        control = np.zeros((match.size, cb), dtype=np.uint8)
+        for k in range(cb):
+            low_bit = 8 * (cb - 1 - k)
+            byte = np.zeros(match.size, dtype=np.uint64)
+            for part, offset in parts:
+                shift = offset - low_bit
+                if 0 <= shift < 8:
+                    byte |= part << np.uint64(shift)
+                elif -64 < shift < 0:
+                    byte |= part >> np.uint64(-shift)
+            control[:, k] = byte & np.uint64(0xFF)
+
+        # Every token is its control field, literal runs are followed by their bytes
+        sizes = cb + literal_length.astype(np.int64)
+        starts = len(header) + np.cumsum(sizes) - sizes
+        serialized_data = bytearray(len(header) + int(sizes.sum()))
+        serialized_data[:len(header)] = header
+        serialized = np.frombuffer(serialized_data, dtype=np.uint8) #writes through to serialized_data
+        serialized[(starts[:, None] + np.arange(cb)).ravel()] = control.ravel()
+
+        self.__copy_literal_runs(serialized_data, serialized, starts[~match] + cb, start[~match],
+                                 literal_length[~match], source)
+        del serialized #release the buffer
+        return serialized_data
+
+    def __serialize_varint_columns(self, match, length, dist, start, source, header=b""):
+        """
+        Serializes tokens given as columns as varint tokens, the varint counterpart of __serialize_columns.
+        :param match: np.array of bool, True for match tokens
+        :param length: np.array of token lengths (match length, or literal run length)
+        :param dist: np.array of match distances (ignored for literals)
+        :param start: np.array of literal run starts in source (ignored for matches)
+        :param source: np.uint8 array holding the literal bytes
+        :param header: (optional) bytes written before the tokens
+        :return: header and token stream as a bytearray
+        """
+        length = length.astype(np.uint64)
+        tag = (length << np.uint64(1)) | match.astype(np.uint64)
+        dist = dist.astype(np.uint64)[match]
+        tag_sizes = varint_sizes(tag)
+        dist_sizes = varint_sizes(dist)
+        literal_length = np.where(match, 0, length).astype(np.int64)
+
+        # Every token is its tag, then the distance of a match or the bytes of a literal run
+        sizes = tag_sizes + literal_length
+        sizes[match] += dist_sizes
+        starts = len(header) + np.cumsum(sizes) - sizes
+        serialized_data = bytearray(len(header) + int(sizes.sum()))
+        serialized_data[:len(header)] = header
+        serialized = np.frombuffer(serialized_data, dtype=np.uint8)
+        scatter_varints(serialized, starts, tag, tag_sizes)
+        scatter_varints(serialized, (starts + tag_sizes)[match], dist, dist_sizes)
+        self.__copy_literal_runs(serialized_data, serialized, (starts + tag_sizes)[~match], start[~match],
+                                 literal_length[~match], source)
+        del serialized
+        return serialized_data
+
+    def __copy_literal_runs(self, serialized_data, serialized, positions, run_starts, run_lengths, source):
+        """
+        Copies literal runs from source into the serialized tokens, long runs as memoryview slices and the many short
+        ones with one gather.
+        :param serialized_data: bytearray of the serialized tokens
+        :param serialized: np.uint8 view of serialized_data
+        :param positions: np.array of where each run goes in serialized_data
+        :param run_starts: np.array of where each run starts in source
+        :param run_lengths: np.array of run lengths
+        :param source: np.uint8 array holding the literal bytes
+        :return: None
+        """
+        run_starts = run_starts.astype(np.int64)
+        run_lengths = run_lengths.astype(np.int64)
+        long_run = run_lengths >= self.LONG_RUN
+        short_run = ~long_run
+        serialized[span_indices(positions[short_run], run_lengths[short_run])] = \
+            source[span_indices(run_starts[short_run], run_lengths[short_run])]
+        literal_view = memoryview(source)
+        for position, run_start, run_length in zip(positions[long_run].tolist(), run_starts[long_run].tolist(),
+                                                   run_lengths[long_run].tolist()):
+            serialized_data[position:position + run_length] = literal_view[run_start:run_start + run_length]
+        del literal_view
+
+    def __huffman_encode(self, payload):
+        """
+        Huffman codes a token stream (see Huffman), for BLOCK_HUFFMAN blocks. The control fields are split into a column
+        per byte, the first holding the signal bit and the high bits of the lengths and the rest the distances, and each
+        column gets a code of its own, as do the literal bytes. Coded, the columns then the literals follow each other.
+        Uses the control byte layout currently set by _var_init, of at most 8 control bytes.
+        :param payload: token stream as bytes-like
+        :return: the Huffman coded token stream as bytes
+        """
+        _, tokens = self.__scan_tokens(payload)
+        data = np.frombuffer(payload, dtype=np.uint8)
+        offset, literal = tokens["offset"], ~tokens["match"]
+        columns = [data[offset + k] for k in range(self.control_byte_length)]
+        literals = data[span_indices(offset[literal] + self.control_byte_length, tokens["length"][literal])]
+        return b"".join(Huffman.encode(stream) for stream in columns + [literals])
+
+    def __huffman_decode(self, payload, raw_length):
+        """
+        Rebuilds the token stream of a BLOCK_HUFFMAN block from its Huffman coded columns and literals.
+        Uses the control byte layout currently set by _var_init.
+        :param payload: the block's payload
+        :param raw_length: uncompressed length from the block header, no block holds more tokens or literal bytes
+        :return: token stream as a bytearray
+        """
+        control_byte_length = self.control_byte_length
+        streams = []
+        i = 0
+        for _ in range(control_byte_length + 1):
+            stream, i = Huffman.decode(payload, i, raw_length)
+            streams.append(stream)
+        literals = streams.pop()
+        if i != len(payload) or any(column.size != streams[0].size for column in streams):
+            raise ValueError("Invalid Huffman coded block in framed stream.")
+
+        fields = np.zeros(streams[0].size, dtype=np.uint64)
+        for column in streams:
+            fields = (fields << np.uint64(8)) | column
+        signal_bit = np.uint64(1 << (self.total_bits - 1))
+        match = (fields & signal_bit) != 0
+        literal_length = np.where(match, 0, fields & (signal_bit - np.uint64(1)))
+        if (literal_length > raw_length).any() or int(literal_length.sum()) != literals.size:
+            raise ValueError("Invalid Huffman coded block in framed stream.")
+
+        # Every token is its control field, literal runs are followed by their bytes
+        literal_length = literal_length.astype(np.int64)
+        sizes = control_byte_length + literal_length
+        starts = np.cumsum(sizes) - sizes
+        token_stream = bytearray(int(sizes.sum()))
+        serialized = np.frombuffer(token_stream, dtype=np.uint8)
+        serialized[(starts[:, None] + np.arange(control_byte_length)).ravel()] = np.stack(streams, axis=1).ravel()
+        serialized[span_indices(starts[~match] + control_byte_length, literal_length[~match])] = literals
+        del serialized
+        return token_stream
+
+    def decode(self, compressed_bytes, workers=1, out=None, dictionary=None):
         """
         Decodes the compressed byte stream into the original data. Reads header to find control byte length.
         :param compressed_bytes: compressed LZ77 data as bytes
-        :return: decoded data as bytes
+        :param workers: (optional) processes decoding the blocks of an indexed framed stream, default is 1
+        :param out: (optional) writable buffer of exactly the decoded size, decoded into instead of a new bytearray
+        :param dictionary: (optional) preset dictionary the stream was compressed with
+        :return: decoded data as bytes, or out when given
         """
-        # Parse the header
-        control_byte_length, extension, compressed_bytes = self.__parse_header(compressed_bytes)
-        self.control_byte_length = control_byte_length
+        # Parse the header, through a memoryview so the rest of the stream isn't copied
+        control_byte_length, extension, compressed_bytes = self.__parse_header(memoryview(compressed_bytes).cast("B"))
         self.extension = extension
-        self._var_init() #updates the rest of the vars accordingly
+        history = self.__dictionary_history(dictionary)
 
-        decompressed_data = bytearray()
-        i = 0
+        if control_byte_length == 0:
+            if workers > 1 and self.frame_version >= 2 and not history:
+                decompressed_data = self.__decode_frame_parallel(compressed_bytes, workers, out)
+            else:
+                decompressed_data = self.__decode_frame(compressed_bytes, out, history)
+        else:
+            self.control_byte_length = control_byte_length
+            self._var_init() #updates the rest of the vars accordingly
+            # No block headers give the size, so a first pass over the control fields works it out
+            size, tokens = self.__scan_tokens(compressed_bytes)
+            decompressed_data = self.__history_buffer(history, size, out)
+            self.__fill_tokens(compressed_bytes, tokens, decompressed_data, len(history))
+            if self.checksum is not None:
+                self.__check(decompressed_data, len(history), len(history) + size, self.checksum)
+            decompressed_data = self.__without_history(decompressed_data, history, out)
 
-        while i < len(compressed_bytes):
-            # Read exactly `control_byte_length` bytes for the control field
-            signal_and_length = int.from_bytes(compressed_bytes[i:i + self.control_byte_length], 'big')
-            i += self.control_byte_length
+        self.__cleanup()
+        if out is not None:
+            return out
+        return bytes(decompressed_data)
 
-            # Extract the signal bit (MSB)
-            signal_flag = (signal_and_length >> (self.total_bits - 1)) & 0b1
+    @staticmethod
+    def __output_buffer(size, out):
+        """
+        The buffer decoding writes to, allocated here unless the caller passed one.
+        :param size: decoded size
+        :param out: writable buffer from the caller, or None
+        :return: bytearray of size bytes, or out
+        """
+        if out is None:
+            return bytearray(size)
+        if len(out) != size:
+            raise ValueError(f"Output buffer holds {len(out)} bytes, the decoded data is {size} bytes.")
+        return out
+
+    def __history_buffer(self, history, size, out):
+        """
+        The buffer decoding writes to when a dictionary precedes the data: the dictionary, then room for the data.
+        :param history: dictionary data, empty when there is none
+        :param size: decoded size
+        :param out: writable buffer from the caller, or None
+        :return: bytearray with the decoded data to start at len(history), or the output buffer when there's no history
+        """
+        if not history:
+            return self.__output_buffer(size, out)
+        decompressed_data = bytearray(len(history) + size)
+        decompressed_data[:len(history)] = history
+        return decompressed_data
+
+    def __without_history(self, decompressed_data, history, out):
+        """
+        The decoded data without the dictionary before it, copied to the caller's buffer if there is one.
+        :param decompressed_data: buffer from __history_buffer, after decoding
+        :param history: dictionary data, empty when there is none
+        :param out: writable buffer from the caller, or None
+        :return: the decoded data (a view of decompressed_data), or out
+        """
+        if not history:
+            return decompressed_data
+        decoded = memoryview(decompressed_data)[len(history):]
+        if out is None:
+            return decoded
+        self.__output_buffer(len(decoded), out)[:] = decoded
+        return out
+
+    def __dictionary_history(self, dictionary):
+        """
+        Checks the dictionary against the id recorded in the stream's header.
+        :param dictionary: Dictionary (or its data) given by the caller, or None
+        :return: the dictionary's data, empty if the stream wasn't compressed with one
+        """
+        if self.dictionary_id is None:
+            return b""
+        dictionary = Dictionary.of(dictionary)
+        if dictionary is None:
+            raise ValueError(f"Stream was compressed with dictionary (or delta reference) {self.dictionary_id:08x}, which wasn't given.")
+        if dictionary.id != self.dictionary_id:
+            raise ValueError(f"Stream was compressed with dictionary (or delta reference) {self.dictionary_id:08x}, not {dictionary.id:08x}.")
+        return dictionary.data
+
+    def __decode_frame(self, frame, out=None, history=b""):
+        """
+        Decodes the blocks of a framed stream.
+        The block headers are read first, so the output is allocated once at its final size.
+        :param frame: framed stream, after the header
+        :param out: (optional) writable buffer of the decoded size to decode into
+        :param history: (optional) dictionary data preceding the first block, primed blocks may copy from it
+        :return: decoded data as a bytearray (or a view of one), or out
+        """
+        blocks = self.__read_blocks(frame)
+        raw_lengths = [raw_length for _, _, raw_length, _, _ in blocks]
+        if self.frame_version >= 2 and raw_lengths != [raw_length for _, _, raw_length in self.__read_index(frame)]:
+            # Checked before allocating the output, block headers claiming too much are caught here
+            raise ValueError("Block index doesn't match the blocks in framed stream.")
+        decompressed_data = self.__history_buffer(history, sum(raw_lengths), out)
+        position = len(history)
+        for block_type, control_byte_length, raw_length, payload, checksum in blocks:
+            # Independent blocks may not reach back past their own start
+            floor = 0 if block_type & self.BLOCK_PRIMED else position
+            position = self.__decode_block(control_byte_length, raw_length, payload, decompressed_data, position, floor,
+                                           block_type, checksum)
+        return self.__without_history(decompressed_data, history, out)
+
+    def __decode_frame_parallel(self, frame, workers, out=None):
+        """
+        Decodes the blocks of an indexed framed stream across processes.
+        Primed blocks depend on the blocks before them, so frames holding any are decoded sequentially instead.
+        :param frame: framed stream, after the header
+        :param workers: number of worker processes
+        :param out: (optional) writable buffer of the decoded size to decode into
+        :return: decoded data as a bytearray, or out
+        """
+        entries = self.__read_index(frame)
+        blocks = [self.__read_block(frame, offset) for offset, _, _ in entries]
+        if len(blocks) < 2 or any(block_type & self.BLOCK_PRIMED for block_type, *_ in blocks):
+            return self.__decode_frame(frame, out)
+
+        block_types, control_byte_lengths, raw_lengths, payloads, checksums = zip(
+            *[(block_type, cb, raw_length, bytes(payload), checksum)
+              for block_type, cb, raw_length, payload, checksum, _ in blocks])
+        decompressed_data = self.__output_buffer(sum(raw_lengths), out)
+        position = 0
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            decoded_blocks = pool.map(LZ77._decode_block, control_byte_lengths, raw_lengths, payloads, repeat(b""),
+                                      block_types, checksums)
+            for (_, raw_offset, _), decoded in zip(entries, decoded_blocks):
+                if position != raw_offset:
+                    raise ValueError("Block index doesn't match the blocks in framed stream.")
+                decompressed_data[position:position + len(decoded)] = decoded
+                position += len(decoded)
+        return decompressed_data
+
+    def __read_blocks(self, frame):
+        """
+        Reads the block headers of a framed stream, up to its end block.
+        :param frame: framed stream, after the header
+        :return: list of Tuples (block type, control byte length, raw length, payload, checksum or None), one per block
+        """
+        blocks = []
+        offset = 0
+        while True:
+            if offset >= len(frame):
+                raise ValueError("Framed stream ended without an end block.")
+            if frame[offset] == self.BLOCK_END:
+                return blocks
+            block_type, control_byte_length, raw_length, payload, checksum, offset = self.__read_block(frame, offset)
+            blocks.append((block_type, control_byte_length, raw_length, payload, checksum))
+
+    def __read_block(self, frame, offset):
+        """
+        Reads and checks the block header at offset.
+        :param frame: framed stream, after the header
+        :param offset: offset of the block header in frame
+        :return: Tuple (block type, control byte length, raw length, payload, checksum (None unless the frame has
+        FLAG_CHECKSUM), offset of the next block)
+        """
+        if offset + self.BLOCK_HEADER.size > len(frame):
+            raise ValueError("Truncated block header in framed stream.")
+        block_type, control_byte_length, raw_length, payload_length = self.BLOCK_HEADER.unpack_from(frame, offset)
+        offset += self.BLOCK_HEADER.size
+        payload = frame[offset:offset + payload_length]
+        offset += payload_length
+        checksum = None
+        if self.frame_flags & self.FLAG_CHECKSUM:
+            offset += self.CHECKSUM.size
+            if offset <= len(frame):
+                checksum, = self.CHECKSUM.unpack_from(frame, offset - self.CHECKSUM.size)
+        if offset > len(frame):
+            raise ValueError("Truncated block in framed stream.")
+
+        if block_type & ~self.BLOCK_PRIMED not in (self.BLOCK_TOKENS, self.BLOCK_LONG, self.BLOCK_VARINT,
+                                                   self.BLOCK_STORED, self.BLOCK_TOKENS | self.BLOCK_HUFFMAN):
+            raise ValueError(f"Unknown block type {block_type} in framed stream.")
+        if block_type & self.BLOCK_HUFFMAN and control_byte_length > 8:
+            raise ValueError("Huffman coded blocks have at most 8 control bytes.")
+        if not (1 <= control_byte_length <= 15):
+            raise ValueError("Invalid control_byte_length in block header.")
+        longest = self.__longest_block(block_type, control_byte_length, payload)
+        if longest is not None and raw_length > longest:
+            raise ValueError("Block length mismatch in framed stream.") #caught before the output is allocated
+        return block_type, control_byte_length, raw_length, payload, checksum, offset
+
+    def __longest_block(self, block_type, control_byte_length, payload):
+        """
+        Most bytes a block's payload can decode to, a bound on the raw length in its (untrusted) header.
+        Every token outputs at most its longest match or the literal bytes it holds, Huffman coded symbols take at least
+        a bit each. Long range matches have varint lengths, so for BLOCK_LONG blocks their lengths are read and added up.
+        :param block_type: type from the block header
+        :param control_byte_length: control byte length from the block header
+        :param payload: the block's payload
+        :return: the bound in bytes
+        """
+        kind = block_type & ~self.BLOCK_PRIMED
+        payload_length = len(payload)
+        if kind == self.BLOCK_STORED:
+            return payload_length
+        if kind == self.BLOCK_VARINT:
+            return payload_length // 2 * self.VARINT_MAX_MATCH + payload_length #a match takes a tag and a distance
+        length_bits = 3 if control_byte_length == 1 else (8 * control_byte_length - 1) // 3 #as set by _var_init
+        if kind == self.BLOCK_LONG:
+            return self.__long_block_length(control_byte_length, length_bits, payload)
+        symbols = payload_length * 8 if block_type & self.BLOCK_HUFFMAN else payload_length
+        return symbols // control_byte_length * ((1 << length_bits) - 1) + symbols
+
+    @staticmethod
+    def __long_block_length(control_byte_length, length_bits, payload):
+        """
+        Bytes a BLOCK_LONG payload decodes to, walking its control fields (and the varints of its long range matches)
+        without decoding anything. Literal runs are cut off at the end of the payload.
+        :param control_byte_length: control byte length from the block header
+        :param length_bits: bits of the match length field
+        :param payload: the block's token stream
+        :return: decoded length in bytes
+        """
+        data = memoryview(payload)
+        signal_bit = 1 << (8 * control_byte_length - 1)
+        distance_bits = 8 * control_byte_length - 1 - length_bits
+        length_mask = (1 << length_bits) - 1
+        i = total = 0
+        while i < len(data):
+            field = int.from_bytes(data[i:i + control_byte_length], "big")
+            i += control_byte_length
+            if field & signal_bit:
+                length = field >> distance_bits & length_mask
+                if length == 0:
+                    # Long range match, its distance and length follow as varints
+                    i = read_varint(data, i)[1]
+                    length, i = read_varint(data, i)
+            else:
+                length = min(field & (signal_bit - 1), len(data) - i)
+                i += length
+            total += length
+        return total
+
+    def __decode_block(self, control_byte_length, raw_length, payload, decompressed_data, position, floor, block_type=0,
+                       checksum=None):
+        """
+        Decodes one block's token stream into decompressed_data at position, checking its length (and checksum).
+        :param control_byte_length: control byte length from the block header
+        :param raw_length: uncompressed length from the block header
+        :param payload: the block's token stream
+        :param decompressed_data: bytearray the block is written to, normally preallocated
+        :param position: where the block starts in decompressed_data
+        :param floor: earliest position in decompressed_data that matches may copy from
+        :param block_type: (optional) type from the block header, BLOCK_LONG blocks may hold long range matches,
+        BLOCK_VARINT blocks hold varint tokens, BLOCK_STORED blocks are copied as is and BLOCK_HUFFMAN blocks are Huffman
+        decoded first
+        :param checksum: (optional) CRC-32 from the block, the decoded block is checked against it
+        :return: position after the block
+        """
+        if block_type & ~self.BLOCK_PRIMED == self.BLOCK_STORED:
+            if len(payload) != raw_length:
+                raise ValueError("Block length mismatch in framed stream.")
+            if checksum is not None:
+                self.__check(payload, 0, raw_length, checksum)
+            decompressed_data[position:position + raw_length] = payload
+            return position + raw_length
+        self.control_byte_length = control_byte_length
+        self.varint = block_type & ~self.BLOCK_PRIMED == self.BLOCK_VARINT
+        self._var_init()
+        if block_type & self.BLOCK_HUFFMAN:
+            payload = self.__huffman_decode(payload, raw_length)
+        if self.varint:
+            end = self.__decode_varint_tokens(payload, decompressed_data, position, floor)
+        else:
+            long_matches = block_type & ~self.BLOCK_PRIMED == self.BLOCK_LONG
+            end = self.__decode_tokens(payload, decompressed_data, position, floor, long_matches)
+        if end - position != raw_length:
+            raise ValueError("Block length mismatch in framed stream.")
+        if checksum is not None:
+            self.__check(decompressed_data, position, end, checksum)
+        return end
+
+    @staticmethod
+    def __check(data, start, end, checksum):
+        """
+        Checks decoded data against the CRC-32 recorded for it.
+        :param data: bytes-like holding the decoded data
+        :param start: where the checked data starts in data
+        :param end: where it ends (exclusive)
+        :param checksum: CRC-32 read from the stream
+        :return: None
+        """
+        if zlib.crc32(memoryview(data).cast("B")[start:end]) != checksum:
+            raise ValueError("Checksum mismatch, the compressed stream is corrupt.")
+
+    def __read_index(self, frame):
+        """
+        Reads the block index trailer of a version 2 framed stream.
+        :param frame: framed stream, after the header
+        :return: list of Tuples (block header offset, raw offset, raw length), one per block
+        """
+        footer_offset = len(frame) - self.INDEX_FOOTER.size
+        if footer_offset < 0:
+            raise ValueError("Framed stream is too short to contain a block index.")
+        index_offset, count, magic = self.INDEX_FOOTER.unpack_from(frame, footer_offset)
+        if magic != self.INDEX_MAGIC or index_offset + count * self.INDEX_ENTRY.size != footer_offset:
+            raise ValueError("Invalid block index in framed stream.")
+        return [self.INDEX_ENTRY.unpack_from(frame, index_offset + k * self.INDEX_ENTRY.size) for k in range(count)]
+
+    def __scan_tokens(self, compressed_bytes):
+        """
+        First pass of two-pass decoding: reads the control fields only, skipping over literal payloads, to find the
+        exact output size and build the token table the second pass fills the output from.
+        The step from every byte to the token after it (if a token started there) is worked out with NumPy a chunk at a
+        time, so the sequential walk from token to token is a single list lookup per token. Control fields wider than
+        8 bytes don't fit in NumPy integers and are read one at a time.
+        Uses the control byte layout currently set by _var_init.
+        :param compressed_bytes: token stream as bytes-like
+        :return: Tuple (uncompressed size, token table), the table holds np.arrays offset (of each control field in
+                 the stream), match, length, dist and position (where its output starts)
+        """
+        data = np.frombuffer(compressed_bytes, dtype=np.uint8)
+        end = data.size
+        control_byte_length = self.control_byte_length
+        signal_bit = 1 << (self.total_bits - 1)
+
+        if control_byte_length <= 8:
+            offsets = []
+            i = 0
+            while i < end:
+                # Step table for the next chunk: control field at every byte, then the offset of the token after it
+                base = i
+                chunk = data[base:min(end, base + self.SCAN_CHUNK) + control_byte_length]
+                count = min(end, base + self.SCAN_CHUNK) - base
+                fields = self.__read_fields(chunk, np.arange(count))
+                # Literal runs longer than the stream (on corrupt data) are cut short, so the offsets stay in int64
+                steps = np.where(fields & np.uint64(signal_bit), 0,
+                                 np.minimum(fields & np.uint64(signal_bit - 1), np.uint64(end)))
+                next_offset = (np.arange(base + control_byte_length, base + control_byte_length + count)
+                               + steps.astype(np.int64)).tolist()
+                chunk_end = base + count
+                append = offsets.append
+                while i < chunk_end:
+                    append(i)
+                    i = next_offset[i - base]
+            offsets = np.array(offsets, dtype=np.int64)
+            if offsets.size and offsets[-1] + control_byte_length > end:
+                raise ValueError("Truncated control field during decoding.")
+            fields = self.__read_fields(data, offsets)
+            match = (fields & np.uint64(signal_bit)) != 0
+            length = np.where(match, (fields >> np.uint64(self.pointer_distance_bits)) & np.uint64(self.max_pointer_length),
+                              fields & np.uint64(signal_bit - 1)).astype(np.int64)
+            dist = np.where(match, fields & np.uint64(self.max_distance), 0).astype(np.int64)
+        else:
+            offsets, match, length, dist = [], [], [], []
+            i = 0
+            while i < end:
+                if i + control_byte_length > end:
+                    raise ValueError("Truncated control field during decoding.")
+                field = int.from_bytes(data[i:i + control_byte_length], 'big')
+                offsets.append(i)
+                i += control_byte_length
+                if field & signal_bit:
+                    match.append(True)
+                    length.append((field >> self.pointer_distance_bits) & self.max_pointer_length)
+                    dist.append(min(field & self.max_distance, end << 8)) #longer than any valid distance, still fits
+                else:
+                    if field & (signal_bit - 1) > end - i:
+                        raise ValueError("Truncated literal run during decoding.")
+                    match.append(False)
+                    length.append(field & (signal_bit - 1))
+                    dist.append(0)
+                    i += length[-1]
+            offsets, match, length, dist = (np.array(offsets, dtype=np.int64), np.array(match, dtype=bool),
+                                            np.array(length, dtype=np.int64), np.array(dist, dtype=np.int64))
+
+        # Compared with the bytes left rather than added up, lengths near 2 ** 63 would wrap around
+        if (length[~match] > end - control_byte_length - offsets[~match]).any():
+            raise ValueError("Truncated literal run during decoding.")
+        position = np.concatenate(([0], np.cumsum(length)))
+        if position.size and position.min() < 0:
+            raise ValueError("Match lengths overflow the output size during decoding.") #wrapped around, only on corrupt data
+        size = int(position[-1])
+        return size, dict(offset=offsets, match=match, length=length, dist=dist, position=position[:-1])
+
+    def __read_fields(self, data, offsets):
+        """
+        Reads the control fields (up to 8 bytes) at the given offsets in one go.
+        :param data: token stream as a np.uint8 array, offsets past its end read as zero bytes
+        :param offsets: np.array of control field offsets
+        :return: np.array of control fields as np.uint64
+        """
+        fields = np.zeros(offsets.size, dtype=np.uint64)
+        for k in range(self.control_byte_length):
+            index = offsets + k
+            byte = np.zeros(offsets.size, dtype=np.uint64)
+            inside = index < data.size
+            byte[inside] = data[index[inside]]
+            fields = (fields << np.uint64(8)) | byte
+        return fields
+
+    def __fill_tokens(self, compressed_bytes, tokens, decompressed_data, base=0):
+        """
+        Second pass of two-pass decoding: copies every token into the preallocated output, straight from the token
+        table built by __scan_tokens.
+        :param compressed_bytes: token stream as bytes-like
+        :param tokens: token table from __scan_tokens
+        :param decompressed_data: bytearray of the size found by __scan_tokens (plus base)
+        :param base: (optional) where the output starts in decompressed_data, matches may copy from the bytes before it
+        :return: None
+        """
+        match, dist, position = tokens["match"], tokens["dist"], tokens["position"] + base
+        start = position - dist
+        bad = match & ((dist == 0) | (start < 0))
+        if bad.any():
+            raise ValueError(f"Invalid start index {int(start[bad.argmax()])} during decoding.")
+
+        data = memoryview(compressed_bytes)
+        out = decompressed_data
+        # Literal runs start right after their control field, matches copy from position - dist
+        source = np.where(match, start, tokens["offset"] + self.control_byte_length)
+        for is_match, length, src, pos in zip(match.tolist(), tokens["length"].tolist(), source.tolist(),
+                                              position.tolist()):
+            if not is_match:
+                out[pos:pos + length] = data[src:src + length]
+            elif pos - src >= length:
+                out[pos:pos + length] = out[src:src + length]
+            else:
+                # Overlapping match, copied in spans that double each time (see __decode_tokens)
+                match_end = pos + length
+                while pos < match_end:
+                    span = min(pos - src, match_end - pos)
+                    out[pos:pos + span] = out[src:src + span]
+                    pos += span
+
+    def __decode_tokens(self, compressed_bytes, decompressed_data, position, floor=0, long_matches=False):
+        """
+        Decodes a token stream (no header) into decompressed_data, starting at position.
+        Uses the control byte layout currently set by _var_init.
+        Matches and literals are copied as whole slices. When decompressed_data is preallocated the slices are written
+        in place, when position is at its end they are appended.
+        :param compressed_bytes: token stream as bytes-like
+        :param decompressed_data: bytearray the output is written to, matches may reach back into what it holds
+        :param position: where the output starts in decompressed_data
+        :param floor: (optional) earliest position in decompressed_data that matches may copy from
+        :param long_matches: (optional) whether matches of length 0 escape to long range matches (BLOCK_LONG)
+        :return: position after the decoded output
+        """
+        data = memoryview(compressed_bytes) #slices of literal runs without copying
+        out = decompressed_data
+        i = 0
+        end = len(data)
+        control_byte_length = self.control_byte_length
+        signal_bit = 1 << (self.total_bits - 1)
+        literal_mask = signal_bit - 1
+        distance_bits = self.pointer_distance_bits
+        distance_mask = (1 << distance_bits) - 1
+        length_mask = (1 << self.max_pointer_length_bits) - 1
+
+        while i < end:
+            # Read exactly `control_byte_length` bytes for the control field
+            signal_and_length = int.from_bytes(data[i:i + control_byte_length], 'big')
+            i += control_byte_length
 
-            if signal_flag == 1:
+            if signal_and_length & signal_bit:
                 # MatchToken: Extract length and distance
-                length = (signal_and_length >> self.pointer_distance_bits) & ((1 << self.max_pointer_length_bits) - 1)
-                dist = signal_and_length & ((1 << self.pointer_distance_bits) - 1)
+                length = (signal_and_length >> distance_bits) & length_mask
+                dist = signal_and_length & distance_mask
+                if length == 0 and long_matches:
+                    # Long range match, its distance and length follow as varints
+                    dist, i = read_varint(data, i)
+                    length, i = read_varint(data, i)
+                    if position + length > len(out):
+                        raise ValueError("Long range match runs past the end of the output.")
 
                 # Retrieve the matched data from the decompressed data
-                start_idx = len(decompressed_data) - dist
-                if start_idx < 0:
+                start_idx = position - dist
+                if start_idx < floor or dist == 0:
                     raise ValueError(f"Invalid start index {start_idx} during decoding.")
 
-                for _ in range(length):
-                    decompressed_data.append(decompressed_data[start_idx])
-                    start_idx += 1
+                if length <= dist:
+                    out[position:position + length] = out[start_idx:start_idx + length]
+                    position += length
+                else:
+                    # Overlapping match, the output repeats with period dist: copy what is there so far, doubling the
+                    # copied span each time, instead of one byte at a time
+                    match_end = position + length
+                    while position < match_end:
+                        span = min(position - start_idx, match_end - position)
+                        out[position:position + span] = out[start_idx:start_idx + span]
+                        position += span
 
             else:
                 # LiteralToken: Extract length and literal data
-                length = signal_and_length & ((1 << (self.total_bits - 1)) - 1)
+                length = signal_and_length & literal_mask
 
                 # Read the literal data
-                literal_data = compressed_bytes[i:i + length]
+                literal_data = data[i:i + length]
                 i += length
 
                 # Add to decompressed data
-                decompressed_data.extend(literal_data)
+                out[position:position + len(literal_data)] = literal_data
+                position += len(literal_data)
+        return position
 
-        self.__cleanup()
-        return bytes(decompressed_data)
+    def __decode_varint_tokens(self, compressed_bytes, decompressed_data, position, floor=0):
+        """
+        Decodes a varint token stream (no header) into decompressed_data, starting at position.
+        decompressed_data has to be preallocated, tokens running past its end are rejected.
+        :param compressed_bytes: varint token stream as bytes-like
+        :param decompressed_data: bytearray the output is written to, matches may reach back into what it holds
+        :param position: where the output starts in decompressed_data
+        :param floor: (optional) earliest position in decompressed_data that matches may copy from
+        :return: position after the decoded output
+        """
+        data = memoryview(compressed_bytes)
+        out = decompressed_data
+        i = 0
+        end = len(data)
+        size = len(out)
+        while i < end:
+            tag = data[i]
+            i += 1
+            if tag & 0x80:
+                tag, i = read_varint(data, i - 1)
+            length = tag >> 1
+            if position + length > size:
+                raise ValueError("Token runs past the end of the output during decoding.")
+
+            if tag & 1:
+                dist, i = read_varint(data, i)
+                start_idx = position - dist
+                if start_idx < floor or dist == 0:
+                    raise ValueError(f"Invalid start index {start_idx} during decoding.")
+                if length <= dist:
+                    out[position:position + length] = out[start_idx:start_idx + length]
+                    position += length
+                else:
+                    # Overlapping match, copied in doubling spans as in __decode_tokens
+                    match_end = position + length
+                    while position < match_end:
+                        span = min(position - start_idx, match_end - position)
+                        out[position:position + span] = out[start_idx:start_idx + span]
+                        position += span
+            else:
+                if i + length > end:
+                    raise ValueError("Truncated literal run during decoding.")
+                out[position:position + length] = data[i:i + length]
+                i += length
+                position += length
+        return position
 
     def tokenize(self):
         """
         Tokenizes the raw data using LZ77. Creating literal and match tokens
+        The parsing strategy depends on self.level: 0 greedy, 1 lazy, 2 optimal.
+        Runs of a repeated byte or short pattern become overlapping matches right away, only the data between them is
+        parsed. Data that the incompressible probe rejects becomes literal runs without any match finding.
         :return: Compressed data as a list of tokens.
         """
         # Tokenize the raw data using LZ77. Tokens can then be used to create a compressed stream.
-        i = 0
-        data_length = self.raw_data.size
-        while i < data_length:
-            match_distance = 0
-            match_length = 0
-            next_symbol = None
-
-            # Define the start of the search buffer
-            start_idx = max(0, i - self.window_size)
-            end_idx = max(0,i - 1)
-
-            # Extract the search and lookahead buffers
-            search_buffer = self.raw_data[start_idx:end_idx]
-            lookahead_buffer = self.raw_data[i:i + self.lookahead_buffer]
-
-            # Initialize variables to keep track of the best match
-            best_match_distance = 0
-            best_match_length = 0
-
-            # Iterate over possible match lengths
-            for j in range(1, len(lookahead_buffer)):
-                # Current substring from the lookahead buffer
-                substring = lookahead_buffer[:j]
-                # Search for the substring in the search buffer
-                pos = self.__find_subarray(search_buffer, substring)
-                if pos != -1:
-                    # Update the best match found so far
-                    best_match_distance = len(search_buffer) - pos + 1 #idk why +1 but everything was off by one
-                    best_match_length = j
-                else:
-                    # No further match; break out of the loop
-                    break
+        if self.incompressible(self.raw_data, self.start):
+            self.logger.info("data looks incompressible, skipping match finding")
+            self.__start_tokens()
+            self.__appendLiterals(self.start, self.raw_data.size)
+            self.__createLiteral()
+        else:
+            finder = self.__create_match_finder()
+            self.__parse_all(finder, self.level)
+            if self.level == 2:
+                # The optimal parse caps its search inside long matches, keep the greedy tokens if they come out smaller
+                optimal = self.compressed_data
+                self.__parse_all(finder, 0)
+                if self.__token_stream_size(optimal) <= self.__token_stream_size(self.compressed_data):
+                    self.compressed_data = optimal
+
+        self.logger.info(f"tokens: {len(self.compressed_data)}, data_length: {self.raw_data.size}")
+        return self.compressed_data
+
+    def __start_tokens(self):
+        """
+        Starts a new, empty token store in self.compressed_data with no open literal run.
+        :return: None
+        """
+        self.compressed_data = TokenStore(self.raw_data)
+        self.literal_length = 0
+
+    def __parse_all(self, finder, level):
+        """
+        Tokenizes the raw data from self.start into a new self.compressed_data with the strategy level selects.
+        :param finder: match finder for the raw data
+        :param level: 0 greedy, 1 lazy, 2 optimal
+        :return: None
+        """
+        self.__start_tokens()
+        i = self.start
+        for run_start, run_end, period in find_runs(self.raw_data, self.RUN_MIN, self.RUN_PERIOD, self.start):
+            self.__parse(finder, i, run_start, level)
+            i = self.__createRun(run_start, run_end, period)
+        self.__parse(finder, i, self.raw_data.size, level)
+
+        # After processing, check if there are remaining literals and create token if neccecary
+        if self.literal_length > 0:
+            self.__createLiteral()
+
+    def __token_stream_size(self, tokens):
+        """
+        Size of the serialized token stream, without serializing it.
+        :param tokens: TokenStore
+        :return: size in bytes
+        """
+        match, length, dist, _ = tokens.columns()
+        literal_bytes = int(length[~match].sum())
+        if self.varint:
+            tags = (length << np.uint64(1)) | match.astype(np.uint64)
+            return int(varint_sizes(tags).sum() + varint_sizes(dist[match]).sum()) + literal_bytes
+        return len(tokens) * self.control_byte_length + literal_bytes
+
+    @staticmethod
+    def incompressible(data, start=0):
+        """
+        Quick probe for data that LZ77 can't shrink, such as already compressed files, so match finding can be skipped.
+        The byte entropy of a few samples is measured first, skewed byte frequencies mean the data is compressible.
+        Only data that looks random is then checked for 8-byte strings repeated anywhere in it (or in the data before
+        it), which could still be matched. Past PROBE_STRINGS strings they are sampled by content, those whose first 4
+        bytes hash to a multiple of a power of 2, so both copies of a repeat are sampled alike. Repeats making up less
+        than PROBE_REPEATS of the strings, over the count expected by chance for that many, are given up.
+        :param data: np.uint8 array
+        :param start: (optional) where the data to tokenize starts, the bytes before it are a prefix matches may use
+        :return: True if the data looks incompressible
+        """
+        if data.size - start < LZ77.PROBE_MIN:
+            return False
+        sample_starts = np.linspace(start, data.size - LZ77.PROBE_SAMPLE, LZ77.PROBE_SAMPLES).astype(np.int64)
+        sample = data[span_indices(sample_starts, np.full(LZ77.PROBE_SAMPLES, LZ77.PROBE_SAMPLE, dtype=np.int64))]
+        frequencies = np.bincount(sample, minlength=256)
+        frequencies = frequencies[frequencies > 0] / sample.size
+        if -(frequencies * np.log2(frequencies)).sum() < LZ77.PROBE_ENTROPY:
+            return False
+        # The 4 bytes from every position, read in place (overlapping, 1 byte apart) rather than rolled into a new array
+        keys = np.ndarray(max(0, data.size - 3), dtype=">u4", buffer=np.ascontiguousarray(data), strides=(1,))
+        first = keys[:keys.size - 4] #first half of every 8-byte string
+        sample_bits = ((first.size - 1) // LZ77.PROBE_STRINGS).bit_length() #1 in 2 ** sample_bits strings is sorted
+        positions = np.arange(first.size) if sample_bits == 0 else \
+            np.flatnonzero((first * np.uint32(0x9E3779B1)) >> np.uint32(32 - sample_bits) == 0)
+        # Equal strings end up next to each other
+        strings = np.sort(first[positions].astype(np.uint64) << np.uint64(32) | keys[positions + 4])
+        # Chance collisions, among strings that already share a sample (their first 4 bytes hash alike)
+        chance = strings.size * (strings.size - 1) / 2 * 2.0 ** (sample_bits - 64)
+        return np.count_nonzero(strings[1:] == strings[:-1]) - chance < LZ77.PROBE_REPEATS * strings.size
+
+    def __match_limit(self, i, end):
+        """
+        Longest match allowed at position i, the lookahead buffer (and its last byte) bounds it.
+        :param i: coding position
+        :param end: end of the span being parsed, matches stop there
+        :return: maximum match length
+        """
+        return min(min(self.lookahead_buffer, self.raw_data.size - i) - 1, end - i)
 
+    def __parse(self, finder, start, end, level):
+        """
+        Parses raw_data[start:end] with the strategy level selects.
+        :param finder: match finder for the raw data
+        :param start: first position to parse
+        :param end: end of the span (exclusive)
+        :param level: 0 greedy, 1 lazy, 2 optimal
+        :return: None
+        """
+        if level == 2:
+            self.__optimal_parse(finder, start, end)
+        else:
+            self.__greedy_parse(finder, start, end, lazy=level == 1)
 
-            #checks min size requirement for match
-            if best_match_length > self.control_byte_length:
+    def __greedy_parse(self, finder, start, end, lazy=False):
+        """
+        Greedy parsing, takes the longest match at each position.
+        With lazy matching, a match is deferred by one byte whenever the next position has a longer match.
+        :param finder: match finder for the raw data
+        :param start: first position to parse
+        :param end: end of the span (exclusive)
+        :return: None
+        """
+        i = start
+        data_length = end
+        varint = self.varint
+        next_candidate = finder.next_candidate
+        lookahead_match = None #match already found for position i by the lazy check
+        while i < data_length:
+            # Bytes that can't start a match go straight to the literal buffer as one run
+            if next_candidate[i] > i:
+                literal_end = min(next_candidate[i], data_length)
+                self.__appendLiterals(i, literal_end)
+                i = literal_end
+                lookahead_match = None
+                continue
+
+            if lookahead_match is not None:
+                best_match_length, best_match_distance = lookahead_match
+                lookahead_match = None
+            else:
+                best_match_length, best_match_distance = finder.find(i, self.__match_limit(i, data_length))
+
+            #checks min size requirement for match, a varint match takes its tag (1 byte while short) and distance
+            if best_match_length > (varint_size(best_match_distance) + 1 if varint else self.control_byte_length):
+                if lazy and i + 1 < data_length:
+                    lookahead_match = finder.find(i + 1, self.__match_limit(i + 1, data_length))
+                    # Deferring costs a literal byte, plus new control bytes when no literal run is open to join
+                    deferral_cost = 0 if self.literal_length > 0 else 1 if varint else self.control_byte_length
+                    if lookahead_match[0] > best_match_length + deferral_cost:
+                        # A longer match starts one byte later, emit this byte as a literal and take that one instead
+                        self.__appendLiterals(i, i + 1)
+                        i += 1
+                        continue
+                    lookahead_match = None
                 self.__createPointer(best_match_distance, best_match_length)
                 i += best_match_length
             else:
                 # No match found; output a literal byte to the literal buffer
-                self.literal_buffer.append(self.raw_data[i])
-                if len(self.literal_buffer)>=self.max_literal_length:
-                    self.__createLiteral()
+                self.__appendLiterals(i, i + 1)
                 i += 1
 
-        # After processing, check if there are remaining literals and create token if neccecary
-        if len(self.literal_buffer) > 0:
-            self.__createLiteral()
-
-        self.logger.info(f"idx: {i}, data_length: {data_length}")
-        return self.compressed_data
+    def __optimal_parse(self, finder, start, end):
+        """
+        Optimal parsing, picks the tokens that minimize the serialized size using dynamic programming.
+        Costs follow the encoder exactly: every token costs control_byte_length bytes, literals also cost their bytes.
+        Varint tokens cost their tag and distance, literal run tags are counted as 1 byte.
+        Every match length from the minimum up to the longest match found at a position is considered. All of them cost
+        the same (for varint tokens, the same within each tag size), so a match is one interval of end positions at one
+        cost, kept on a heap until the parse passes its end, rather than relaxed length by length. Positions covered by
+        a match of OPTIMAL_NICE_LENGTH (or the longest length) only consider matches up to OPTIMAL_CAPPED_LENGTH, away
+        from its end that match itself provides one without searching.
+        The tables are indexed from start, so spans between runs are cheap to parse on their own.
+        :param finder: match finder for the raw data
+        :param start: first position to parse
+        :param end: end of the span (exclusive)
+        :return: None
+        """
+        data_length = end - start #positions below are relative to start, except when looking into raw_data
+        varint = self.varint
+        cb = 1 if varint else self.control_byte_length #cost of opening a literal run
+        infinity = float("inf")
+
+        # cost_match[j]: cheapest encoding of the first j bytes ending on a match (or nothing, for j = 0)
+        # cost_literal[j]: cheapest encoding of the first j bytes ending inside a literal run
+        cost_match = [infinity] * (data_length + 1)
+        cost_literal = [infinity] * (data_length + 1)
+        run_length = [0] * (data_length + 1) #length of the literal run ending at j
+        literal_from_match = [False] * (data_length + 1) #whether that run was opened after a match
+        match_from = [0] * (data_length + 1) #(start of the match ending at j, whether it followed a literal run)
+        match_distance = [0] * (data_length + 1)
+        cost_match[0] = 0
+        waiting = [] #matches whose shortest length ends past i: (first end, cost, start, last end, distance, after literal)
+        open_matches = [] #matches that can end at i: (cost, start, last end, distance, after literal), cheapest first
+        nice_length = min(self.OPTIMAL_NICE_LENGTH, self.max_pointer_length)
+        capped_length = min(self.OPTIMAL_CAPPED_LENGTH, nice_length)
+        capped_until = 0 #positions covered by a nice length match only search up to capped_length
+        capped_dist = 0 #distance of that match, it holds a capped_length match for every position but its tail
+
+        next_candidate = finder.next_candidate
+        for i in range(data_length + 1):
+            # The cheapest match ending at i, ties go to the earliest start
+            while waiting and waiting[0][0] <= i:
+                heapq.heappush(open_matches, heapq.heappop(waiting)[1:])
+            while open_matches and open_matches[0][2] < i:
+                heapq.heappop(open_matches)
+            if open_matches:
+                cost, token_start, _, dist, after_literal = open_matches[0]
+                cost_match[i] = cost
+                match_from[i] = (token_start, after_literal)
+                match_distance[i] = dist
+            if i == data_length:
+                break
+
+            # Literal transitions: open a new run after a match, or extend the current run
+            opened = cost_match[i] + cb + 1
+            extended = cost_literal[i] + 1 + (cb if run_length[i] >= self.max_literal_length else 0)
+            if opened <= extended:
+                cost_literal[i + 1] = opened
+                run_length[i + 1] = 1
+                literal_from_match[i + 1] = True
+            else:
+                cost_literal[i + 1] = extended
+                run_length[i + 1] = run_length[i] % self.max_literal_length + 1
+
+            # Match transitions, every length up to the longest match costs the same control bytes
+            if next_candidate[start + i] > start + i:
+                continue
+            if i + capped_length <= capped_until:
+                length, dist = capped_length, capped_dist #within the bounds the covering match was found in
+            else:
+                limit = self.__match_limit(start + i, end)
+                length, dist = finder.find(start + i, min(limit, capped_length) if i < capped_until else limit)
+            if length < self.min_match:
+                continue
+            if length >= nice_length and i + length > capped_until:
+                capped_until = i + length
+                capped_dist = dist
+            after_literal = cost_literal[i] < cost_match[i]
+            base = cost_literal[i] if after_literal else cost_match[i]
+            shortest = self.min_match
+            while shortest <= length:
+                # Lengths up to longest share a cost, varint tags grow by a byte every 7 bits
+                longest = min(length, (1 << 7 * varint_size(shortest << 1 | 1) - 1) - 1) if varint else length
+                cost = base + (varint_size(dist) + varint_size(shortest << 1 | 1) if varint else cb)
+                heapq.heappush(waiting, (i + shortest, cost, i, i + longest, dist, after_literal))
+                shortest = longest + 1
+
+        # Walk back from the end, collecting the chosen tokens
+        tokens = []
+        j = data_length
+        in_literal = cost_literal[j] < cost_match[j]
+        while j > 0:
+            if in_literal:
+                token_start = j
+                while True:
+                    token_start -= 1
+                    if literal_from_match[token_start + 1]:
+                        break
+                tokens.append((False, token_start, j))
+                j = token_start
+                in_literal = False
+            else:
+                token_start, in_literal = match_from[j]
+                tokens.append((True, j - token_start, match_distance[j]))
+                j = token_start
 
+        for is_match, first, second in reversed(tokens):
+            if is_match:
+                self.__createPointer(second, first)
+            else:
+                self.__appendLiterals(start + first, start + second)
 
     def __createBitMask(self, isLiteral=True):
         """
@@ -403,20 +2438,63 @@ class LZ77(object):
             return signal_mask, length_mask, distance_mask
 
 
+    def __create_match_finder(self):
+        """
+        Creates the match finder selected by self.match_finder over the raw data.
+        Matches have to be longer than the control bytes to save space, so that's the minimum match length.
+        :return: match finder object with a find(i, limit) method
+        """
+        min_match = self.min_match
+        if self.match_finder == "max":
+            return SuffixArrayMatchFinder(self.raw_data, self.window_size, min_match, self.max_pointer_length)
+        return HashChainMatchFinder(self.raw_data, self.window_size, min_match, self.max_pointer_length,
+                                    self.chain_depth)
+
 #create tokens for compressed stream
+    def __appendLiterals(self, start, end):
+        """
+        Adds raw_data[start:end] to the open literal run, creating literal tokens whenever the run fills up.
+        Runs are kept as spans of the raw data, the bytes themselves aren't copied.
+        :param start: first byte of the run, right after the open run (tokens cover the raw data in order)
+        :param end: end of the run (exclusive)
+        :return: None
+        """
+        while start < end:
+            if self.literal_length == 0:
+                self.literal_start = start
+            take = min(end - start, self.max_literal_length - self.literal_length)
+            self.literal_length += take
+            if self.literal_length >= self.max_literal_length:
+                self.__createLiteral()
+            start += take
+
     def __createLiteral(self):
         """
-        Creates a literal token from the literal buffer and appends it to the compressed data.
+        Creates a literal token from the open literal run and appends it to the compressed data.
         :return: None
         """
-        #empties literal buffer and creates a literal token
-        if len(self.literal_buffer) == 0: return #no literal to output
+        #closes the literal run and creates a literal token
+        if self.literal_length == 0: return #no literal to output
 
-        LiToken = LiteralToken(len(self.literal_buffer), self.literal_buffer) #creates a literal token
-        self.literal_buffer = [] #empties the literal buffer
-        self.compressed_data.append(LiToken) #appends the literal token to the compressed data
+        self.compressed_data.append_literal(self.literal_start, self.literal_length)
+        self.literal_length = 0
 
-        #self.logger.info(f"Literal: Length= {LiToken.length}, Data= {LiToken.data}")
+    def __createRun(self, start, end, period):
+        """
+        Covers a run found by find_runs with overlapping matches of distance period, as long as they can be.
+        A tail too short for a match is left to the parser.
+        :param start: start of the run
+        :param end: end of the run (exclusive)
+        :param period: length of the repeated pattern
+        :return: position after the matches
+        """
+        i = start
+        while True:
+            length = min(self.max_pointer_length, self.__match_limit(i, end))
+            if length < self.min_match:
+                return i
+            self.__createPointer(period, length)
+            i += length
 
     def __createPointer(self, distance, length):
         """
@@ -425,30 +2503,25 @@ class LZ77(object):
         :param length: length of match
         :return: None
         """
-        #creates a pointer token, empties literal buffer before
-        if len(self.literal_buffer) > 0:
+        #creates a pointer token, closes the literal run before
+        if self.literal_length > 0:
             self.__createLiteral()
 
-        PToken = MatchToken(distance, length)
-        self.compressed_data.append(PToken)
-        #self.logger.info(f"Pointer: {PToken}")
+        self.compressed_data.append_match(distance, length)
 
-    @staticmethod
-    def __find_subarray(array, subarray):
-        """
-        Helper function to find a subarray within an array.
-        :param array:
-        :param subarray:
-        :return:
-        """
-        len_sub = len(subarray)
-        if len_sub == 0:
-            return -1
-        len_array = len(array)
-        for k in range(len_array - len_sub + 1):
-            if np.array_equal(array[k:k + len_sub], subarray):
-                return k
-        return -1
+    def __serialize_long_match(self, distance, length):
+        """
+        Serializes a long range match, for BLOCK_LONG blocks: a match control field with length and distance 0 (which no
+        ordinary match has) escapes to the real distance and length, as varints after it. Varint tokens hold any
+        distance and length, so there it is an ordinary match.
+        :param distance: distance to match, however far
+        :param length: length of match, however long
+        :return: the long range match as bytes
+        """
+        if self.varint:
+            return write_varint(length << 1 | 1) + write_varint(distance)
+        signal = 1 << (self.total_bits - 1)
+        return signal.to_bytes(self.control_byte_length, "big") + write_varint(distance) + write_varint(length)
 
     def __generate_header(self):
         """
@@ -467,11 +2540,34 @@ class LZ77(object):
         return header
 
 
+    def __generate_frame_header(self, dictionary=None, flags=0):
+        """
+        Generates the 4-byte header of the framed format.
+        Byte 1: Magic number (0xC7).
+        Byte 2: High 4 bits are 0 (no valid control_byte_length, so older readers reject the stream), low 4 bits file type.
+        Byte 3: Frame version.
+        Byte 4: Frame flags, FLAG_DICTIONARY, FLAG_TOKENS and FLAG_CHECKSUM.
+        With FLAG_DICTIONARY the dictionary's id follows (4 bytes). With FLAG_TOKENS the caller appends the control byte
+        length (and with FLAG_CHECKSUM the CRC-32 of the data) and a single token stream, otherwise blocks follow, each
+        followed by its CRC-32 with FLAG_CHECKSUM, and version 2 frames end with a block index: one entry per block,
+        then a footer locating the index.
+        :param dictionary: (optional) Dictionary the data is primed with
+        :param flags: (optional) other frame flags
+        :return: header as a bytearray
+        """
+        extension_code = {v: k for k, v in self.EXTENSION_MAP.items()}.get(self.extension, 0x0)
+        if not dictionary: #no dictionary, or an empty one
+            return bytearray([0xC7, extension_code, self.FRAME_VERSION, flags])
+        return bytearray([0xC7, extension_code, self.FRAME_VERSION, flags | self.FLAG_DICTIONARY]) + \
+            self.DICTIONARY_ID.pack(dictionary.id)
+
     def __parse_header(self, compressed_stream):
         """
-        Parses the 2-byte header from the compressed stream.
+        Parses the header from the compressed stream, either the 2-byte header or the 4-byte framed format header.
         :param compressed_stream: Compressed stream as bytes.
-        :return:  Returns the control_byte_length, filetype extension and the remaining stream:
+        :return:  Returns the control_byte_length (0 for framed streams, whose blocks carry their own),
+                  filetype extension and the remaining stream. Frames holding a single token stream (FLAG_TOKENS) give
+                  its control_byte_length and the token stream, like the 2-byte header.
         """
         if len(compressed_stream) < 2:
             raise ValueError("Compressed stream is too short to contain a valid header.")
@@ -480,32 +2576,65 @@ class LZ77(object):
         if magic_number != 0xC7:
             raise ValueError("Invalid magic number. Not an LZ77-compressed stream.")
 
-        control_byte_length = (compressed_stream[1] >> 4) & 0x0F
-        if not (1 <= control_byte_length <= 15):
-            raise ValueError("Invalid control_byte_length in header.")
-
         extension_code = compressed_stream[1] & 0x0F #last 4 bits
         extension = self.EXTENSION_MAP.get(extension_code, "")
 
+        control_byte_length = (compressed_stream[1] >> 4) & 0x0F
+        header_length = 2
+        self.frame_version = 0 #not framed
+        self.frame_flags = 0
+        self.dictionary_id = None
+        self.checksum = None
+        if control_byte_length == 0:
+            # Framed format
+            if len(compressed_stream) < 4:
+                raise ValueError("Compressed stream is too short to contain a valid header.")
+            if compressed_stream[2] not in self.FRAME_VERSIONS:
+                raise ValueError(f"Unsupported frame version {compressed_stream[2]}.")
+            self.frame_version = compressed_stream[2]
+            self.frame_flags = compressed_stream[3]
+            if self.frame_flags & ~self.FRAME_FLAGS:
+                raise ValueError(f"Unsupported frame flags {self.frame_flags:#04x}.")
+            header_length = 4
+            if self.frame_flags & self.FLAG_DICTIONARY:
+                if len(compressed_stream) < header_length + self.DICTIONARY_ID.size:
+                    raise ValueError("Compressed stream is too short to contain a valid header.")
+                self.dictionary_id, = self.DICTIONARY_ID.unpack_from(compressed_stream, header_length)
+                header_length += self.DICTIONARY_ID.size
+            if self.frame_flags & self.FLAG_TOKENS:
+                if len(compressed_stream) <= header_length:
+                    raise ValueError("Compressed stream is too short to contain a valid header.")
+                control_byte_length = compressed_stream[header_length]
+                header_length += 1
+                if not (1 <= control_byte_length <= 15):
+                    raise ValueError("Invalid control_byte_length in header.")
+                if self.frame_flags & self.FLAG_CHECKSUM:
+                    if len(compressed_stream) < header_length + self.CHECKSUM.size:
+                        raise ValueError("Compressed stream is too short to contain a valid header.")
+                    self.checksum, = self.CHECKSUM.unpack_from(compressed_stream, header_length)
+                    header_length += self.CHECKSUM.size
+        elif not (1 <= control_byte_length <= 15):
+            raise ValueError("Invalid control_byte_length in header.")
+
         print(f"Decoded extension code: {extension_code}, extension: {extension}")
-        return control_byte_length, extension, compressed_stream[2:]
+        return control_byte_length, extension, compressed_stream[header_length:]
 
     #not used within the class, but by other elements to verify the header
     @staticmethod
     def verify_header(file_path):
         """
-        Reads the first 2 bytes of the file and checks for a valid header.
+        Reads the first bytes of the file and checks for a valid header (2-byte or framed format).
         Returns True if the header is valid, False otherwise.
         :param file_path:
         :return: Bool, true if header is valid, false otherwise
         """
         try:
             with open(file_path, "rb") as f:
-                header = f.read(2)
+                header = f.read(13) #2 bytes, or 4 for the framed format (up to 9 more with a dictionary id, control byte length and checksum)
                 lz = LZ77(b"") #init LZ object to parse header
                 _,extension,_ = lz._LZ77__parse_header(header) #grabs extension
             # Check for the magic number 0xC7 and validate header
-            return (len(header) == 2 and header[0] == 0xC7), extension
+            return (len(header) >= 2 and header[0] == 0xC7), extension
         except Exception as e:
             print(f"Error checking header: {e}")
             return False, ""
@@ -515,8 +2644,8 @@ class LZ77(object):
         Cleans up the object state after encoding/decoding.
         :return: None
         """
-        self.literal_buffer = []
+        self.literal_length = 0
         self.compressed_data = []
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    sys.exit(main())
\ No newline at end of file
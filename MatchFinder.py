@@ -0,0 +1,467 @@
+import hashlib
+import numpy as np
+
+
+def match_length(data, a, b, limit, chunk=16):
+    """
+    Length of the common prefix of data[a:] and data[b:], at most limit bytes.
+    Compares whole chunks at once with NumPy (one comparison plus argmin per chunk), doubling the chunk size each time,
+    so long matches cost a handful of array operations instead of one python comparison per byte.
+    :param data: np.uint8 array
+    :param a: start of the first sequence
+    :param b: start of the second sequence
+    :param limit: maximum length to compare, both data[a:a + limit] and data[b:b + limit] must be in bounds
+    :param chunk: (optional) size of the first chunk compared
+    :return: number of equal leading bytes
+    """
+    length = 0
+    while length < limit:
+        size = min(chunk, limit - length)
+        equal = data[a + length:a + length + size] == data[b + length:b + length + size]
+        mismatch = int(equal.argmin()) #first False, or 0 when every byte matched
+        if not equal[mismatch]:
+            return length + mismatch
+        length += size
+        chunk <<= 1
+    return limit
+
+
+def common_suffix_length(data, a, b, limit, chunk=16):
+    """
+    Length of the common suffix of data[:a] and data[:b], at most limit bytes. The backward twin of match_length.
+    :param data: np.uint8 array
+    :param a: end (exclusive) of the first sequence
+    :param b: end (exclusive) of the second sequence
+    :param limit: maximum length to compare, both a and b must be at least limit
+    :param chunk: (optional) size of the first chunk compared
+    :return: number of equal trailing bytes
+    """
+    length = 0
+    while length < limit:
+        size = min(chunk, limit - length)
+        equal = (data[a - length - size:a - length] == data[b - length - size:b - length])[::-1]
+        mismatch = int(equal.argmin())
+        if not equal[mismatch]:
+            return length + mismatch
+        length += size
+        chunk <<= 1
+    return limit
+
+
+def rolling_keys(data, key_length):
+    """
+    Keys every position (that has key_length bytes left) on its next key_length bytes.
+    :param data: np.uint8 array
+    :param key_length: bytes per key, 1 to 4
+    :return: np.array of keys, one per position
+    """
+    count = data.size - key_length + 1
+    if count <= 0:
+        return np.zeros(0, dtype=np.uint32)
+
+    # Roll the next key_length bytes of each position into one integer
+    key = np.zeros(count, dtype=np.uint32)
+    for k in range(key_length):
+        key = (key << np.uint32(8)) | data[k:k + count].astype(np.uint32)
+    return key
+
+
+def build_chains(keys):
+    """
+    Links each position to the previous position with the same key (-1 when there is none).
+    This gives the same chains as inserting every position into a head table in order, but is done in bulk.
+    :param keys: keys from rolling_keys
+    :return: np.array of previous positions, one per keyed position
+    """
+    prev = np.full(keys.size, -1, dtype=np.int64)
+    if keys.size > 1:
+        order = np.argsort(keys, kind="stable") #groups equal keys, keeping positions ascending
+        sorted_keys = keys[order]
+        same = sorted_keys[1:] == sorted_keys[:-1]
+        prev[order[1:][same]] = order[:-1][same]
+    return prev
+
+
+def candidate_table(prev, size, window_size):
+    """
+    For every position, the first position at or after it whose chain has a link inside the window.
+    Everything in between can't start a match, so the tokenizer can emit it as literals in one go.
+    :param prev: chain links from build_chains
+    :param size: length of the data
+    :param window_size: maximum match distance
+    :return: np.array with one entry per position (plus one for the end of the data)
+    """
+    window_size = min(window_size, size) #wide control fields give windows too large for NumPy integers
+    positions = np.arange(prev.size)
+    has_candidate = (prev >= 0) & (prev >= positions - window_size)
+    table = np.full(size + 1, size, dtype=np.int64)
+    table[:prev.size][has_candidate] = positions[has_candidate]
+    # Running minimum from the end fills every gap with the next position that has a candidate
+    return np.minimum.accumulate(table[::-1])[::-1]
+
+
+def find_runs(data, min_length, max_period, start=0):
+    """
+    Finds runs: at least min_length bytes that each equal the byte period bytes before them, so one byte repeated
+    (period 1) or a short pattern repeated (period up to max_period), as in padding or zero filled regions.
+    A run is a single overlapping match with distance period, however long, found with one NumPy comparison of the data
+    against itself per period instead of searching the window. Where runs of different periods overlap the one starting
+    first is kept, and the others start where it ends.
+    :param data: np.uint8 array
+    :param min_length: shortest run reported
+    :param max_period: longest pattern looked for
+    :param start: (optional) first position a run may cover, the bytes before it can still be the pattern
+    :return: list of Tuples (start, end, period), in order and not overlapping. The first copy of the pattern comes
+             before the run's start, so the run is a match from its start on
+    """
+    candidates = []
+    for period in range(1, min(max_period, data.size - 1) + 1):
+        # Edges of the stretches where data[j] == data[j - period], in pairs of start and end
+        equal = np.concatenate(([False], data[period:] == data[:-period], [False]))
+        edges = np.flatnonzero(equal[1:] != equal[:-1]) + period
+        run_starts = np.maximum(edges[0::2], start)
+        run_ends = edges[1::2]
+        long_run = run_ends - run_starts >= min_length
+        candidates.extend((run_start, run_end, period) for run_start, run_end in
+                          zip(run_starts[long_run].tolist(), run_ends[long_run].tolist()))
+
+    runs = []
+    end = start
+    for run_start, run_end, period in sorted(candidates, key=lambda run: (run[0], -run[1], run[2])):
+        run_start = max(run_start, end)
+        if run_end - run_start >= min_length:
+            runs.append((run_start, run_end, period))
+            end = run_end
+    return runs
+
+
+class HashChainMatchFinder(object):
+    """
+    Finds matches for LZ77.tokenize without scanning the whole search window.
+
+    Every position is keyed on its first few bytes, packed into one integer (a perfect hash, so chains never hold false
+    candidates). The heads remember the latest position seen for each key, and every position is chained back to the
+    previous position with the same key. Finding a match at the coding position then only walks that chain
+    (up to chain_depth links) instead of comparing against every window offset.
+    """
+    SHORT_MATCH = 16 #match lengths up to this are checked byte by byte, cheaper than a NumPy call for short matches
+
+    def __init__(self, data, window_size, min_match, max_match, chain_depth=64):
+        """
+        Indexes the data, building the hash heads and chains in one pass.
+        :param data: data to search as a np.uint8 array
+        :param window_size: maximum distance from the coding position to the start of a match
+        :param min_match: shortest match worth reporting, shorter matches are ignored
+        :param max_match: longest match that can be encoded
+        :param chain_depth: (optional) maximum number of chain links followed per lookup, default is 64
+        """
+        if chain_depth < 1:
+            raise ValueError("chain_depth must be at least 1.")
+        self.data = data
+        self.view = memoryview(data) #indexing a memoryview gives python ints, much cheaper than numpy scalars
+        self.window_size = window_size
+        self.min_match = min_match
+        self.max_match = max_match
+        self.chain_depth = chain_depth
+
+        # Any reportable match is at least min_match bytes, so keying on that many bytes (capped at 4) loses nothing
+        self.hash_length = max(1, min(min_match, 4))
+        self.hashes = rolling_keys(data, self.hash_length)
+        prev = build_chains(self.hashes)
+        self.next_candidate = candidate_table(prev, data.size, window_size).tolist()
+        self.prev = prev.tolist() #python list, chain walks index it one link at a time
+
+    def find(self, i, limit):
+        """
+        Finds the longest match for the bytes at position i.
+        Like the original window scan, a match must start within window_size bytes and end before position i - 1.
+        :param i: coding position
+        :param limit: longest match allowed at this position
+        :return: Tuple (match length, match distance), (0, 0) when no match of at least min_match bytes exists
+        """
+        limit = min(limit, self.max_match)
+        if limit < self.min_match or i >= len(self.prev):
+            return 0, 0
+
+        window_start = max(0, i - self.window_size)
+        view = self.view
+        prev = self.prev
+        best_length = self.min_match - 1
+        best_pos = -1
+        # Matches can't run into the byte before the coding position, so only candidates starting before
+        # i - 1 - best_length can still beat the best match
+        cutoff = i - 1 - best_length
+
+        candidate = prev[i]
+        depth = self.chain_depth
+        while candidate >= window_start and depth > 0:
+            depth -= 1
+            # Only candidates that could beat the current best are worth extending, check the deciding byte first
+            if candidate < cutoff and view[candidate + best_length] == view[i + best_length]:
+                cap = i - 1 - candidate
+                if cap > limit:
+                    cap = limit
+                # The chain key already guarantees the first hash_length bytes, most matches end within a few more
+                # bytes so those are checked directly, anything longer is extended in bulk
+                length = self.hash_length
+                short = cap if cap < self.SHORT_MATCH else self.SHORT_MATCH
+                while length < short and view[candidate + length] == view[i + length]:
+                    length += 1
+                if length == short < cap:
+                    length += match_length(self.data, candidate + length, i + length, cap - length, length)
+                if length > best_length:
+                    best_length = length
+                    best_pos = candidate
+                    if length >= limit:
+                        break
+                    cutoff = i - 1 - best_length
+            candidate = prev[candidate]
+
+        if best_pos < 0:
+            return 0, 0
+        return best_length, i - best_pos
+
+
+class SuffixArrayMatchFinder(object):
+    """
+    Finds the true longest match for LZ77.tokenize using a suffix array, for maximum compression ratio.
+
+    The data is indexed in blocks; each block's suffix array also covers the window_size bytes before the block so
+    every position can see its whole window. Suffixes sharing a long prefix sit next to each other in the suffix array,
+    so the longest match is found by walking outwards from the coding position's rank (using the LCP array) and stopping
+    as soon as no neighbour further out can beat the best match so far.
+    """
+    def __init__(self, data, window_size, min_match, max_match, block_size=1 << 18, max_steps=4096):
+        """
+        Sets up the finder, blocks are indexed lazily as find reaches them.
+        :param data: data to search as a np.uint8 array
+        :param window_size: maximum distance from the coding position to the start of a match
+        :param min_match: shortest match worth reporting, shorter matches are ignored
+        :param max_match: longest match that can be encoded
+        :param block_size: (optional) positions indexed per block, raised to window_size so the index stays <= 2 blocks
+        :param max_steps: (optional) neighbours visited per lookup at most, bounds the cost on degenerate inputs
+        """
+        self.data = data
+        self.view = memoryview(data)
+        self.window_size = window_size
+        self.min_match = min_match
+        self.max_match = max_match
+        self.block_size = max(block_size, min(window_size, data.size))
+        self.max_steps = max_steps
+        key_length = max(1, min(min_match, 4))
+        self.next_candidate = candidate_table(build_chains(rolling_keys(data, key_length)), data.size, window_size).tolist()
+
+        # Index of the block currently loaded
+        self.block_start = 0
+        self.block_end = 0
+        self.span_start = 0
+        self.sa = []
+        self.rank = []
+        self.lcp = []
+
+    @staticmethod
+    def suffix_array(data):
+        """
+        Builds the suffix array of data by prefix doubling, each round sorts on twice as many leading bytes.
+        :param data: np.uint8 array
+        :return: np.array of suffix start positions in sorted order
+        """
+        n = data.size
+        if n == 0:
+            return np.zeros(0, dtype=np.int64)
+        rank = data.astype(np.int64)
+        sa = np.argsort(rank, kind="stable")
+        k = 1
+        while True:
+            # Secondary key is the rank k bytes further on, suffixes that run out sort first
+            second = np.full(n, -1, dtype=np.int64)
+            second[:n - k] = rank[k:]
+            sa = np.lexsort((second, rank))
+            sorted_rank = rank[sa]
+            sorted_second = second[sa]
+            changed = (sorted_rank[1:] != sorted_rank[:-1]) | (sorted_second[1:] != sorted_second[:-1])
+            new_rank = np.zeros(n, dtype=np.int64)
+            new_rank[sa] = np.concatenate(([0], np.cumsum(changed)))
+            rank = new_rank
+            if rank[sa[-1]] == n - 1 or k >= n:
+                return sa
+            k <<= 1
+
+    def __lcp_array(self, span, sa, rank):
+        """
+        Kasai's algorithm; lcp[r] is the common prefix length of suffixes sa[r - 1] and sa[r], capped at max_match.
+        :return: list of LCP lengths
+        """
+        n = len(sa)
+        view = self.view
+        lcp = [0] * n
+        h = 0
+        for pos in range(n):
+            r = rank[pos]
+            if r == 0:
+                h = 0
+                continue
+            other = sa[r - 1]
+            limit = min(self.max_match, n - pos, n - other)
+            a = span + pos
+            b = span + other
+            while h < limit and view[a + h] == view[b + h]:
+                h += 1
+            lcp[r] = h
+            if h > 0:
+                h -= 1
+        return lcp
+
+    def __load_block(self, i):
+        """
+        Indexes the block containing position i.
+        """
+        n = self.data.size
+        self.block_start = (i // self.block_size) * self.block_size
+        self.block_end = min(n, self.block_start + self.block_size)
+        self.span_start = max(0, self.block_start - self.window_size)
+        # Extend past the block so matches starting near its end aren't cut short
+        span_end = min(n, self.block_end + self.max_match)
+
+        sa = self.suffix_array(self.data[self.span_start:span_end])
+        rank = np.empty(sa.size, dtype=np.int64)
+        rank[sa] = np.arange(sa.size)
+        self.sa = sa.tolist()
+        self.rank = rank.tolist()
+        self.lcp = self.__lcp_array(self.span_start, self.sa, self.rank)
+
+    def find(self, i, limit):
+        """
+        Finds the longest match for the bytes at position i.
+        Like the original window scan, a match must start within window_size bytes and end before position i - 1.
+        :param i: coding position
+        :param limit: longest match allowed at this position
+        :return: Tuple (match length, match distance), (0, 0) when no match of at least min_match bytes exists
+        """
+        limit = min(limit, self.max_match)
+        if limit < self.min_match:
+            return 0, 0
+        if not (self.block_start <= i < self.block_end):
+            self.__load_block(i)
+
+        sa, lcp, offset = self.sa, self.lcp, self.span_start
+        window_start = i - self.window_size
+        best_length = self.min_match - 1
+        best_pos = -1
+
+        # Walk left and right from i's rank, always stepping the side that can still offer the longer match
+        r = self.rank[i - offset]
+        left, right = r, r
+        left_lcp = lcp[r] if r > 0 else 0
+        right_lcp = lcp[r + 1] if r + 1 < len(sa) else 0
+        steps = self.max_steps
+        while steps > 0:
+            if left_lcp >= right_lcp:
+                common = min(left_lcp, limit)
+                if common <= best_length:
+                    break
+                left -= 1
+                candidate = sa[left] + offset
+                left_lcp = min(left_lcp, lcp[left]) if left > 0 else 0
+            else:
+                common = min(right_lcp, limit)
+                if common <= best_length:
+                    break
+                right += 1
+                candidate = sa[right] + offset
+                right_lcp = min(right_lcp, lcp[right + 1]) if right + 1 < len(sa) else 0
+            steps -= 1
+
+            # Neighbours past the coding position or out of the window aren't usable
+            if window_start <= candidate < i - 1:
+                length = min(common, i - 1 - candidate)
+                if length > best_length:
+                    best_length = length
+                    best_pos = candidate
+                    if best_length >= limit:
+                        break
+
+        if best_pos < 0:
+            return 0, 0
+        return best_length, i - best_pos
+
+
+class LongRangeMatchFinder(object):
+    """
+    Finds long repeats anywhere in the data, however far apart, for the long range stage of LZ77.compress.
+
+    The data is cut into chunks at content defined boundaries: wherever a hash of the BOUNDARY_KEY bytes before a
+    position has its top bits clear. Boundaries depend only on the bytes around them, so a repeated region is cut the
+    same way wherever it occurs, even shifted by insertions before it. Each chunk's digest is looked up among the
+    chunks seen so far, and a hit is checked and grown forwards and backwards to the full extent of the repeat.
+    Memory grows with the number of chunks, not with the distance between repeats, unlike a sliding window.
+    """
+    BOUNDARY_KEY = 16 #bytes hashed to decide boundaries
+    SCAN_SPAN = 1 << 22 #bytes whose boundary hashes are computed per NumPy step
+    MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+
+    def __init__(self, data, average_chunk=1 << 12):
+        """
+        :param data: np.uint8 array
+        :param average_chunk: (optional) average chunk size, a power of two, chunks are between a quarter and four times
+        of it. Repeats shorter than a quarter of it are left to the sliding window.
+        """
+        if average_chunk < 64 or average_chunk & (average_chunk - 1):
+            raise ValueError("average_chunk must be a power of two, at least 64.")
+        self.data = data
+        self.shift = np.uint64(64 - average_chunk.bit_length() + 1) #keeps log2(average_chunk) top bits
+        self.min_chunk = average_chunk // 4
+        self.max_chunk = average_chunk * 4
+
+    def boundaries(self):
+        """
+        Content defined chunk boundaries, each chunk between min_chunk and max_chunk bytes (except the last).
+        :return: list of chunk ends, the last is the end of the data
+        """
+        data = self.data
+        k = self.BOUNDARY_KEY
+        candidates = []
+        for start in range(0, max(data.size - k + 1, 0), self.SCAN_SPAN):
+            count = min(self.SCAN_SPAN, data.size - k + 1 - start)
+            key = np.zeros(count, dtype=np.uint64)
+            for j in range(k):
+                key = key * np.uint64(257) + data[start + j:start + j + count]
+            # Multiplying mixes every byte into the top bits, a boundary is the end of a key with all of them clear
+            candidates.extend((np.flatnonzero((key * self.MULTIPLIER) >> self.shift == 0) + start + k).tolist())
+
+        cuts = []
+        last = 0
+        for cut in candidates + [data.size]:
+            if cut - last < self.min_chunk and cut != data.size:
+                continue
+            while cut - last > self.max_chunk:
+                last += self.max_chunk
+                cuts.append(last)
+            if cut > last:
+                cuts.append(cut)
+                last = cut
+        return cuts
+
+    def find(self):
+        """
+        Finds the repeats, in order and not overlapping each other.
+        :return: list of Tuples (start, length, distance), the data at start repeats the data distance bytes before it
+        """
+        data = self.data
+        seen = {} #chunk digest -> where the chunk first occurred
+        matches = []
+        covered = 0 #end of the last repeat found
+        start = 0
+        for end in self.boundaries():
+            chunk_start, start = start, end
+            if chunk_start < covered or end - chunk_start < self.min_chunk:
+                continue
+            digest = hashlib.blake2b(data[chunk_start:end], digest_size=16).digest()
+            source = seen.setdefault(digest, chunk_start)
+            if source == chunk_start or match_length(data, source, chunk_start, end - chunk_start) < end - chunk_start:
+                continue
+            length = end - chunk_start + match_length(data, source + end - chunk_start, end, data.size - end)
+            back = common_suffix_length(data, source, chunk_start, min(source, chunk_start - covered))
+            matches.append((chunk_start - back, length + back, chunk_start - source))
+            covered = chunk_start + length
+        return matches
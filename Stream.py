@@ -0,0 +1,234 @@
+import zlib
+from Dictionary import Dictionary
+from LZ77 import LZ77
+
+
+class StreamCompressor(object):
+    """
+    Compresses data fed in chunks into the framed format, without holding the whole input or output in memory.
+
+    Data written is buffered until a full block is available, which is then compressed and returned. Blocks are primed
+    with the window before them (carried across chunks), so the ratio matches compressing the data in one go with
+    LZ77.compress(..., block_size=..., prime=True). Memory use is bounded by the window size plus one block.
+    Like zlib's compress objects, write/flush/close return the compressed bytes ready to be written out.
+    """
+    def __init__(self, control_bytes=3, extension="", block_size=LZ77.BLOCK_SIZE, prime=True, chain_depth=64,
+                 match_finder="hash", level=0, dictionary=None, checksum=False):
+        """
+        Sets up the compressor, the frame header is returned by the first call to write, flush or close.
+        :param control_bytes: (optional) number of control bytes to use, default is 3, "auto" picks it from the first block
+        :param extension: (optional) file extension to encode in the header
+        :param block_size: (optional) bytes per block, default is LZ77.BLOCK_SIZE
+        :param prime: (optional) whether blocks may reach back into the window before them, default is True
+        :param chain_depth: (optional) hash chain links followed per position
+        :param match_finder: (optional) "hash" or "max"
+        :param level: (optional) parsing level, 0 greedy, 1 lazy, 2 optimal
+        :param dictionary: (optional) preset dictionary the first block (and every block, when primed) may reach into
+        :param checksum: (optional) whether every block carries the CRC-32 of its data, default is False
+        """
+        if block_size < 1:
+            raise ValueError("block_size must be at least 1.")
+        self.auto = control_bytes == "auto" #resolved by the first block
+        framer = LZ77(b"", 3 if self.auto else control_bytes, extension, chain_depth, match_finder, level) #validates the options
+        dictionary = Dictionary.of(dictionary)
+        self.header = bytes(framer._LZ77__generate_frame_header(dictionary, LZ77.FLAG_CHECKSUM if checksum else 0))
+        self.checksum = checksum
+        self.window_size = framer.window_size
+        self.options = dict(control_bytes=control_bytes, chain_depth=chain_depth, match_finder=match_finder, level=level)
+        self.block_size = block_size
+        self.prime = prime
+
+        self.pending = bytearray() #data written but not compressed yet
+        #last window_size bytes before the pending data (starting with the dictionary), primes the next block
+        self.history = dictionary.data[-self.window_size:] if dictionary else b""
+        self.index = bytearray() #block index entries, written out by close
+        self.frame_offset = 0 #bytes returned so far, not counting the frame header
+        self.raw_offset = 0 #bytes compressed so far
+        self.started = False
+        self.closed = False
+
+    def write(self, chunk):
+        """
+        Adds a chunk of data, compressing every full block.
+        :param chunk: data as bytes-like
+        :return: compressed bytes ready to be written out (may be empty)
+        """
+        if self.closed:
+            raise ValueError("Compressor is closed.")
+        self.pending.extend(chunk)
+        out = self.__start()
+        block_count = len(self.pending) // self.block_size
+        for k in range(block_count):
+            out.extend(self.__compress_block(bytes(self.pending[k * self.block_size:(k + 1) * self.block_size])))
+        del self.pending[:block_count * self.block_size]
+        return bytes(out)
+
+    def flush(self):
+        """
+        Compresses the data buffered so far as a (possibly short) block, so everything written can be decoded.
+        :return: compressed bytes ready to be written out
+        """
+        if self.closed:
+            raise ValueError("Compressor is closed.")
+        out = self.__start()
+        if self.pending:
+            out.extend(self.__compress_block(bytes(self.pending)))
+            self.pending = bytearray()
+        return bytes(out)
+
+    def close(self):
+        """
+        Compresses any remaining data and finishes the frame with the end block and block index.
+        :return: the last compressed bytes to be written out
+        """
+        out = bytearray(self.flush())
+        out.append(LZ77.BLOCK_END)
+        index_offset = self.frame_offset + 1
+        out.extend(self.index)
+        out.extend(LZ77.INDEX_FOOTER.pack(index_offset, len(self.index) // LZ77.INDEX_ENTRY.size, LZ77.INDEX_MAGIC))
+        self.closed = True
+        return bytes(out)
+
+    def __start(self):
+        """
+        :return: bytearray holding the frame header if nothing was returned yet, empty otherwise
+        """
+        if self.started:
+            return bytearray()
+        self.started = True
+        return bytearray(self.header)
+
+    def __compress_block(self, block):
+        """
+        Compresses one block, updating the index and the window carried into the next block.
+        :param block: block data as bytes
+        :return: block header, payload (and checksum) as bytes
+        """
+        if self.auto:
+            self.auto = False
+            self.options["control_bytes"] = LZ77.choose_control_bytes(block)
+            self.window_size = LZ77(b"", self.options["control_bytes"]).window_size
+        prefix = self.history if self.prime or self.raw_offset == 0 else b"" #the first block always gets the dictionary
+        payload = LZ77._compress_block(block, prefix, self.options)
+        if len(payload) >= len(block):
+            payload, block_type = block, LZ77.BLOCK_STORED #tokens don't pay off, store the block as is
+        else:
+            block_type = LZ77.BLOCK_TOKENS | (LZ77.BLOCK_PRIMED if prefix else 0)
+        record = LZ77.BLOCK_HEADER.pack(block_type, self.options["control_bytes"], len(block), len(payload)) + payload
+        if self.checksum:
+            record += LZ77.CHECKSUM.pack(zlib.crc32(block))
+
+        self.index.extend(LZ77.INDEX_ENTRY.pack(self.frame_offset, self.raw_offset, len(block)))
+        self.frame_offset += len(record)
+        self.raw_offset += len(block)
+        if self.prime:
+            self.history = (self.history + block)[-self.window_size:]
+        return record
+
+
+class StreamDecompressor(object):
+    """
+    Decompresses a framed stream fed in chunks, returning each block as soon as it is complete.
+
+    Only the window needed by primed blocks and one incomplete block are held in memory. Streams with the 2-byte header
+    (and frames holding a single token stream) are one token stream without blocks, so they are buffered and decoded by
+    close.
+    """
+    def __init__(self, dictionary=None):
+        """
+        Sets up the decompressor, extension is filled in once the header has been read.
+        :param dictionary: (optional) preset dictionary the stream was compressed with
+        """
+        self.dictionary = dictionary
+        self.parser = LZ77(b"") #reads the header and block headers
+        self.buffer = bytearray() #compressed data not decoded yet
+        self.header = b""
+        self.extension = None
+        self.control_byte_length = None #0 for framed streams made of blocks
+        self.history = b"" #end of the output so far, for primed blocks
+        self.ended = False #end block seen, whatever follows is the block index
+
+    def write(self, chunk):
+        """
+        Adds a chunk of compressed data, decoding every complete block.
+        :param chunk: compressed data as bytes-like
+        :return: decompressed bytes (may be empty)
+        """
+        if self.ended:
+            return b""
+        self.buffer.extend(chunk)
+        if self.control_byte_length is None and not self.__read_header():
+            return b""
+        if self.control_byte_length != 0:
+            return b"" #2-byte header stream, decoded by close
+
+        out = bytearray()
+        offset = 0
+        while offset < len(self.buffer):
+            if self.buffer[offset] == LZ77.BLOCK_END:
+                self.ended = True
+                break
+            if offset + LZ77.BLOCK_HEADER.size > len(self.buffer):
+                break
+            record_length = LZ77.BLOCK_HEADER.size + LZ77.BLOCK_HEADER.unpack_from(self.buffer, offset)[3]
+            if self.parser.frame_flags & LZ77.FLAG_CHECKSUM:
+                record_length += LZ77.CHECKSUM.size
+            if offset + record_length > len(self.buffer):
+                break #wait for the rest of the block
+            block_type, control_byte_length, raw_length, payload, checksum, offset = \
+                self.parser._LZ77__read_block(self.buffer, offset)
+            if block_type & ~LZ77.BLOCK_PRIMED == LZ77.BLOCK_LONG:
+                raise ValueError("Long range matches reach back past the window, decompress this stream with LZ77.decompress.")
+            history = self.history if block_type & LZ77.BLOCK_PRIMED else b""
+            block = LZ77._decode_block(control_byte_length, raw_length, bytes(payload), history, block_type, checksum)
+            out.extend(block)
+
+            self.parser.control_byte_length = control_byte_length
+            self.parser.varint = block_type & ~LZ77.BLOCK_PRIMED == LZ77.BLOCK_VARINT
+            self.parser._var_init()
+            window_size = self.parser.window_size
+            if block_type == LZ77.BLOCK_STORED:
+                window_size = max(window_size, LZ77.VARINT_WINDOW) #the blocks after it may hold either kind of token
+            self.history = (self.history + block)[-window_size:]
+        del self.buffer[:offset]
+        if self.ended:
+            self.buffer = bytearray()
+        return bytes(out)
+
+    def close(self):
+        """
+        Finishes decoding, checking the stream was complete.
+        :return: the remaining decompressed bytes
+        """
+        if self.control_byte_length is None:
+            raise ValueError("Compressed stream is too short to contain a valid header.")
+        if self.control_byte_length != 0:
+            decoded = LZ77(b"").decode(self.header + self.buffer, dictionary=self.dictionary)
+            self.buffer = bytearray()
+            return decoded
+        if not self.ended:
+            raise ValueError("Framed stream ended without an end block.")
+        return b""
+
+    def __read_header(self):
+        """
+        Parses the header once enough of the stream has arrived.
+        :return: True if the header was read, False if more data is needed
+        """
+        if len(self.buffer) < 2:
+            return False
+        header_length = 2
+        if (self.buffer[1] >> 4) & 0x0F == 0:
+            if len(self.buffer) < 4:
+                return False
+            flags = self.buffer[3]
+            header_length = 4 + (LZ77.DICTIONARY_ID.size if flags & LZ77.FLAG_DICTIONARY else 0) + \
+                (1 if flags & LZ77.FLAG_TOKENS else 0) + \
+                (LZ77.CHECKSUM.size if flags & LZ77.FLAG_TOKENS and flags & LZ77.FLAG_CHECKSUM else 0)
+        if len(self.buffer) < header_length:
+            return False
+        self.header = bytes(self.buffer[:header_length])
+        self.control_byte_length, self.extension, _ = self.parser._LZ77__parse_header(self.header)
+        self.history = self.parser._LZ77__dictionary_history(self.dictionary)
+        del self.buffer[:header_length]
+        return True
@@ -0,0 +1,145 @@
+import os
+import subprocess
+import sys
+import pytest
+from Archive import Archive, ArchiveReader, ArchiveWriter
+
+
+@pytest.fixture
+def txt_data():
+    """
+    Fixture to read a text file.
+    :return: loaded txt data
+    """
+    with open(os.path.join(os.path.dirname(__file__), "test_data", "Act1Scene1.txt"), "rb") as f:
+        return f.read()
+
+
+@pytest.fixture
+def members(txt_data):
+    """
+    Fixture with archive members: name -> (data, control bytes).
+    """
+    return {
+        "play.txt": (txt_data, 3),
+        "configs/app.config.yaml": (b"name: app\nport: 8080\nname: app\n", 1),
+        "configs/empty.ini": (b"", 2),
+        "noext": (txt_data[:500] * 3, 12),
+    }
+
+
+def write_archive(path, members):
+    """
+    Writes members into an archive at path.
+    """
+    with ArchiveWriter(path) as archive:
+        for name, (data, control_bytes) in members.items():
+            archive.add(name, data, control_bytes=control_bytes)
+
+
+def test_archive_roundtrip(tmp_path, members):
+    """
+    Test that every member reads back, and the central directory records its name, extension, size and control bytes.
+    """
+    path = tmp_path / "test.z77a"
+    write_archive(path, members)
+    with ArchiveReader(path) as archive:
+        assert archive.names() == list(members), "Members should be listed in the order they were added."
+        for name, (data, control_bytes) in members.items():
+            entry = archive.info(name)
+            assert entry.size == len(data), f"Wrong size recorded for {name}."
+            assert entry.control_byte_length == control_bytes, f"Wrong control byte length recorded for {name}."
+            assert entry.extension == os.path.splitext(name)[1], f"Wrong extension recorded for {name}."
+            assert archive.read(name) == data, f"{name} does not match the original data."
+
+
+def test_archive_read_single_member(tmp_path, members):
+    """
+    Test that one member decodes on its own, even when another member's data is corrupt.
+    """
+    path = tmp_path / "test.z77a"
+    write_archive(path, members)
+    archive_data = bytearray(path.read_bytes())
+    with ArchiveReader(bytes(archive_data)) as archive:
+        entry = archive.info("play.txt")
+    archive_data[entry.offset:entry.offset + entry.length] = bytes(entry.length) #zeroed control fields don't decode
+
+    with ArchiveReader(archive_data) as archive:
+        assert archive.read("noext") == members["noext"][0], "Member should decode without the others."
+        with pytest.raises(ValueError):
+            archive.read("play.txt")
+
+
+def test_archive_extract_all(tmp_path, members):
+    """
+    Test extracting every member into a directory, creating the folders in the names.
+    """
+    path = tmp_path / "test.z77a"
+    write_archive(path, members)
+    with ArchiveReader(path) as archive:
+        archive.extract_all(tmp_path / "out")
+    for name, (data, _) in members.items():
+        assert (tmp_path / "out" / name).read_bytes() == data, f"Extracted {name} does not match the original data."
+
+
+def test_archive_invalid_names(tmp_path):
+    """
+    Test that duplicate, absolute and parent directory member names are rejected.
+    """
+    with ArchiveWriter(tmp_path / "test.z77a") as archive:
+        archive.add("a.txt", b"abc")
+        with pytest.raises(ValueError, match="already has a member"):
+            archive.add("a.txt", b"def")
+        for name in ("/etc/passwd", "../a.txt", "dir/./a.txt", ""):
+            with pytest.raises(ValueError):
+                archive.add(name, b"abc")
+    assert Archive.member_name("../dir/./b.txt") == "dir/b.txt", "Paths should be made relative."
+
+
+def test_archive_missing_member(tmp_path, members):
+    """
+    Test that asking for a member that isn't in the archive raises a KeyError.
+    """
+    path = tmp_path / "test.z77a"
+    write_archive(path, members)
+    with ArchiveReader(path) as archive:
+        with pytest.raises(KeyError):
+            archive.read("missing.txt")
+
+
+@pytest.mark.parametrize("corrupt", ["magic", "footer", "truncated"])
+def test_archive_corrupt(tmp_path, members, corrupt):
+    """
+    Test that files that aren't archives, or have a damaged central directory, are rejected.
+    """
+    path = tmp_path / "test.z77a"
+    write_archive(path, members)
+    data = path.read_bytes()
+    if corrupt == "magic":
+        data = b"X" + data[1:]
+    elif corrupt == "footer":
+        data = data[:-1] + b"X"
+    else:
+        data = data[:-30]
+    with pytest.raises(ValueError):
+        ArchiveReader(data)
+
+
+def test_archive_cli(tmp_path, txt_data):
+    """
+    Test creating, listing and extracting an archive from the command line.
+    """
+    script = os.path.join(os.path.dirname(os.path.dirname(__file__)), "Archive.py")
+    source = tmp_path / "src"
+    (source / "sub").mkdir(parents=True)
+    (source / "play.txt").write_bytes(txt_data)
+    (source / "sub" / "notes.md").write_bytes(b"notes")
+
+    subprocess.run([sys.executable, script, "-c", "test.z77a", "src", "-r"], cwd=tmp_path, check=True)
+    listing = subprocess.run([sys.executable, script, "-l", "test.z77a"], cwd=tmp_path, check=True,
+                             capture_output=True, text=True).stdout
+    assert "src/play.txt" in listing and "src/sub/notes.md" in listing, f"Members not listed:\n{listing}"
+
+    subprocess.run([sys.executable, script, "-x", "test.z77a", "out"], cwd=tmp_path, check=True)
+    assert (tmp_path / "out" / "src" / "play.txt").read_bytes() == txt_data, "Extracted file does not match."
+    assert (tmp_path / "out" / "src" / "sub" / "notes.md").read_bytes() == b"notes", "Extracted file does not match."
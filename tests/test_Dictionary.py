@@ -0,0 +1,68 @@
+import json
+import random
+import pytest
+from Dictionary import Dictionary
+from LZ77 import LZ77
+
+
+@pytest.fixture
+def records():
+    """
+    Fixture with small JSON records that share their structure but not their values.
+    :return: list of records as bytes
+    """
+    rng = random.Random(7)
+    return [json.dumps({"timestamp": f"2026-10-{rng.randrange(1, 29):02d}T{rng.randrange(24):02d}:00:00Z",
+                        "level": rng.choice(["INFO", "WARN", "ERROR"]), "service": rng.choice(["billing", "auth"]),
+                        "request_id": "%032x" % rng.getrandbits(128), "latency_ms": rng.randrange(2000),
+                        "message": rng.choice(["Request completed successfully", "Upstream timeout, retrying"])}).encode()
+            for _ in range(400)]
+
+
+def test_train_collects_shared_content(records):
+    """
+    Test that the dictionary respects the size limit and holds the structure the records share, not their unique parts.
+    """
+    dictionary = Dictionary.train(records[:300], size=2000)
+    assert 0 < len(dictionary) <= 2000, f"Dictionary of {len(dictionary)} bytes exceeds the size limit."
+    for shared in (b'"request_id": "', b'"latency_ms": ', b"Request completed successfully"):
+        assert shared in dictionary.data, f"Shared content {shared} missing from the dictionary."
+    assert not any(json.loads(record)["request_id"].encode() in dictionary.data for record in records[:300]), \
+        "Content unique to one record should not be picked."
+
+
+def test_dictionary_improves_small_records(records):
+    """
+    Test that small records unseen in training compress smaller with the dictionary, and decompress with it.
+    """
+    dictionary = Dictionary.train(records[:300], size=4000)
+    plain = sum(len(LZ77.compress(record, control_bytes=2)) for record in records[300:])
+    primed = [LZ77.compress(record, control_bytes=2, dictionary=dictionary) for record in records[300:]]
+    assert sum(map(len, primed)) < plain * 0.6, "Expected the dictionary to shrink small records substantially."
+    for record, compressed in zip(records[300:], primed):
+        assert LZ77.decompress(compressed, dictionary=dictionary)[0] == record, "Record does not round trip."
+
+
+def test_train_invalid():
+    """
+    Test that samples without shared content, or too short to train on, are rejected.
+    """
+    with pytest.raises(ValueError, match="No samples"):
+        Dictionary.train([b"abc", b""])
+    with pytest.raises(ValueError, match="share no content"):
+        Dictionary.train([bytes(range(i, i + 50)) for i in range(0, 200, 50)])
+    with pytest.raises(ValueError):
+        Dictionary.train([b"abcdefghij"] * 2, size=0)
+
+
+def test_save_load(tmp_path, records):
+    """
+    Test that a saved dictionary loads with the same content and id, and that the id follows the content.
+    """
+    dictionary = Dictionary.train(records, size=1000)
+    path = tmp_path / "records.dict"
+    dictionary.save(path)
+    loaded = Dictionary.load(path)
+    assert loaded.data == dictionary.data and loaded.id == dictionary.id, "Loaded dictionary differs."
+    assert Dictionary(b"other").id != dictionary.id, "Different content should give a different id."
+    assert Dictionary.of(dictionary.data).id == dictionary.id, "Raw content should wrap into the same dictionary."
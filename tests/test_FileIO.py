@@ -10,7 +10,7 @@ def txt_data():
     Fixture to read a text file.
     :return: loaded txt data
     """
-    with open(os.path.join(os.path.dirname(__file__), "test_data", "act1scene1.txt"), "rb") as f:
+    with open(os.path.join(os.path.dirname(__file__), "test_data", "Act1Scene1.txt"), "rb") as f:
         return f.read()
 
 @pytest.fixture
@@ -130,4 +130,47 @@ def test_read_txt(txt_data, tmp_path):
         f.write(txt_data)
 
     data = FileIO.read(txt_file)
-    assert data == txt_data, "TXT data read mismatch."
\ No newline at end of file
+    assert data == txt_data, "TXT data read mismatch."
+
+def test_read_chunks(txt_data, tmp_path):
+    """
+    Test reading a file in chunks.
+    """
+    txt_file = tmp_path / "test.txt"
+    txt_file.write_bytes(txt_data)
+    chunks = list(FileIO.read_chunks(txt_file, chunk_size=1000))
+    assert b"".join(chunks) == txt_data, "Chunks don't add up to the file content."
+    assert all(len(chunk) == 1000 for chunk in chunks[:-1]), "Chunks should be chunk_size bytes."
+
+def test_open_mapped(txt_data, tmp_path):
+    """
+    Test mapping a file, an empty file and a nonexistent file.
+    """
+    txt_file = tmp_path / "test.txt"
+    txt_file.write_bytes(txt_data)
+    with FileIO.open_mapped(txt_file) as mapped:
+        assert mapped[:] == txt_data, "Mapped content does not match the file content."
+
+    empty_file = tmp_path / "empty_file.txt"
+    empty_file.write_bytes(b"")
+    with FileIO.open_mapped(empty_file) as mapped:
+        assert len(mapped) == 0, "Expected an empty mapping for an empty file."
+
+    with pytest.raises(RuntimeError, match="Failed to read from"):
+        with FileIO.open_mapped(tmp_path / "nonexistent_file.txt"):
+            pass
+
+def test_write_mapped(pdf_data, tmp_path):
+    """
+    Test writing data through a mapping of the preallocated file, replacing a longer file.
+    """
+    file_path = tmp_path / "output_file.pdf"
+    file_path.write_bytes(b"x" * (len(pdf_data) + 100))
+    FileIO.write_mapped(pdf_data, file_path)
+    assert file_path.read_bytes() == pdf_data, "Written data does not match expected content."
+
+    FileIO.write_mapped(b"", file_path)
+    assert file_path.read_bytes() == b"", "Expected an empty file."
+
+    with pytest.raises(RuntimeError, match="Failed to write to"):
+        FileIO.write_mapped(b"Test data", "/invalid_path/output_file.txt")
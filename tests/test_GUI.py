@@ -27,7 +27,7 @@ def txt_data():
     Fixture to read a text file.
     :return: loaded txt data
     """
-    with open(os.path.join(os.path.dirname(__file__), "test_data", "act1scene1.txt"), "rb") as f:
+    with open(os.path.join(os.path.dirname(__file__), "test_data", "Act1Scene1.txt"), "rb") as f:
         return f.read()
 
 @pytest.fixture
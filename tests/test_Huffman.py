@@ -0,0 +1,67 @@
+import os
+import pytest
+import numpy as np
+from Huffman import Huffman
+
+
+@pytest.fixture
+def txt_data():
+    """
+    Fixture to read a text file.
+    :return: loaded txt data
+    """
+    with open(os.path.join(os.path.dirname(__file__), "test_data", "Act1Scene1.txt"), "rb") as f:
+        return f.read()
+
+
+@pytest.mark.parametrize("size", [0, 1, 2, 255, 256, 1000, 70000])
+def test_huffman_roundtrip(txt_data, size):
+    """
+    Test that symbols decode back, across lane counts and with leftover symbols in the last round.
+    """
+    data = np.frombuffer((txt_data * (size // len(txt_data) + 1))[:size], dtype=np.uint8)
+    coded = Huffman.encode(data)
+    decoded, end = Huffman.decode(b"xyz" + coded, 3)
+    assert end == len(coded) + 3, "Decoding should end where the coded symbols end."
+    assert np.array_equal(decoded, data), f"Mismatch after coding {size} symbols."
+    if size > 1000:
+        assert len(coded) < 0.7 * size, f"Text coded into {len(coded)} bytes, expected a smaller size."
+
+
+def test_huffman_single_symbol():
+    """
+    Test that a stream of one repeated symbol round trips with a 1-bit code.
+    """
+    data = np.full(5000, 7, dtype=np.uint8)
+    coded = Huffman.encode(data)
+    assert len(coded) < 5000 // 8 + 200, f"A lone symbol took {len(coded)} bytes."
+    assert np.array_equal(Huffman.decode(coded)[0], data), "Mismatch with a single symbol."
+
+
+def test_code_lengths_limited():
+    """
+    Test that skewed counts give codes within the length limit that still form a complete prefix code.
+    """
+    counts = np.array([2 ** k for k in range(30)] + [0] * 226)
+    lengths = Huffman.code_lengths(counts)
+    used = lengths > 0
+    assert lengths.max() == Huffman.MAX_CODE_LENGTH, "Codes should be cut to the length limit."
+    assert np.array_equal(used, counts > 0), "Exactly the occurring symbols should have codes."
+    kraft = (2.0 ** -lengths[used]).sum()
+    assert kraft == 1, f"Code lengths should fill the code space exactly, Kraft sum is {kraft}."
+    assert (np.diff(lengths[:30]) <= 0).all(), "More frequent symbols shouldn't get longer codes."
+
+
+def test_huffman_corrupt(txt_data):
+    """
+    Test that truncated streams, invalid code lengths and symbol counts over the limit are rejected.
+    """
+    coded = bytearray(Huffman.encode(np.frombuffer(txt_data, dtype=np.uint8)))
+    with pytest.raises(ValueError, match="Truncated"):
+        Huffman.decode(bytes(coded[:-1]))
+    with pytest.raises(ValueError):
+        Huffman.decode(bytes(coded), max_count=len(txt_data) - 1)
+    invalid = bytearray(coded)
+    invalid[Huffman.HEADER.size:Huffman.HEADER.size + Huffman.CODE_LENGTHS] = bytes([0x11]) * Huffman.CODE_LENGTHS
+    with pytest.raises(ValueError, match="code lengths"):
+        Huffman.decode(bytes(invalid))
@@ -1,9 +1,13 @@
 import pytest
 import os
 import subprocess
+import time
+import tracemalloc
 import logging
+import numpy as np
 import pytest
-from LZ77 import LZ77, MatchToken, LiteralToken
+from LZ77 import LZ77, MatchToken, LiteralToken, TokenStore
+from FileIO import FileIO
 
 
 @pytest.fixture
@@ -12,7 +16,7 @@ def txt_data():
     Fixture to read a text file.
     :return: loaded txt data
     """
-    with open(os.path.join(os.path.dirname(__file__), "test_data", "act1scene1.txt"), "rb") as f:
+    with open(os.path.join(os.path.dirname(__file__), "test_data", "Act1Scene1.txt"), "rb") as f:
         return f.read()
 
 @pytest.fixture
@@ -42,15 +46,10 @@ def temp_file(tmp_path):
     temp.write_bytes(b"Temporary file content")
     return temp
 @pytest.fixture(autouse=True)
-def reset_lz77():
+def reset_logging():
     """
-       Reset the LZ77 class between tests to ensure no residual state is carried over.
+       Reset the logging setup between tests to ensure no residual state is carried over.
        """
-    # Reset class-level attributes
-    LZ77.compressed_data = []
-    LZ77.literal_buffer = []
-
-    # Optionally reset other shared/global states (e.g., logging)
     logging.getLogger("LZ77").handlers.clear()
     logging.basicConfig(level=logging.WARNING)
 
@@ -96,6 +95,38 @@ def test_tokenize_simple_pattern():
     assert second_token.dist > 0, f"Expected a non-zero distance, got {second_token.dist}."
 
 
+def test_token_store_columns():
+    """
+    Test that tokens are stored as columns, with literal runs kept as spans of the raw data.
+    """
+    raw_data = b"coolcoolcool"
+    lz = LZ77(raw_data, control_bytes=2)
+    tokens = lz.tokenize()
+
+    assert isinstance(tokens, TokenStore), "Expected tokenize to fill a TokenStore."
+    assert list(tokens.kind) == [0, 1, 1, 0], f"Unexpected token kinds {list(tokens.kind)}."
+    assert list(tokens.length) == [4, 3, 3, 2], f"Unexpected token lengths {list(tokens.length)}."
+    assert list(tokens.value) == [0, 4, 4, 10], "Literal runs should hold their start, matches their distance."
+
+def test_token_store_views(txt_data):
+    """
+    Test the dataclass views of a TokenStore: indexing, negative indices, slices and iteration.
+    """
+    lz = LZ77(txt_data, control_bytes=3)
+    tokens = lz.tokenize()
+    views = list(tokens)
+
+    assert len(views) == len(tokens), "Iteration should give one view per token."
+    assert tokens[-1] == views[-1], "Negative indices should give the same view."
+    assert tokens[1:4] == views[1:4], "Slices should give a list of views."
+    position = 0
+    for token in views:
+        if isinstance(token, LiteralToken):
+            assert bytes(token.data) == txt_data[position:position + token.length], "Literal view data mismatch."
+        position += token.length
+    assert position == len(txt_data), "Token views should cover the raw data."
+
+
 @pytest.mark.parametrize("control_bytes", [1, 2, 3, 4, 5, 6, 7, 8, 9, 10])
 def test_tokenize_mixed_literals_and_patterns_short(data_short,control_bytes):
     """
@@ -210,6 +241,747 @@ def test_compression_ratio(txt_data,control_bytes):
     compressed = LZ77.compress(raw_data, control_bytes=control_bytes)
     assert len(compressed) < len(raw_data), f"Expected compressed data to be smaller than raw data. Control Byte size:  {control_bytes}"
 
+@pytest.mark.parametrize("control_bytes", [1, 2, 3])
+def test_max_match_finder(txt_data, control_bytes):
+    """
+    Test that the suffix array match finder round trips.
+    """
+    raw_data = txt_data
+    compressed = LZ77.compress(raw_data, control_bytes=control_bytes, match_finder="max")
+    decompressed, _ = LZ77.decompress(compressed)
+
+    assert decompressed == raw_data, f"Decompressed data does not match the original data. Control Byte size:  {control_bytes}"
+
+@pytest.mark.parametrize("level", [0, 1, 2])
+@pytest.mark.parametrize("control_bytes", [1, 2, 3])
+def test_compression_levels(txt_data, control_bytes, level):
+    """
+    Test that every parsing level round trips.
+    """
+    raw_data = txt_data
+    compressed = LZ77.compress(raw_data, control_bytes=control_bytes, level=level)
+    decompressed, _ = LZ77.decompress(compressed)
+
+    assert decompressed == raw_data, f"Decompressed data mismatch for level={level}, control_bytes={control_bytes}"
+
+@pytest.mark.parametrize("control_bytes", [1, 2, 3, 4])
+def test_optimal_parse_smallest(txt_data, control_bytes):
+    """
+    Test that the optimal parse is never larger than the greedy parse.
+    """
+    raw_data = txt_data
+    sizes = []
+    for level in (0, 2):
+        sizes.append(len(LZ77.compress(raw_data, control_bytes=control_bytes, level=level)))
+
+    assert sizes[1] <= sizes[0], f"Optimal parse ({sizes[1]}) larger than greedy ({sizes[0]}). Control Byte size:  {control_bytes}"
+
+@pytest.mark.parametrize("varint", [False, True])
+def test_optimal_parse_smallest_random(varint):
+    """
+    Test that the optimal parse is never larger than the greedy parse, on random data with repeats copied into it.
+    """
+    rng = np.random.default_rng(77)
+    for trial in range(60):
+        size = int(rng.integers(200, 5000))
+        data = rng.integers(97, 97 + int(rng.integers(2, 20)), size).astype(np.uint8)
+        for _ in range(int(rng.integers(0, 20))):
+            source, target = rng.integers(0, size, 2)
+            segment = data[source:source + int(rng.integers(4, 300))].copy()
+            data[target:target + segment.size] = segment[:size - target]
+        raw_data = data.tobytes()
+        control_bytes = int(rng.integers(1, 6))
+        sizes = [len(LZ77.compress(raw_data, control_bytes=control_bytes, level=level, varint=varint))
+                 for level in (0, 2)]
+        assert sizes[1] <= sizes[0], f"Optimal parse ({sizes[1]}) larger than greedy ({sizes[0]}). Trial: {trial}, Control Byte size:  {control_bytes}"
+
+@pytest.mark.parametrize("control_bytes", [3, 5])
+def test_optimal_parse_time(txt_data, control_bytes):
+    """
+    Test that the optimal parse of repetitive data, full of long matches, takes a small multiple of the greedy parse's time.
+    """
+    raw_data = txt_data * 30
+    times = []
+    for level in (0, 2):
+        started = time.perf_counter()
+        compressed = LZ77.compress(raw_data, control_bytes=control_bytes, level=level)
+        times.append(time.perf_counter() - started)
+
+    assert LZ77.decompress(compressed)[0] == raw_data, f"Optimal parse mismatch. Control Byte size:  {control_bytes}"
+    assert times[1] < 20 * times[0] + 0.5, f"Optimal parse took {times[1]:.2f}s, greedy {times[0]:.2f}s."
+
+def test_lazy_defers_to_longer_match():
+    """
+    Test that lazy matching skips a short match when a longer one starts on the next byte.
+    """
+    raw_data = b"bcdefghijk.abcde_abcdefghijk."
+    lz = LZ77(raw_data, control_bytes=3, level=1)
+    lz.tokenize()
+
+    # Greedy would take "abcde" (5 bytes) at the second 'a', lazy waits a byte for "bcdefghijk" (10 bytes)
+    matches = [token.length for token in lz.compressed_data if isinstance(token, MatchToken)]
+    assert matches == [4, 10], f"Expected the deferred match of length 10, got {matches}."
+
+@pytest.mark.parametrize("prime", [False, True])
+@pytest.mark.parametrize("workers", [1, 2])
+def test_block_compress(txt_data, workers, prime):
+    """
+    Test block compression in the framed format, in process and across a process pool.
+    """
+    raw_data = txt_data
+    compressed = LZ77.compress(raw_data, control_bytes=2, extension=".txt", workers=workers, block_size=1000, prime=prime)
+    decompressed, extension = LZ77.decompress(compressed)
+
+    assert compressed[:4] == bytes([0xC7, 0x01, LZ77.FRAME_VERSION, 0x00]), "Expected a framed format header."
+    assert decompressed == raw_data, f"Decompressed data mismatch for workers={workers}, prime={prime}"
+    assert extension == ".txt", "Extension lost in the framed format header."
+
+def test_block_compress_records_boundaries(txt_data):
+    """
+    Test that each block header records the block's raw and payload lengths.
+    """
+    raw_data = txt_data
+    compressed = LZ77.compress(raw_data, control_bytes=3, block_size=1024)
+
+    offset, raw_lengths = 4, []
+    while compressed[offset] != LZ77.BLOCK_END:
+        block_type, control_bytes, raw_length, payload_length = LZ77.BLOCK_HEADER.unpack_from(compressed, offset)
+        assert block_type in (LZ77.BLOCK_TOKENS, LZ77.BLOCK_STORED), "Unprimed blocks should be token or stored blocks."
+        assert control_bytes == 3, "Block header should carry the control byte length."
+        raw_lengths.append(raw_length)
+        offset += LZ77.BLOCK_HEADER.size + payload_length
+
+    index_offset, count, magic = LZ77.INDEX_FOOTER.unpack_from(compressed, len(compressed) - LZ77.INDEX_FOOTER.size)
+    assert offset + 1 == 4 + index_offset, "Block index should follow the end block."
+    assert count == len(raw_lengths) and magic == LZ77.INDEX_MAGIC, "Block index footer mismatch."
+    assert raw_lengths == [1024, 1024, 1024, len(raw_data) - 3072], f"Unexpected block boundaries {raw_lengths}."
+
+def test_block_compress_empty():
+    """
+    Test the framed format with empty data.
+    """
+    compressed = LZ77.compress(b"", block_size=1024)
+    decompressed, _ = LZ77.decompress(compressed)
+    assert decompressed == b"", "Empty data compression/decompression failed."
+
+def test_block_truncated(txt_data):
+    """
+    Test that a framed stream missing its end is rejected.
+    """
+    compressed = LZ77.compress(txt_data, block_size=1024)
+    with pytest.raises(ValueError, match="Truncated block|without an end block"):
+        LZ77.decompress(compressed[:len(compressed) // 2])
+
+@pytest.mark.parametrize("prime", [False, True])
+def test_block_decompress_parallel(txt_data, prime):
+    """
+    Test decoding the blocks of an indexed frame across a process pool (primed frames fall back to sequential).
+    """
+    compressed = LZ77.compress(txt_data, block_size=1000, prime=prime)
+    decompressed, _ = LZ77.decompress(compressed, workers=2)
+    assert decompressed == txt_data, f"Parallel decompression mismatch for prime={prime}"
+
+@pytest.mark.parametrize("prime", [False, True])
+@pytest.mark.parametrize("start, end", [(0, 10), (990, 1010), (1000, 2000), (1500, 4500), (4000, 10**9), (5, 5)])
+def test_decompress_range(txt_data, prime, start, end):
+    """
+    Test decoding a byte range of an indexed frame, within a block, across blocks and past the end.
+    """
+    compressed = LZ77.compress(txt_data, block_size=1000, prime=prime)
+    assert LZ77.decompress_range(compressed, start, end) == txt_data[start:end], f"Range {start}:{end} mismatch."
+
+def test_decompress_range_legacy(data_short):
+    """
+    Test that ranges of streams with the 2-byte header are decoded too.
+    """
+    compressed = LZ77.compress(data_short)
+    assert LZ77.decompress_range(compressed, 3, 17) == data_short[3:17], "Range mismatch for a 2-byte header stream."
+
+def test_decompress_range_invalid(txt_data):
+    """
+    Test that negative or reversed ranges are rejected.
+    """
+    compressed = LZ77.compress(txt_data, block_size=1000)
+    with pytest.raises(ValueError, match="Invalid range"):
+        LZ77.decompress_range(compressed, 10, 5)
+
+def test_frame_version_1(txt_data):
+    """
+    Test that frames without a block index (version 1) still decode.
+    """
+    compressed = LZ77.compress(txt_data, block_size=1000)
+    index_offset, _, _ = LZ77.INDEX_FOOTER.unpack_from(compressed, len(compressed) - LZ77.INDEX_FOOTER.size)
+    version_1 = compressed[:2] + bytes([1]) + compressed[3:4 + index_offset]
+    decompressed, _ = LZ77.decompress(version_1, workers=2)
+    assert decompressed == txt_data, "Version 1 frame failed to decode."
+
+def test_block_index_corrupt(txt_data):
+    """
+    Test that a damaged block index is rejected by random access reads.
+    """
+    compressed = LZ77.compress(txt_data, block_size=1000)
+    with pytest.raises(ValueError, match="Invalid block index"):
+        LZ77.decompress_range(compressed[:-1] + b"?", 0, 10)
+
+def test_verify_header_framed(tmp_path, data_short):
+    """
+    Test that verify_header recognizes the framed format.
+    """
+    compressed_file = tmp_path / "framed.Z77"
+    compressed_file.write_bytes(LZ77.compress(data_short, extension=".md", block_size=256))
+    is_comp, extension = LZ77.verify_header(compressed_file)
+    assert is_comp, "Framed header not recognized."
+    assert extension == ".md", "Extension not read from the framed header."
+
+@pytest.mark.parametrize("dist, length", [(1, 9), (2, 7), (3, 31), (2, 2), (5, 3)])
+def test_decode_overlapping_match(dist, length):
+    """
+    Test decoding matches that run into their own output (length > dist) as well as plain ones.
+    """
+    # cb=2: 15 usable bits, 5 for the match length and 10 for the distance
+    literal = b"abcde"[:dist]
+    stream = bytes([0xC7, 2 << 4]) + len(literal).to_bytes(2, "big") + literal
+    stream += (0x8000 | (length << 10) | dist).to_bytes(2, "big")
+    expected = bytearray(literal)
+    for _ in range(length):
+        expected.append(expected[-dist])
+
+    decompressed, _ = LZ77.decompress(stream)
+    assert decompressed == bytes(expected), f"Match of length {length} at distance {dist} decoded wrong."
+
+@pytest.mark.parametrize("options", [{}, {"level": 1}, {"level": 2}, {"control_bytes": 1}, {"varint": True},
+                                     {"match_finder": "max"}])
+def test_runs_become_overlapping_matches(txt_data, options):
+    """
+    Test that runs of a byte or short pattern are tokenized as overlapping matches at the pattern's distance, and round
+    trip between text.
+    """
+    data = txt_data[:300] + bytes(5000) + txt_data[300:600] + b"\x00\xff" * 3000 + txt_data[600:900]
+    lz = LZ77(data, **options)
+    lz.tokenize()
+    matches = [token for token in lz.compressed_data if isinstance(token, MatchToken)]
+    run_bytes = sum(token.length for token in matches if token.dist <= 2 < token.length)
+    assert run_bytes >= 10900, f"Only {run_bytes} bytes of the runs were covered by overlapping matches."
+    compressed = LZ77.compress(data, **options)
+    assert LZ77.decompress(compressed)[0] == data, "Mismatch with runs between text."
+
+def test_decode_zero_distance():
+    """
+    Test that a match with distance 0 is rejected instead of looping.
+    """
+    stream = bytes([0xC7, 2 << 4]) + b"\x00\x01a" + (0x8000 | (4 << 10)).to_bytes(2, "big")
+    with pytest.raises(ValueError, match="Invalid start index"):
+        LZ77.decompress(stream)
+
+@pytest.mark.parametrize("control_bytes", [1, 2, 3, 9, 15])
+def test_uncompressed_size(txt_data, control_bytes):
+    """
+    Test that the uncompressed size is found without decoding, for the 2-byte header and framed formats.
+    """
+    compressed = LZ77.compress(txt_data, control_bytes=control_bytes)
+    assert LZ77.uncompressed_size(compressed) == len(txt_data), f"Wrong size for control_bytes={control_bytes}."
+    decompressed, _ = LZ77.decompress(compressed)
+    assert decompressed == txt_data, f"Two-pass decoding mismatch for control_bytes={control_bytes}."
+
+    framed = LZ77.compress(txt_data, control_bytes=control_bytes, block_size=1000)
+    assert LZ77.uncompressed_size(framed) == len(txt_data), "Wrong size for the framed format."
+
+@pytest.mark.parametrize("block_size", [None, 1000])
+def test_mapped_round_trip(txt_data, tmp_path, block_size):
+    """
+    Test compressing from a mapped file and decompressing straight into a mapped output file.
+    """
+    source = tmp_path / "source.txt"
+    source.write_bytes(txt_data)
+    with FileIO.open_mapped(source) as mapped:
+        compressed = LZ77.compress(mapped, block_size=block_size)
+    assert compressed == LZ77.compress(txt_data, block_size=block_size), "Mapped input compressed differently."
+
+    destination = tmp_path / "destination.txt"
+    with FileIO.create_mapped(destination, LZ77.uncompressed_size(compressed)) as out:
+        result, extension = LZ77.decompress(compressed, out=out)
+        assert result is out, "Expected the output buffer to be returned."
+    assert destination.read_bytes() == txt_data, "Mapped output file does not match the original data."
+
+def test_decompress_into_wrong_size(data_short):
+    """
+    Test that an output buffer of the wrong size is rejected.
+    """
+    compressed = LZ77.compress(data_short)
+    with pytest.raises(ValueError, match="Output buffer holds"):
+        LZ77.decompress(compressed, out=bytearray(len(data_short) + 1))
+
+@pytest.mark.parametrize("options", [{}, {"block_size": 1000}, {"block_size": 1000, "prime": True},
+                                     {"block_size": 1000, "workers": 2}, {"control_bytes": 2}])
+def test_dictionary_roundtrip(txt_data, options):
+    """
+    Test compressing with a preset dictionary, as one token stream and as blocks, and that it pays off on the start.
+    """
+    dictionary = txt_data[:3000]
+    data = txt_data[1000:2500] + b"a fresh ending"
+    compressed = LZ77.compress(data, dictionary=dictionary, **options)
+    decompressed, _ = LZ77.decompress(compressed, workers=options.get("workers", 1), dictionary=dictionary)
+    assert decompressed == data, f"Decompressed data mismatch for {options}."
+    assert len(compressed) < len(LZ77.compress(data, **options)), f"Dictionary didn't help for {options}."
+    assert LZ77.uncompressed_size(compressed) == len(data), f"Wrong uncompressed size for {options}."
+    if "block_size" in options:
+        assert LZ77.decompress_range(compressed, 900, 1200, dictionary=dictionary) == data[900:1200], \
+            f"Range mismatch for {options}."
+
+def test_dictionary_required(txt_data, tmp_path):
+    """
+    Test that decompressing without the dictionary, or with another one, is rejected.
+    """
+    compressed = LZ77.compress(txt_data[:500], dictionary=txt_data[:3000])
+    compressed_file = tmp_path / "primed.Z77"
+    compressed_file.write_bytes(compressed)
+    with pytest.raises(ValueError, match="which wasn't given"):
+        LZ77.decompress(compressed)
+    with pytest.raises(ValueError, match="not"):
+        LZ77.decompress(compressed, dictionary=txt_data[:2999])
+    assert LZ77.verify_header(compressed_file)[0], "Header of a stream with a dictionary should verify."
+
+@pytest.mark.parametrize("reference_size", [5000, 200000])
+def test_delta_roundtrip(reference_size):
+    """
+    Test that a delta against a near-identical reference stores only the differences, also when the reference is
+    further back than the default window reaches.
+    """
+    import random
+    rng = random.Random(reference_size)
+    reference = bytes(rng.randrange(256) for _ in range(reference_size))
+    new = bytearray(reference)
+    new[reference_size // 3:reference_size // 3 + 5] = b"patch"
+    new = bytes(new[:reference_size // 2] + b"inserted" + new[reference_size // 2:])
+
+    delta = LZ77.compress_delta(new, reference)
+    assert len(delta) < len(new) // 20, f"Delta of {len(delta)} bytes is too large."
+    decompressed, _ = LZ77.decompress_delta(delta, reference)
+    assert decompressed == new, "Delta does not decompress to the new version."
+    with pytest.raises(ValueError, match="not"):
+        LZ77.decompress_delta(delta, reference[1:])
+
+def test_delta_empty_reference(data_short):
+    """
+    Test deltas against an empty reference, and of an empty version.
+    """
+    assert LZ77.decompress_delta(LZ77.compress_delta(data_short, b""), b"")[0] == data_short, "Mismatch on empty reference."
+    assert LZ77.decompress_delta(LZ77.compress_delta(b"", data_short), data_short)[0] == b"", "Mismatch on empty version."
+
+@pytest.mark.parametrize("control_bytes, block_size", [(2, None), (3, 65536), (1, 1 << 20)])
+def test_long_range_roundtrip(control_bytes, block_size):
+    """
+    Test that repeats far beyond the window are matched with long range matches, also across block boundaries, and
+    that the stream (or any range of it) decodes back.
+    """
+    import random
+    rng = random.Random(control_bytes)
+    region = bytes(rng.randrange(256) for _ in range(100000))
+    data = region + bytes(rng.randrange(256) for _ in range(80000)) + region[20000:] + b"end"
+
+    plain = LZ77.compress(data, control_bytes=control_bytes, block_size=block_size)
+    compressed = LZ77.compress(data, control_bytes=control_bytes, block_size=block_size, long_range=True)
+    assert len(compressed) < len(plain) - 70000, f"Long range compression of {len(compressed)} bytes is too large."
+    assert LZ77.decompress(compressed)[0] == data, "Long range stream does not round trip."
+    assert LZ77.decompress_range(compressed, 170000, 200000) == data[170000:200000], "Range does not match."
+    assert LZ77.decompress(LZ77.compress(b"", long_range=True))[0] == b"", "Mismatch on empty data."
+
+@pytest.mark.parametrize("options", [{}, {"level": 1}, {"level": 2}, {"prime": True, "block_size": 1000},
+                                     {"workers": 2, "block_size": 1000}, {"long_range": True}])
+def test_varint_roundtrip(txt_data, options):
+    """
+    Test that varint tokens round trip with every parsing level and block layout, and beat fixed control bytes.
+    """
+    compressed = LZ77.compress(txt_data, varint=True, **options)
+    fixed = LZ77.compress(txt_data, **{k: v for k, v in options.items() if k != "long_range"})
+    assert len(compressed) < len(fixed), f"Varint tokens took {len(compressed)} bytes, control bytes {len(fixed)}."
+    assert LZ77.decompress(compressed, workers=options.get("workers", 1))[0] == txt_data, "Mismatch with varint tokens."
+    assert LZ77.decompress_range(compressed, 1500, 2500) == txt_data[1500:2500], "Range does not match."
+
+def test_varint_far_match():
+    """
+    Test that varint matches reach further back than the control bytes allow, and that near ones stay small.
+    """
+    import random
+    rng = random.Random(5)
+    region = bytes(rng.randrange(256) for _ in range(5000))
+    data = region + bytes(rng.randrange(256) for _ in range(200000)) + region + b"ab" * 500
+    compressed = LZ77.compress(data, control_bytes=2, varint=True)
+    assert len(compressed) < len(data) - 5400, f"Varint stream of {len(compressed)} bytes missed the far match."
+    assert LZ77.decompress(compressed)[0] == data, "Mismatch with a far varint match."
+
+def test_varint_corrupt(txt_data):
+    """
+    Test that varint tokens running past the end of the block are rejected.
+    """
+    compressed = bytearray(LZ77.compress(txt_data, varint=True))
+    header = 4 + LZ77.BLOCK_HEADER.size
+    compressed[header] = 0xFE #literal run tag, its length continues in the next byte
+    compressed[header + 1] = 0x7F
+    with pytest.raises(ValueError):
+        LZ77.decompress(bytes(compressed))
+
+def test_incompressible_probe(txt_data):
+    """
+    Test that the probe flags random data, but not text, small inputs, or random data holding a repeat.
+    """
+    import random
+    rng = random.Random(9)
+    noise = np.frombuffer(bytes(rng.randrange(256) for _ in range(100000)), dtype=np.uint8)
+    assert LZ77.incompressible(noise), "Random data should look incompressible."
+    assert not LZ77.incompressible(np.frombuffer(txt_data * 20, dtype=np.uint8)), "Text should look compressible."
+    assert not LZ77.incompressible(noise[:1000]), "Small inputs aren't probed."
+    assert not LZ77.incompressible(np.concatenate([noise, noise[:20000]])), "A repeat should make it compressible."
+    assert not LZ77.incompressible(np.concatenate([noise, noise[5:60000]]), 100000), "A repeat of the prefix counts too."
+
+@pytest.mark.parametrize("size, strings", [(100000, 1 << 10), (1 << 24, LZ77.PROBE_STRINGS)])
+def test_incompressible_probe_sampled(monkeypatch, size, strings):
+    """
+    Test that sampling the strings keeps large random data incompressible, and still finds a repeat in it.
+    """
+    monkeypatch.setattr(LZ77, "PROBE_STRINGS", strings)
+    noise = np.random.default_rng(3).integers(0, 256, size, dtype=np.uint8)
+    assert (noise.size - 8) // strings >= 1, "The strings should be sampled."
+    assert LZ77.incompressible(noise), f"Random data of {size} bytes should look incompressible."
+    assert not LZ77.incompressible(np.concatenate([noise, noise[:size // 20]])), "A repeat should make it compressible."
+
+@pytest.mark.parametrize("options", [{"block_size": 40000}, {"block_size": 40000, "prime": True},
+                                     {"workers": 2, "block_size": 40000}, {"varint": True}])
+def test_stored_blocks(txt_data, options):
+    """
+    Test that incompressible blocks are stored as is, between compressible ones, and decode back.
+    """
+    import random
+    rng = random.Random(10)
+    noise = bytes(rng.randrange(256) for _ in range(100000))
+    data = txt_data * 12 + noise + txt_data * 12
+    compressed = LZ77.compress(data, **options)
+    stored = LZ77.compress(noise, **options)
+    assert len(stored) < len(noise) + 200, f"Stored blocks of {len(stored)} bytes have too much overhead."
+    assert len(compressed) < len(noise) + 15000, f"Compressible blocks weren't compressed ({len(compressed)} bytes)."
+    assert LZ77.decompress(compressed, workers=options.get("workers", 1))[0] == data, "Mismatch with stored blocks."
+    assert LZ77.decompress_range(compressed, 90000, 110000) == data[90000:110000], "Range does not match."
+
+def test_choose_control_bytes(txt_data):
+    """
+    Test that the sampled estimate picks the best control byte length for inputs that want very different ones.
+    """
+    import random
+    rng = random.Random(11)
+    noise = bytes(rng.randrange(256) for _ in range(50000))
+    for data in (txt_data, bytes(30000), noise, (txt_data * 2)[:6000] * 12):
+        sizes = {cb: len(LZ77.compress(data, control_bytes=cb)) for cb in range(1, 8)}
+        chosen = LZ77.choose_control_bytes(data)
+        assert sizes[chosen] <= min(sizes.values()) * 1.2, f"Picked {chosen} control bytes, sizes were {sizes}."
+
+@pytest.mark.parametrize("options", [{}, {"block_size": 1000}, {"block_size": 1000, "prime": True}, {"varint": True},
+                                     {"dictionary": b"Enter DEMETRIUS and PHILO"}])
+def test_auto_control_bytes(txt_data, options):
+    """
+    Test that control_bytes="auto" round trips, with a control byte length per block for independent blocks.
+    """
+    data = txt_data + bytes(5000)
+    compressed = LZ77.compress(data, control_bytes="auto", **options)
+    assert LZ77.decompress(compressed, dictionary=options.get("dictionary"))[0] == data, "Mismatch with auto."
+    if options == {"block_size": 1000}:
+        offset, control_byte_lengths = 4, set()
+        while compressed[offset] != LZ77.BLOCK_END:
+            block_type, control_bytes, _, payload_length = LZ77.BLOCK_HEADER.unpack_from(compressed, offset)
+            if block_type != LZ77.BLOCK_STORED:
+                control_byte_lengths.add(control_bytes)
+            offset += LZ77.BLOCK_HEADER.size + payload_length
+        assert len(control_byte_lengths) > 1, "Text and zero blocks should pick different control byte lengths."
+
+def test_arg_parse_auto_control_bytes(tmp_path, txt_data):
+    """
+    Test -cb auto on the command line, and that invalid values are rejected.
+    """
+    source = tmp_path / "play.txt"
+    source.write_bytes(txt_data)
+    result = subprocess.run(["python", "LZ77.py", "-c", str(source), "-cb", "auto"], capture_output=True, text=True)
+    assert result.returncode == 0, f"Compression failed:\n{result.stdout}"
+    assert LZ77.decompress((tmp_path / "play.Z77").read_bytes())[0] == txt_data, "Mismatch with -cb auto."
+    result = subprocess.run(["python", "LZ77.py", "-c", str(source), "-cb", "many"], capture_output=True, text=True)
+    assert result.returncode != 0 and "auto" in result.stderr, "Invalid -cb should be rejected."
+
+@pytest.mark.parametrize("options", [{}, {"control_bytes": 1}, {"control_bytes": 8}, {"level": 2},
+                                     {"block_size": 4000, "prime": True}, {"workers": 2, "block_size": 4000},
+                                     {"control_bytes": "auto", "block_size": 4000}, {"long_range": True}])
+def test_huffman_roundtrip(txt_data, options):
+    """
+    Test that Huffman coded blocks round trip with every parsing level and block layout, and beat plain tokens.
+    """
+    data = txt_data * 4
+    compressed = LZ77.compress(data, huffman=True, **options)
+    plain = LZ77.compress(data, block_size=options.get("block_size", LZ77.BLOCK_SIZE),
+                          **{k: v for k, v in options.items() if k != "block_size"})
+    assert len(compressed) < 0.9 * len(plain), f"Huffman coded {len(compressed)} bytes, plain tokens {len(plain)}."
+    assert LZ77.decompress(compressed, workers=options.get("workers", 1))[0] == data, "Mismatch with Huffman coding."
+    assert LZ77.decompress_range(compressed, 1500, 2500) == data[1500:2500], "Range does not match."
+
+def test_huffman_skipped(txt_data):
+    """
+    Test that blocks Huffman coding can't shrink, or with too many control bytes for it, are written without it.
+    """
+    for data, control_bytes in ((txt_data, 9), (txt_data[:40], 3)):
+        compressed = LZ77.compress(data, control_bytes=control_bytes, huffman=True)
+        assert not LZ77.BLOCK_HEADER.unpack_from(compressed, 4)[0] & LZ77.BLOCK_HUFFMAN, "Block shouldn't be coded."
+        assert LZ77.decompress(compressed)[0] == data, "Mismatch without Huffman coding."
+
+def test_huffman_corrupt(txt_data):
+    """
+    Test that Huffman coded blocks with a damaged payload or too many control bytes are rejected.
+    """
+    compressed = LZ77.compress(txt_data * 4, huffman=True)
+    header = 4 + LZ77.BLOCK_HEADER.size
+    with pytest.raises(ValueError):
+        LZ77.decompress(compressed[:header + 300] + compressed[header + 301:])
+    wide = bytearray(compressed)
+    wide[5] = 9
+    with pytest.raises(ValueError, match="at most 8 control bytes"):
+        LZ77.decompress(bytes(wide))
+
+@pytest.mark.parametrize("options", [{}, {"dictionary": b"Enter DEMETRIUS and PHILO"}, {"block_size": 1000},
+                                     {"block_size": 1000, "prime": True}, {"varint": True, "block_size": 2000},
+                                     {"huffman": True, "block_size": 4000}, {"long_range": True, "block_size": 3000}])
+def test_checksum_roundtrip(txt_data, options):
+    """
+    Test that checksummed streams round trip and verify, with and without workers, and that verify reports streams
+    without checksums.
+    """
+    data = txt_data * 4
+    dictionary = options.get("dictionary")
+    compressed = LZ77.compress(data, checksum=True, **options)
+    assert compressed[3] & LZ77.FLAG_CHECKSUM, "Checksum flag missing from the frame header."
+    assert LZ77.decompress(compressed, dictionary=dictionary)[0] == data, "Mismatch with checksums."
+    assert LZ77.decompress_range(compressed, 1500, 2500, dictionary=dictionary) == data[1500:2500], "Range does not match."
+    for workers in (1, 2):
+        assert LZ77.verify(compressed, dictionary, workers) == (len(data), True), "Checksummed stream didn't verify."
+    assert LZ77.verify(LZ77.compress(data, **options), dictionary) == (len(data), False), "Expected no checksums."
+
+@pytest.mark.parametrize("options", [{}, {"block_size": 1000}, {"block_size": 1000, "prime": True}])
+def test_checksum_mismatch(txt_data, options):
+    """
+    Test that a literal byte changed in a checksummed stream, which still decodes, is caught by its checksum.
+    """
+    compressed = LZ77.compress(txt_data, checksum=True, **options)
+    position = compressed.index(b"Alexandria")
+    corrupt = compressed[:position] + b"b" + compressed[position + 1:]
+    with pytest.raises(ValueError, match="Checksum mismatch"):
+        LZ77.decompress(corrupt)
+    with pytest.raises(ValueError, match="Checksum mismatch"):
+        LZ77.verify(corrupt)
+
+def test_verify_stored_and_corrupt_blocks(txt_data):
+    """
+    Test that verify checks stored blocks against their checksums, and rejects truncated streams and damaged indexes.
+    """
+    data = np.random.default_rng(7).integers(0, 256, 5000, dtype=np.uint8).tobytes() + txt_data
+    compressed = LZ77.compress(data, block_size=2000, checksum=True)
+    assert LZ77.verify(compressed) == (len(data), True), "Stream with stored blocks didn't verify."
+    corrupt = bytearray(compressed)
+    corrupt[4 + LZ77.BLOCK_HEADER.size + 10] ^= 1 #inside the first, stored, block
+    with pytest.raises(ValueError, match="Checksum mismatch"):
+        LZ77.verify(bytes(corrupt))
+    with pytest.raises(ValueError):
+        LZ77.verify(compressed[:4 + LZ77.BLOCK_HEADER.size + 2002])
+    index = bytearray(compressed)
+    index[-LZ77.INDEX_FOOTER.size - 1] ^= 1 #raw length of the last block
+    with pytest.raises(ValueError, match="Block index"):
+        LZ77.verify(bytes(index))
+
+@pytest.mark.parametrize("options, version", [({"block_size": 1000}, 2), ({"block_size": 1000}, 1),
+                                              ({"long_range": True, "block_size": 4000}, 2)])
+def test_block_raw_length_corrupt(txt_data, options, version):
+    """
+    Test that a block header claiming 4 GiB of data is rejected before the output is allocated, against the block index
+    or, without one, against the most its payload could decode to.
+    """
+    compressed = bytearray(LZ77.compress(txt_data * 4, checksum=True, **options))
+    if version == 1:
+        index_offset, _, _ = LZ77.INDEX_FOOTER.unpack_from(compressed, len(compressed) - LZ77.INDEX_FOOTER.size)
+        compressed = compressed[:4 + index_offset]
+        compressed[2] = 1
+    compressed[6:10] = b"\xff\xff\xff\xff" #raw length of the first block
+    with pytest.raises(ValueError, match="Block"):
+        LZ77.verify(bytes(compressed))
+    with pytest.raises(ValueError, match="Block"):
+        LZ77.decompress(bytes(compressed))
+
+@pytest.mark.parametrize("version", [1, 2])
+def test_long_block_raw_length_corrupt(version):
+    """
+    Test that a long range block claiming 4 GiB of data is rejected before the output is allocated, its long range
+    matches are read to bound it even without a block index, while the uncorrupted stream still decodes.
+    """
+    region = bytes(range(256)) * 40
+    raw_data = region + bytes(5000) + region
+    compressed = bytearray(LZ77.compress(raw_data, control_bytes=2, long_range=True, block_size=8000))
+    if version == 1:
+        index_offset, _, _ = LZ77.INDEX_FOOTER.unpack_from(compressed, len(compressed) - LZ77.INDEX_FOOTER.size)
+        compressed = compressed[:4 + index_offset]
+        compressed[2] = 1
+    assert LZ77.decompress(bytes(compressed))[0] == raw_data, "Long range stream mismatch."
+
+    offset = 4
+    while compressed[offset] & ~LZ77.BLOCK_PRIMED != LZ77.BLOCK_LONG:
+        offset += LZ77.BLOCK_HEADER.size + LZ77.BLOCK_HEADER.unpack_from(compressed, offset)[3]
+    compressed[offset + 2:offset + 6] = b"\xff\xff\xff\xff" #raw length of the first long range block
+    tracemalloc.start()
+    try:
+        with pytest.raises(ValueError, match="Block"):
+            LZ77.verify(bytes(compressed))
+        with pytest.raises(ValueError, match="Block"):
+            LZ77.decompress(bytes(compressed))
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    assert peak < 1 << 26, f"{peak} bytes allocated for a corrupt block."
+
+def test_arg_parse_test(tmp_path, txt_data):
+    """
+    Test checking compressed files from the command line, a corrupt file fails the run.
+    """
+    (tmp_path / "good.Z77").write_bytes(LZ77.compress(txt_data, block_size=1000, checksum=True))
+    compressed = LZ77.compress(txt_data, checksum=True)
+    position = compressed.index(b"Alexandria")
+    (tmp_path / "bad.Z77").write_bytes(compressed[:position] + b"b" + compressed[position + 1:])
+    result = subprocess.run(["python", "LZ77.py", "-t", str(tmp_path / "good.Z77")], capture_output=True, text=True)
+    assert result.returncode == 0 and "checksums match" in result.stdout, f"Test failed:\n{result.stdout}"
+    result = subprocess.run(["python", "LZ77.py", "-t", str(tmp_path / "*.Z77")], capture_output=True, text=True)
+    assert result.returncode == 1, "Expected a failing exit status."
+    assert "bad.Z77: failed, Checksum mismatch" in result.stdout, f"Corrupt file not reported:\n{result.stdout}"
+
+def test_unknown_frame_flags(txt_data):
+    """
+    Test that frames with flags this reader doesn't know are rejected.
+    """
+    compressed = bytearray(LZ77.compress(txt_data, block_size=1000))
+    compressed[3] |= 0x40
+    with pytest.raises(ValueError, match="Unsupported frame flags"):
+        LZ77.decompress(bytes(compressed))
+
+def test_scan_across_chunks(txt_data, monkeypatch):
+    """
+    Test the first decoding pass when tokens straddle the chunks its control fields are read in.
+    """
+    monkeypatch.setattr(LZ77, "SCAN_CHUNK", 7)
+    compressed = LZ77.compress(txt_data)
+    decompressed, _ = LZ77.decompress(compressed)
+    assert decompressed == txt_data, "Decoding mismatch with tiny scan chunks."
+
+def test_decode_truncated_literal(txt_data):
+    """
+    Test that a token stream cut inside a literal run or control field is rejected.
+    """
+    stream = bytes([0xC7, 3 << 4]) + (10).to_bytes(3, "big") + b"abcde"
+    with pytest.raises(ValueError, match="Truncated literal run"):
+        LZ77.decompress(stream)
+    with pytest.raises(ValueError, match="Truncated control field"):
+        LZ77.decompress(bytes([0xC7, 3 << 4]) + (1).to_bytes(3, "big") + b"a\x80")
+
+@pytest.mark.parametrize("control_bytes", [8, 9, 15])
+def test_decode_oversized_literal(txt_data, control_bytes):
+    """
+    Test that a literal run claiming nearly 2 ** (8 * control_bytes - 1) bytes is rejected, in a bare token stream and in
+    a primed block, including control fields too wide for NumPy integers.
+    """
+    field = ((1 << (8 * control_bytes - 1)) - 1).to_bytes(control_bytes, "big")
+    with pytest.raises(ValueError, match="Truncated literal run"):
+        LZ77.decompress(bytes([0xC7, control_bytes << 4]) + field + b"abc")
+    compressed = bytearray(LZ77.compress(txt_data * 4, control_bytes=control_bytes, block_size=4000, prime=True))
+    assert LZ77.BLOCK_HEADER.unpack_from(compressed, 4)[0] & ~LZ77.BLOCK_PRIMED == LZ77.BLOCK_TOKENS, "Expected tokens."
+    header = 4 + LZ77.BLOCK_HEADER.size
+    compressed[header:header + control_bytes] = field
+    with pytest.raises(ValueError):
+        LZ77.decompress(bytes(compressed))
+
+def reference_serialize(lz):
+    """
+    Serializes lz.compressed_data one token at a time, the way the encoder originally did.
+    """
+    serialized = bytearray()
+    for token in lz.compressed_data:
+        if isinstance(token, MatchToken):
+            field = (1 << (lz.total_bits - 1)) | (token.length << lz.pointer_distance_bits) | token.dist
+            serialized.extend(field.to_bytes(lz.control_byte_length, "big"))
+        else:
+            serialized.extend(token.length.to_bytes(lz.control_byte_length, "big"))
+            serialized.extend(bytes(token.data))
+    return bytes(serialized)
+
+@pytest.mark.parametrize("control_bytes", [1, 2, 3, 8, 9, 15])
+def test_serialize_matches_reference(txt_data, control_bytes):
+    """
+    Test that the vectorized serializer writes the same bytes as serializing token by token.
+    """
+    lz = LZ77(txt_data, control_bytes=control_bytes)
+    lz.tokenize()
+    expected = reference_serialize(lz)
+    assert lz.encode()[2:] == expected, f"Serialized tokens differ for control_bytes={control_bytes}."
+
+def test_serialize_hand_built_tokens():
+    """
+    Test serializing tokens that weren't produced by tokenize, so the literal bytes come from the tokens themselves.
+    """
+    lz = LZ77(b"", control_bytes=2)
+    lz.compressed_data = [LiteralToken(4, list(b"cool")), MatchToken(4, 8), LiteralToken(1, list(b"!"))]
+    expected = reference_serialize(lz)
+    assert lz.encode()[2:] == expected, "Serialized hand built tokens differ."
+    decompressed, _ = LZ77.decompress(bytes([0xC7, 2 << 4]) + expected)
+    assert decompressed == b"coolcoolcool!", "Hand built tokens decoded wrong."
+
+def test_serialize_long_literal_runs():
+    """
+    Test that literal runs of LONG_RUN bytes and more, copied as slices of the input, serialize like short runs.
+    """
+    import random
+    rng = random.Random(12)
+    data = b"".join(bytes(rng.randrange(256) for _ in range(rng.choice([3, 63, 64, 200]))) + b"abcabcabc"
+                    for _ in range(40))
+    lz = LZ77(data, control_bytes=2)
+    lz.tokenize()
+    expected = reference_serialize(lz)
+    assert any(not token.type and token.length >= LZ77.LONG_RUN for token in lz.compressed_data), \
+        "Test data should produce long literal runs."
+    assert lz.encode()[2:] == expected, "Serialized long literal runs differ."
+
+def test_instances_keep_own_tokens(data_short, txt_data):
+    """
+    Test that tokenizing one instance doesn't touch another's tokens.
+    """
+    first = LZ77(data_short)
+    second = LZ77(txt_data)
+    first.tokenize()
+    tokens = list(first.compressed_data)
+    second.tokenize()
+    assert list(first.compressed_data) == tokens, "Tokenizing another instance changed this instance's tokens."
+    assert LZ77(b"").compressed_data == [], "A new instance should start without tokens."
+
+def test_compress_many(txt_data, data_short):
+    """
+    Test that compressing on a thread pool gives the same streams, in order, as compressing one by one.
+    """
+    items = [txt_data[k * 700:(k + 3) * 700] for k in range(8)] + [data_short, b""]
+    compressed = LZ77.compress_many(items, workers=4, control_bytes=2)
+    assert compressed == [LZ77.compress(item, control_bytes=2) for item in items], "compress_many output differs."
+    for item, stream in zip(items, compressed):
+        assert LZ77.decompress(stream)[0] == item, "compress_many stream doesn't round trip."
+
+def test_invalid_level(data_short):
+    """
+    Test that unknown parsing levels are rejected.
+    """
+    with pytest.raises(ValueError, match="level must be 0"):
+        LZ77.compress(data_short, level=3)
+
+def test_invalid_match_finder(data_short):
+    """
+    Test that unknown match finders are rejected.
+    """
+    with pytest.raises(ValueError, match="match_finder must be one of"):
+        LZ77.compress(data_short, match_finder="fastest")
+
 @pytest.mark.parametrize("control_bytes", [0, 16])
 def test_invalid_control_byte_length(data_short,control_bytes):
     """
@@ -383,4 +1155,72 @@ def test_arg_parse_compress(temp_file):
 
     # Cleanup
     os.remove(compressed_file)
-    os.remove(decompressed_file)
\ No newline at end of file
+    os.remove(decompressed_file)
+
+def test_arg_parse_jobs(tmp_path, txt_data):
+    """
+    Test compressing from the command line with parallel block compression.
+    """
+    source = tmp_path / "play.txt"
+    source.write_bytes(txt_data)
+    subprocess.run(["python", "LZ77.py", "-c", str(source), "-j", "2", "-bs", "1000"], check=True)
+
+    compressed_file = tmp_path / "play.Z77"
+    decompressed, extension = LZ77.decompress(compressed_file.read_bytes())
+    assert decompressed == txt_data, "Decompressed data does not match the original data."
+    assert extension == ".txt", "Extension lost in the framed format header."
+
+def test_arg_parse_batch(tmp_path, txt_data, pdf_data):
+    """
+    Test compressing and decompressing a directory tree in batch mode, skipping files that are already compressed.
+    """
+    (tmp_path / "sub").mkdir()
+    files = {tmp_path / "play.txt": txt_data, tmp_path / "sub" / "doc.pdf": pdf_data, tmp_path / "sub" / "short.md": b"abc"}
+    for path, data in files.items():
+        path.write_bytes(data)
+    (tmp_path / "old.Z77").write_bytes(LZ77.compress(b"already compressed"))
+
+    result = subprocess.run(["python", "LZ77.py", "-c", str(tmp_path), "-r", "-w", "2"], capture_output=True, text=True)
+    assert result.returncode == 0, f"Batch compression failed:\n{result.stdout}"
+    assert "3 files" in result.stdout and "1 skipped" in result.stdout, f"Unexpected summary:\n{result.stdout}"
+
+    for path in files:
+        path.unlink()
+    result = subprocess.run(["python", "LZ77.py", "-d", str(tmp_path / "**" / "*.Z77"), "-r"], capture_output=True, text=True)
+    assert result.returncode == 0, f"Batch decompression failed:\n{result.stdout}"
+    for path, data in files.items():
+        assert path.read_bytes() == data, f"{path.name} does not match the original data."
+    assert (tmp_path / "old").read_bytes() == b"already compressed", "Previously compressed file was not decompressed."
+
+def test_arg_parse_batch_failures(tmp_path):
+    """
+    Test that batch mode reports missing inputs and directories without -r, and exits with an error.
+    """
+    good = tmp_path / "good.txt"
+    good.write_bytes(b"Temporary file content")
+    (tmp_path / "dir").mkdir()
+    result = subprocess.run(["python", "LZ77.py", "-c", str(good), str(tmp_path / "missing.txt"), str(tmp_path / "dir")],
+                            capture_output=True, text=True)
+    assert result.returncode == 1, "Expected a failing exit status."
+    assert "missing.txt: failed" in result.stdout and "use -r" in result.stdout, f"Failures not reported:\n{result.stdout}"
+    assert (tmp_path / "good.Z77").exists(), "The valid input should still be compressed."
+
+def test_arg_parse_two_inputs(tmp_path, txt_data, pdf_data):
+    """
+    Test that two existing inputs, as a glob expands to, are processed as a batch instead of the second being
+    overwritten, while an existing compressed file named second is still taken as the output.
+    """
+    files = {tmp_path / "play.txt": txt_data, tmp_path / "doc.pdf": pdf_data}
+    for path, data in files.items():
+        path.write_bytes(data)
+    result = subprocess.run(["python", "LZ77.py", "-c", *map(str, files)], capture_output=True, text=True)
+    assert result.returncode == 0, f"Compressing two inputs failed:\n{result.stdout}"
+    for path, data in files.items():
+        assert path.read_bytes() == data, f"{path.name} was overwritten."
+        compressed = path.with_suffix(".Z77").read_bytes()
+        assert LZ77.decompress(compressed)[0] == data, f"{path.name} was not compressed."
+
+    output = tmp_path / "out.bin"
+    output.write_bytes(LZ77.compress(b"previous output"))
+    subprocess.run(["python", "LZ77.py", "-c", str(tmp_path / "play.txt"), str(output)], check=True)
+    assert LZ77.decompress(output.read_bytes())[0] == txt_data, "Existing compressed output was not replaced."
@@ -0,0 +1,144 @@
+import os
+import pytest
+import numpy as np
+from MatchFinder import HashChainMatchFinder, SuffixArrayMatchFinder, LongRangeMatchFinder, match_length, find_runs
+
+
+@pytest.fixture
+def txt_data():
+    """
+    Fixture to read a text file.
+    :return: loaded txt data
+    """
+    with open(os.path.join(os.path.dirname(__file__), "test_data", "Act1Scene1.txt"), "rb") as f:
+        return f.read()
+
+
+def brute_force_length(data, i, window_size, min_match, limit):
+    """
+    Reference longest match search, scanning every offset in the window like the original tokenizer.
+    """
+    best = 0
+    for candidate in range(max(0, i - window_size), i - 1):
+        cap = min(limit, i - 1 - candidate)
+        length = 0
+        while length < cap and data[candidate + length] == data[i + length]:
+            length += 1
+        best = max(best, length)
+    return best if best >= min_match else 0
+
+
+@pytest.mark.parametrize("length", [0, 1, 15, 16, 17, 100, 1000])
+def test_match_length(length):
+    """
+    Test bulk match extension at, below and across the chunk boundaries.
+    """
+    data = np.zeros(3000, dtype=np.uint8)
+    data[1000 + length] = 1 #first mismatch between data[0:] and data[1000:]
+    assert match_length(data, 0, 1000, 1500) == length, f"Expected a match length of {length}."
+    assert match_length(data, 0, 1000, 10) == min(length, 10), "Match length should stop at the limit."
+
+
+def test_hash_chain_finds_repeat():
+    """
+    Test that a simple repeat is found at the right distance.
+    """
+    data = np.frombuffer(b"abcdefgh--abcdefgh", dtype=np.uint8)
+    finder = HashChainMatchFinder(data, window_size=255, min_match=3, max_match=127)
+    length, dist = finder.find(10, 7)
+    assert length == 7, f"Expected a match length of 7, got {length}."
+    assert dist == 10, f"Expected a match distance of 10, got {dist}."
+
+
+def test_hash_chain_respects_window():
+    """
+    Test that matches further back than window_size are not reported.
+    """
+    data = np.frombuffer(b"abcdefgh" + b"-" * 40 + b"abcdefgh", dtype=np.uint8)
+    finder = HashChainMatchFinder(data, window_size=15, min_match=3, max_match=127)
+    assert finder.find(48, 7) == (0, 0), "Match outside of the window should not be found."
+
+
+@pytest.mark.parametrize("min_match", [2, 3, 4, 6])
+def test_hash_chain_matches_brute_force(txt_data, min_match):
+    """
+    Test that an unbounded chain walk finds the same match lengths as a full window scan.
+    """
+    data = np.frombuffer(txt_data[:1500], dtype=np.uint8)
+    finder = HashChainMatchFinder(data, window_size=511, min_match=min_match, max_match=63, chain_depth=10**6)
+    for i in range(0, data.size - 1, 7):
+        limit = data.size - i - 1
+        length, dist = finder.find(i, limit)
+        assert length == brute_force_length(txt_data, i, 511, min_match, min(limit, 63)), f"Length mismatch at {i}."
+        if length:
+            assert txt_data[i - dist:i - dist + length] == txt_data[i:i + length], f"Bad match reported at {i}."
+
+
+def test_invalid_chain_depth():
+    """
+    Test that a chain depth below 1 is rejected.
+    """
+    with pytest.raises(ValueError, match="chain_depth must be at least 1."):
+        HashChainMatchFinder(np.zeros(4, dtype=np.uint8), 15, 2, 7, chain_depth=0)
+
+
+def test_suffix_array_sorted(txt_data):
+    """
+    Test that the suffix array lists the suffixes in sorted order.
+    """
+    data = txt_data[:400]
+    sa = SuffixArrayMatchFinder.suffix_array(np.frombuffer(data, dtype=np.uint8))
+    suffixes = [data[p:] for p in sa]
+    assert suffixes == sorted(suffixes), "Suffix array is not in sorted order."
+
+
+@pytest.mark.parametrize("block_size", [64, 1 << 18])
+def test_suffix_array_matches_brute_force(txt_data, block_size):
+    """
+    Test that the suffix array finder always finds the longest match in the window, across block boundaries too.
+    """
+    data = np.frombuffer(txt_data[:1500], dtype=np.uint8)
+    finder = SuffixArrayMatchFinder(data, window_size=511, min_match=3, max_match=63, block_size=block_size)
+    for i in range(data.size - 1):
+        limit = data.size - i - 1
+        length, dist = finder.find(i, limit)
+        assert length == brute_force_length(txt_data, i, 511, 3, min(limit, 63)), f"Length mismatch at {i}."
+        if length:
+            assert txt_data[i - dist:i - dist + length] == txt_data[i:i + length], f"Bad match reported at {i}."
+
+
+def test_suffix_array_run():
+    """
+    Test the suffix array finder on a long run of one byte, where most neighbours are unusable.
+    """
+    data = np.zeros(5000, dtype=np.uint8)
+    finder = SuffixArrayMatchFinder(data, window_size=1023, min_match=3, max_match=127)
+    length, dist = finder.find(2000, 127)
+    assert length == 127, f"Expected a full length match, got {length}."
+    assert dist >= 128, f"Match at distance {dist} would overlap the coding position."
+
+
+def test_long_range_finds_shifted_repeat():
+    """
+    Test that a repeat far apart, shifted against the chunking grid, is found in full and nothing else is.
+    """
+    rng = np.random.default_rng(3)
+    region = rng.integers(0, 256, 50000, dtype=np.uint8)
+    data = np.concatenate([rng.integers(0, 256, 1234, dtype=np.uint8), region,
+                           rng.integers(0, 256, 500000, dtype=np.uint8), region, [1, 2, 3]]).astype(np.uint8)
+    matches = LongRangeMatchFinder(data).find()
+    assert matches == [(1234 + 50000 + 500000, 50000, 550000)], f"Unexpected repeats {matches}."
+    with pytest.raises(ValueError):
+        LongRangeMatchFinder(data, average_chunk=1000)
+
+
+def test_find_runs():
+    """
+    Test that runs of a byte and of short patterns are found in full, with the shortest period where they overlap.
+    """
+    data = np.frombuffer(b"head" + bytes(100) + b"ab" * 40 + b"mid" + b"wxyz" * 20 + b"x" * 10 + b"tail", dtype=np.uint8)
+    runs = find_runs(data, 32, 8)
+    assert runs == [(5, 104, 1), (106, 184, 2), (191, 267, 4)], f"Unexpected runs {runs}."
+    assert find_runs(data, 32, 8, start=90) == runs[1:], "Runs shorter than the minimum after start should be dropped."
+    assert find_runs(data, 32, 2) == runs[:2], "Patterns longer than the period limit aren't runs."
+    assert find_runs(data[:1], 32, 8) == [], "Data shorter than a period has no runs."
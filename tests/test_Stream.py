@@ -0,0 +1,207 @@
+import os
+import subprocess
+import sys
+import pytest
+from LZ77 import LZ77
+from Stream import StreamCompressor, StreamDecompressor
+
+
+@pytest.fixture
+def txt_data():
+    """
+    Fixture to read a text file.
+    :return: loaded txt data
+    """
+    with open(os.path.join(os.path.dirname(__file__), "test_data", "Act1Scene1.txt"), "rb") as f:
+        return f.read()
+
+
+def chunks(data, size):
+    """
+    Splits data into chunks of size bytes.
+    """
+    return [data[k:k + size] for k in range(0, len(data), size)]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 333, 1000, 10**6])
+def test_stream_compress_matches_one_shot(txt_data, chunk_size):
+    """
+    Test that streaming compression gives the same frame as compressing everything at once, whatever the chunking.
+    """
+    compressor = StreamCompressor(block_size=1000, extension=".txt")
+    compressed = b"".join(compressor.write(chunk) for chunk in chunks(txt_data, chunk_size)) + compressor.close()
+    expected = LZ77.compress(txt_data, extension=".txt", block_size=1000, prime=True)
+    assert compressed == expected, f"Streamed frame differs from the one-shot frame for chunk_size={chunk_size}."
+
+
+@pytest.mark.parametrize("prime", [False, True])
+@pytest.mark.parametrize("chunk_size", [1, 77, 10**6])
+def test_stream_roundtrip(txt_data, prime, chunk_size):
+    """
+    Test feeding a frame to the decompressor in chunks.
+    """
+    compressed = LZ77.compress(txt_data, extension=".txt", block_size=1000, prime=prime)
+    decompressor = StreamDecompressor()
+    decompressed = b"".join(decompressor.write(chunk) for chunk in chunks(compressed, chunk_size)) + decompressor.close()
+    assert decompressed == txt_data, f"Stream roundtrip mismatch for prime={prime}, chunk_size={chunk_size}."
+    assert decompressor.extension == ".txt", "Extension not read from the header."
+
+
+def test_stream_flush(txt_data):
+    """
+    Test that everything written before a flush can be decoded right away.
+    """
+    compressor = StreamCompressor(block_size=1000)
+    decompressor = StreamDecompressor()
+    compressed = compressor.write(txt_data[:1500]) + compressor.flush()
+    assert decompressor.write(compressed) == txt_data[:1500], "Flushed data could not be decoded."
+    compressed = compressor.write(txt_data[1500:]) + compressor.close()
+    assert decompressor.write(compressed) + decompressor.close() == txt_data[1500:], "Data after the flush mismatch."
+
+
+def test_stream_empty():
+    """
+    Test streaming nothing through.
+    """
+    compressor = StreamCompressor()
+    decompressor = StreamDecompressor()
+    assert decompressor.write(compressor.close()) + decompressor.close() == b"", "Empty stream roundtrip failed."
+
+
+def test_stream_legacy(txt_data):
+    """
+    Test that streams with the 2-byte header are decoded by close.
+    """
+    compressed = LZ77.compress(txt_data[:2000])
+    decompressor = StreamDecompressor()
+    decompressed = b"".join(decompressor.write(chunk) for chunk in chunks(compressed, 100)) + decompressor.close()
+    assert decompressed == txt_data[:2000], "2-byte header stream mismatch."
+
+
+def test_stream_truncated(txt_data):
+    """
+    Test that a frame missing its end is rejected by close.
+    """
+    compressed = LZ77.compress(txt_data, block_size=1000)
+    decompressor = StreamDecompressor()
+    decompressor.write(compressed[:len(compressed) // 2])
+    with pytest.raises(ValueError, match="without an end block"):
+        decompressor.close()
+
+
+def test_stream_write_after_close():
+    """
+    Test that a closed compressor can't be written to.
+    """
+    compressor = StreamCompressor()
+    compressor.close()
+    with pytest.raises(ValueError, match="Compressor is closed."):
+        compressor.write(b"more data")
+
+
+def test_stream_pipe(txt_data):
+    """
+    Test compressing from stdin to stdout and back on the command line.
+    """
+    script = os.path.join(os.path.dirname(os.path.dirname(__file__)), "LZ77.py")
+    compressed = subprocess.run([sys.executable, script, "-c", "-", "-bs", "1000"], input=txt_data,
+                                capture_output=True, check=True).stdout
+    decompressed = subprocess.run([sys.executable, script, "-d", "-"], input=compressed,
+                                  capture_output=True, check=True).stdout
+    assert decompressed == txt_data, "Data piped through stdin/stdout mismatch."
+
+
+@pytest.mark.parametrize("option", [["--long"], ["--varint"], ["--huffman"], ["-j", "2"]])
+def test_stream_unsupported_options(option):
+    """
+    Test that options the stream compressor doesn't support are refused on the command line rather than ignored.
+    """
+    script = os.path.join(os.path.dirname(os.path.dirname(__file__)), "LZ77.py")
+    result = subprocess.run([sys.executable, script, "-c", "-", *option], input=b"abc" * 100, capture_output=True)
+    assert result.returncode == 1, f"Streaming with {option[0]} should fail."
+    assert f"{option[0]} can't be used when streaming" in result.stdout.decode(), "Missing error message."
+
+
+@pytest.mark.parametrize("prime", [False, True])
+@pytest.mark.parametrize("block_size", [None, 1000])
+def test_stream_dictionary(txt_data, prime, block_size):
+    """
+    Test streaming with a preset dictionary, the frame matches the one-shot frame and decodes a chunk at a time.
+    """
+    dictionary = txt_data[-2000:]
+    if block_size is None:
+        # Frames holding a single token stream, from LZ77.compress without blocks, are decoded by close
+        compressed = LZ77.compress(txt_data, dictionary=dictionary)
+    else:
+        compressor = StreamCompressor(block_size=block_size, prime=prime, dictionary=dictionary)
+        compressed = b"".join(compressor.write(chunk) for chunk in chunks(txt_data, 777)) + compressor.close()
+        expected = LZ77.compress(txt_data, block_size=block_size, prime=prime, dictionary=dictionary)
+        assert compressed == expected, "Streamed frame differs from the one-shot frame."
+
+    decompressor = StreamDecompressor(dictionary=dictionary)
+    decompressed = b"".join(decompressor.write(chunk) for chunk in chunks(compressed, 5)) + decompressor.close()
+    assert decompressed == txt_data, "Streamed decompression with a dictionary mismatch."
+
+
+def test_stream_long_range_rejected():
+    """
+    Test that a stream with long range matches, which reach back past any bounded window, is refused.
+    """
+    region = bytes(range(256)) * 40
+    compressed = LZ77.compress(region + bytes(5000) + region, control_bytes=2, long_range=True)
+    decompressor = StreamDecompressor()
+    with pytest.raises(ValueError, match="Long range"):
+        decompressor.write(compressed)
+
+
+def test_stream_varint(txt_data):
+    """
+    Test that a primed varint token stream decodes chunk by chunk.
+    """
+    compressed = LZ77.compress(txt_data * 3, varint=True, prime=True, block_size=2000)
+    decompressor = StreamDecompressor()
+    decompressed = b"".join(decompressor.write(compressed[k:k + 100]) for k in range(0, len(compressed), 100))
+    assert decompressed + decompressor.close() == txt_data * 3, "Streamed varint data does not match."
+
+
+def test_stream_huffman(txt_data):
+    """
+    Test that Huffman coded blocks decode chunk by chunk.
+    """
+    compressed = LZ77.compress(txt_data * 3, huffman=True, prime=True, block_size=4000)
+    decompressor = StreamDecompressor()
+    decompressed = b"".join(decompressor.write(compressed[k:k + 100]) for k in range(0, len(compressed), 100))
+    assert decompressed + decompressor.close() == txt_data * 3, "Streamed Huffman coded data does not match."
+
+
+def test_stream_checksum(txt_data):
+    """
+    Test that a checksummed stream matches one-shot compression, decodes chunk by chunk and catches a changed byte.
+    """
+    compressor = StreamCompressor(block_size=1000, checksum=True)
+    compressed = b"".join(compressor.write(txt_data[k:k + 700]) for k in range(0, len(txt_data), 700)) + compressor.close()
+    assert compressed == LZ77.compress(txt_data, block_size=1000, prime=True, checksum=True), \
+        "Stream should match one-shot compression."
+    decompressor = StreamDecompressor()
+    decompressed = b"".join(decompressor.write(compressed[k:k + 100]) for k in range(0, len(compressed), 100))
+    assert decompressed + decompressor.close() == txt_data, "Streamed checksummed data does not match."
+
+    position = compressed.index(b"Alexandria")
+    with pytest.raises(ValueError, match="Checksum mismatch"):
+        StreamDecompressor().write(compressed[:position] + b"a" + compressed[position + 1:])
+    single = LZ77.compress(txt_data, checksum=True) #one token stream, its checksum follows the control byte length
+    decompressor = StreamDecompressor()
+    assert decompressor.write(single[:7]) + decompressor.write(single[7:]) + decompressor.close() == txt_data, \
+        "Mismatch with a checksummed token stream."
+
+
+def test_stream_auto_control_bytes(txt_data):
+    """
+    Test that a stream compressed with control_bytes="auto" matches one-shot compression and round trips.
+    """
+    compressor = StreamCompressor(control_bytes="auto", block_size=1000)
+    compressed = compressor.write(txt_data) + compressor.close()
+    assert compressed == LZ77.compress(txt_data, control_bytes=LZ77.choose_control_bytes(txt_data[:1000]),
+                                       block_size=1000, prime=True), "Stream should match one-shot compression."
+    decompressor = StreamDecompressor()
+    assert decompressor.write(compressed) + decompressor.close() == txt_data, "Mismatch with auto control bytes."